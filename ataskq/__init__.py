@@ -4,7 +4,7 @@ except Exception:
     __version__ = "0.0.0"
     __build__ = "dev"
 
-__schema_version__ = 5
+__schema_version__ = 12
 
 from .taskq import TaskQ, targs
-from .models import Job, Task, EStatus
+from .models import Job, Task, StateKWArg, EStatus
@@ -2,6 +2,7 @@ import argparse
 import logging
 
 from ataskq import TaskQ
+from ataskq.handler import from_config, DBHandler
 from ataskq.config.config import CONFIG_SETS, DEFAULT_CONFIG
 
 
@@ -55,6 +56,28 @@ def main(args=None):
     run_p.add_argument(
         "--concurrency", "-cn", type=parse_number, help="number of task execution processes to run in parallel"
     )
+    run_p.add_argument(
+        "--executor",
+        "-e",
+        choices=["process", "thread", "async", "dispatch"],
+        help="tasks executor, defaults to 'run.executor' config",
+    )
+    run_p.add_argument(
+        "--preload",
+        "-p",
+        nargs="+",
+        help="modules / entrypoints to import before forking workers, defaults to 'run.preload' config",
+    )
+
+    rebuild_counters_p = subparsers.add_parser(
+        "rebuild-counters", help="rebuild tasks status counters from tasks table (fix counters drift)"
+    )
+    rebuild_counters_p.add_argument(
+        "--config",
+        "-c",
+        help=f"config preset {list(CONFIG_SETS.keys())} or path to file",
+        default=DEFAULT_CONFIG,
+    )
 
     args = parser.parse_args(args=args)
 
@@ -63,7 +86,14 @@ def main(args=None):
         if args.level is not None and len(args.level) == 1:
             args.level = args.level[0]
         init_logger()
-        TaskQ(config=args.config, job_id=args.job_id).run(level=args.level, concurrency=args.concurrency)
+        TaskQ(config=args.config, job_id=args.job_id).run(
+            level=args.level, concurrency=args.concurrency, executor=args.executor, preload=args.preload
+        )
+    elif args.command == "rebuild-counters":
+        init_logger()
+        handler = from_config(args.config)
+        assert isinstance(handler, DBHandler), "rebuild counters requires a db connection (sqlite / postgresql)"
+        handler.rebuild_task_counters()
 
 
 if __name__ == "__main__":
@@ -5,12 +5,25 @@ CONFIG_FORMAT = {
     "run": {
         "wait_timeout": float,
         "pull_interval": float,
+        "prefetch": int,
+        "executor": str,
+        "max_tasks_per_child": int,
+        "max_rss_per_child": float,
+        "preload": str,
+        "gc_freeze": bool,
+        "state_kwargs_cache_size": int,
         "fail_pulse_timeout": bool,
         "raise_exception": bool,
         "run_forever": bool,
     },
     "handler": {
         "db_init": bool,
+        "skip_locked": bool,
+        "claim_policy": str,
+        "notify": bool,
+        "long_poll_timeout": float,
+        "pool_size": int,
+        "bulk_chunk_size": int,
     },
     "db": {
         "max_jobs": int,
@@ -25,6 +38,19 @@ CONFIG_FORMAT = {
     "api": {
         "limit": int,
     },
+    "rest": {
+        "pool_size": int,
+        "retries": int,
+        "backoff_factor": float,
+        "connect_timeout": float,
+        "read_timeout": float,
+        "wire_format": str,
+    },
+    "server": {
+        "claim_workers": int,
+        "query_workers": int,
+        "max_pending": int,
+    },
 }
 
 CONFIG_SETS = {
@@ -33,12 +59,25 @@ CONFIG_SETS = {
         "run": {
             "wait_timeout": None,
             "pull_interval": 15,
+            "prefetch": 1,
+            "executor": "process",
+            "max_tasks_per_child": None,
+            "max_rss_per_child": None,
+            "preload": None,
+            "gc_freeze": False,
+            "state_kwargs_cache_size": 8,
             "fail_pulse_timeout": True,
             "raise_exception": False,
             "run_forever": False,
         },
         "handler": {
             "db_init": True,
+            "skip_locked": True,
+            "claim_policy": "fifo",
+            "notify": True,
+            "long_poll_timeout": 30,
+            "pool_size": 4,
+            "bulk_chunk_size": 1000,
         },
         "db": {
             "max_jobs": None,
@@ -53,12 +92,28 @@ CONFIG_SETS = {
         "api": {
             "limit": 100,
         },
+        "rest": {
+            "pool_size": 4,
+            "retries": 3,
+            "backoff_factor": 0.5,
+            "connect_timeout": 10,
+            "read_timeout": 60,
+            "wire_format": "json",
+        },
+        "server": {
+            "claim_workers": 4,
+            "query_workers": 4,
+            "max_pending": 1000,
+        },
     },
     "test": {
         "connection": "sqlite://{tmp_path}/ataskq.db.sqlite3",
         "run": {
             "pull_interval": 0.3,
         },
+        "background": {
+            "pulse_timeout_interval": 0.3,
+        },
     },
     "client": {
         "connection": "http://localhost:8080",
@@ -75,6 +130,8 @@ CONFIG_SETS = {
         },
         "handler": {
             "db_init": False,
+            # claim_workers + query_workers
+            "pool_size": 8,
         },
     },
 }
@@ -1,17 +1,192 @@
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Callable, Union, Tuple
 from abc import abstractmethod
 from datetime import datetime
-
-from .handler import Handler, get_query_kwargs
+from contextlib import contextmanager
+import threading
+import heapq
+import socket
+import time
+import os
+
+from .handler import Handler, get_query_kwargs, query_fields, decode_cursor
 from ..imodel import IModel
 from .. import __schema_version__
 
+# oldest schema version supported for migration (base schema created by init_db)
+__BASE_SCHEMA_VERSION__ = 5
+
+# lease name of the pulse timeout tasks sweep
+__PULSE_TIMEOUT_LEASE__ = "pulse_timeout"
+
+# tasks count per task_counters key
+__COUNT_TASKS_QUERY__ = (
+    "SELECT job_id, COALESCE(level, 0), COALESCE(name, ''), status, COUNT(*) FROM tasks "
+    "WHERE status IS NOT NULL GROUP BY job_id, COALESCE(level, 0), COALESCE(name, ''), status"
+)
+
+
+def _priority_claims(frontier: List[dict], num_tasks: int):
+    """strict priority, highest priority jobs first (job id order within priority)"""
+    frontier = sorted(frontier, key=lambda job: (-(job["priority"] or 0), job["job_id"]))
+    for job in frontier:
+        if num_tasks <= 0:
+            break
+        count = min(job["pending"], num_tasks)
+        num_tasks -= count
+        yield job, count
+
+
+def _fair_claims(frontier: List[dict], num_tasks: int):
+    """weighted fair share, each claim goes to the job with least running tasks per weight (`1 + priority`)"""
+    heap = []
+    for i, job in enumerate(frontier):
+        weight = 1 + max(job["priority"] or 0, 0)
+        heapq.heappush(heap, (job["running"] / weight, job["job_id"], i, weight))
+
+    counts = dict()
+    while heap and num_tasks > 0:
+        share, job_id, i, weight = heapq.heappop(heap)
+        counts[i] = counts.get(i, 0) + 1
+        num_tasks -= 1
+        if counts[i] < frontier[i]["pending"]:
+            heapq.heappush(heap, ((frontier[i]["running"] + counts[i]) / weight, job_id, i, weight))
+
+    for i, count in counts.items():
+        yield frontier[i], count
+
+
+# claim policies, allocate number of tasks to claim per claimable job (fifo is a single claim query)
+__CLAIM_POLICIES__ = {"fifo": None, "priority": _priority_claims, "fair": _fair_claims}
+
+# connections inherited from parent process on fork. kept referenced and never closed
+# since closing them in the child process would close the parent process connections.
+__FORK_INHERITED_CONNECTIONS__ = []
+
+
+class ConnectionPool:
+    """Thread safe db connections pool.
+
+    Connections are reused across transactions of the same process, at most `size` connections are opened
+    (threads wait for a free connection). On fork the pool is reset so connections are never shared between processes.
+    size 0 disables pooling (connect per transaction).
+    """
+
+    def __init__(self, connect: Callable, size: int = 1) -> None:
+        self._connect = connect
+        self._size = size
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._idle = []
+        self._in_use = 0
+
+        # stats
+        self._created = 0
+        self._checkouts = 0
+        self._waits = 0
+
+    def __getstate__(self):
+        # connections and locks are process specific
+        state = self.__dict__.copy()
+        for k in ["_cond", "_idle"]:
+            state.pop(k)
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            __FORK_INHERITED_CONNECTIONS__.extend(self._idle)
+            self._reset()
+
+    @property
+    def size(self):
+        return self._size
+
+    def stats(self) -> dict:
+        self._check_fork()
+        with self._cond:
+            return dict(
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._in_use,
+                created=self._created,
+                checkouts=self._checkouts,
+                waits=self._waits,
+            )
+
+    def checkout(self):
+        self._check_fork()
+        with self._cond:
+            self._checkouts += 1
+            if self._size > 0 and not self._idle and self._in_use >= self._size:
+                self._waits += 1
+                self._cond.wait_for(lambda: self._idle or self._in_use < self._size)
+
+            self._in_use += 1
+            if self._idle:
+                return self._idle.pop()
+
+            self._created += 1
+
+        try:
+            return self._connect()
+        except Exception:
+            self._release()
+            raise
+
+    def checkin(self, conn, discard=False):
+        if self._pid != os.getpid():
+            # connection checked out before fork
+            return
+
+        if discard or self._size == 0 or getattr(conn, "closed", False):
+            conn.close()
+            self._release()
+            return
+
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def _release(self):
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.checkout()
+        try:
+            yield conn
+        except BaseException:
+            # connection state is unknown after failure, don't reuse it
+            self.checkin(conn, discard=True)
+            raise
+
+        self.checkin(conn)
+
+    def close(self):
+        self._check_fork()
+        with self._cond:
+            idle = self._idle
+            self._idle = []
+
+        for conn in idle:
+            conn.close()
+
 
 def transaction_decorator(exclusive=False):
     def decorator(func):
         def wrapper(self, *args, **kwargs):
-            with self.connect() as conn:
+            with self.pool.connection() as conn:
                 c = conn.cursor()
                 try:
                     self.transaction_start(c, exclusive)
@@ -22,11 +197,13 @@ def transaction_decorator(exclusive=False):
                         self._transaction_end_cbk()
 
                     self.transaction_finalize(conn, exclusive)
+                    conn.commit()
                 except Exception as e:
                     self.error(f"Failed to execute transaction '{type(e)}:{e}'. Rolling back")
                     conn.rollback()
                     raise e
-            conn.close()
+                finally:
+                    c.close()
 
             return ret
 
@@ -35,6 +212,24 @@ def transaction_decorator(exclusive=False):
     return decorator
 
 
+def bulk_chunks(model_cls: IModel, ikwargs: List[dict], chunk_size: int):
+    """group ikwargs with same keys to chunks of at most chunk_size rows.
+
+    yields (keys, indices, rows) where indices are the rows indices in ikwargs.
+    """
+    groups = dict()
+    for i, v in enumerate(ikwargs):
+        d = {k: v for k, v in v.items() if model_cls.id_key() not in k}
+        keys = tuple(d.keys())
+        indices, rows = groups.setdefault(keys, ([], []))
+        indices.append(i)
+        rows.append(list(d.values()))
+
+    for keys, (indices, rows) in groups.items():
+        for start in range(0, len(rows), chunk_size):
+            yield list(keys), indices[start : start + chunk_size], rows[start : start + chunk_size]
+
+
 def _field_with_order(f):
     if isinstance(f, (tuple, list)):
         if len(f) == 1:
@@ -58,6 +253,10 @@ def order_query(order_by):
     return order_by
 
 
+def and_where(_where: Union[str, None], where: str):
+    return where if _where is None else f"({_where}) AND {where}"
+
+
 def expand_query_str(query_str, _where=None, _group_by=None, _order_by=None, _limit=None, _offset=None):
     if _where is not None:
         query_str += f" WHERE {_where}"
@@ -84,9 +283,17 @@ class DBHandler(Handler):
         self._transaction_end_cbk = None  # debug attribute to test exclusive mutal exclusion
 
         super().__init__(**kwargs)
+        self._pool = ConnectionPool(self.connect, size=self.config["handler"]["pool_size"])
         if self.config["handler"]["db_init"]:
             self.init_db()
 
+    @property
+    def pool(self) -> ConnectionPool:
+        return self._pool
+
+    def close(self):
+        self._pool.close()
+
     @property
     def db_path(self):
         raise Exception(f"'{self.__class__.__name__}' db doesn't support db path property'")
@@ -141,11 +348,26 @@ class DBHandler(Handler):
     def timestamp(self, ts):
         pass
 
+    @property
+    @abstractmethod
+    def current_timestamp(self):
+        """db current (local) time expression"""
+        pass
+
+    @abstractmethod
+    def current_timestamp_offset(self, seconds: float):
+        """db current (local) time + seconds expression"""
+        pass
+
     @property
     @abstractmethod
     def for_update(self):
         pass
 
+    @property
+    def for_share(self):
+        return ""
+
     @abstractmethod
     def connect(self):
         pass
@@ -162,19 +384,34 @@ class DBHandler(Handler):
         return model_id
 
     @transaction_decorator()
-    def _create_bulk(self, c, model_cls: IModel, ikwargs: List[dict]) -> List[int]:
-        # todo: consolidate all ikwargs with same keys to single insert command
-        model_ids = []
-        for v in ikwargs:
-            d = {k: v for k, v in v.items() if model_cls.id_key() not in k}
-            keys = list(d.keys())
-            values = list(d.values())
-            c.execute(
-                f'INSERT INTO {model_cls.table_key()} ({", ".join(keys)}) VALUES ({", ".join([self.format_symbol] * len(keys))}) RETURNING {model_cls.id_key()}',
-                values,
+    def _create_bulk(self, c, model_cls: IModel, ikwargs: List[dict], deps: List[tuple] = None) -> List[int]:
+        model_ids = [None] * len(ikwargs)
+        for keys, indices, rows in bulk_chunks(model_cls, ikwargs, self.config["handler"]["bulk_chunk_size"]):
+            chunk_ids = self._insert_rows(c, model_cls, keys, rows)
+            for i, model_id in zip(indices, chunk_ids):
+                model_ids[i] = model_id
+
+        # created tasks are not claimable (blockers) without their dependencies, added in the same transaction
+        if deps:
+            self._add_task_deps(
+                c,
+                [
+                    (model_ids[i], model_ids[parent_index] if parent_id is None else parent_id)
+                    for i, parent_id, parent_index in deps
+                ],
             )
-            model_id = c.fetchone()[0]
-            model_ids.append(model_id)
+
+        return model_ids
+
+    def _insert_rows(self, c, model_cls: IModel, keys: List[str], rows: List[list]) -> List[int]:
+        # multi-row insert
+        row_symbols = f'({", ".join([self.format_symbol] * len(keys))})'
+        c.execute(
+            f'INSERT INTO {model_cls.table_key()} ({", ".join(keys)}) VALUES {", ".join([row_symbols] * len(rows))} RETURNING {model_cls.id_key()}',
+            [v for row in rows for v in row],
+        )
+        # ids are assigned in rows order
+        model_ids = sorted([row[0] for row in c.fetchall()])
 
         return model_ids
 
@@ -187,6 +424,22 @@ class DBHandler(Handler):
         values = list(ikwargs.values())
         c.execute(f"UPDATE {model_cls.table_key()} SET {insert} WHERE {model_cls.id_key()} = {model_id};", values)
 
+    @transaction_decorator()
+    def _update_bulk(self, c, model_cls: IModel, ikwargs: List[dict]):
+        # group items by updated fields, one statement per group
+        groups = dict()
+        for kw in ikwargs:
+            keys = tuple(k for k in kw.keys() if k != model_cls.id_key())
+            if keys:
+                groups.setdefault(keys, []).append(kw)
+
+        for keys, items in groups.items():
+            insert = ", ".join([f"{k} = {self.format_symbol}" for k in keys])
+            c.executemany(
+                f"UPDATE {model_cls.table_key()} SET {insert} WHERE {model_cls.id_key()} = {self.format_symbol};",
+                [[kw[k] for k in keys] + [kw[model_cls.id_key()]] for kw in items],
+            )
+
     @transaction_decorator()
     def update_all(self, c, model_cls: IModel, where: str = None, **ikwargs):
         if len(ikwargs) == 0:
@@ -220,21 +473,29 @@ class DBHandler(Handler):
     def delete(self, c, model_cls: IModel, model_id: int):
         c.execute(f"DELETE FROM {model_cls.table_key()} WHERE {model_cls.id_key()} = {model_id}")
 
+    def schema_lock(self, c):
+        """lock schema changes for the current transaction (in addition to exclusive transaction)"""
+        pass
+
     @transaction_decorator(exclusive=True)
     def init_db(self, c):
         from ..models import EStatus
 
+        self.schema_lock(c)
+
         # Create schema version table if not exists
         c.execute("CREATE TABLE IF NOT EXISTS schema_version (" "version INTEGER PRIMARY KEY" ")")
         c.execute("SELECT * FROM schema_version")
         current_schema_version = c.fetchone()
         if current_schema_version is None:
-            c.execute(f"INSERT INTO schema_version (version) VALUES ({__schema_version__})")
+            # new db, create base schema and migrate to latest version
+            current_schema_version = __BASE_SCHEMA_VERSION__
+            c.execute(f"INSERT INTO schema_version (version) VALUES ({current_schema_version})")
         else:
             current_schema_version = current_schema_version[0]
             assert (
-                current_schema_version == __schema_version__
-            ), f"Schema version mismatch, current schema version is {current_schema_version} while code schema version is {__schema_version__}"
+                __BASE_SCHEMA_VERSION__ <= current_schema_version <= __schema_version__
+            ), f"Schema version mismatch, current schema version is {current_schema_version} while code schema version is {__schema_version__} (migration supported from version {__BASE_SCHEMA_VERSION__})"
 
         # Create jobs table if not exists
         c.execute(
@@ -268,6 +529,147 @@ class DBHandler(Handler):
             ")"
         )
 
+        # migrate schema from current to latest version
+        for version in range(current_schema_version + 1, __schema_version__ + 1):
+            self.info(f"Migrating db schema version {version - 1} -> {version}")
+            getattr(self, f"migrate_v{version}")(c)
+            c.execute(f"UPDATE schema_version SET version = {version}")
+
+    ##############
+    # Migrations #
+    ##############
+    # each migrate_v<version> upgrades the schema from <version - 1> to <version>.
+    # new db is created with base schema and migrated to latest version.
+
+    def migrate_v6(self, c):
+        from ..models import EStatus
+
+        # claim, level barrier and pending tasks count queries
+        c.execute("CREATE INDEX IF NOT EXISTS ix_tasks_status_job_level ON tasks (status, job_id, level, task_id)")
+        # job tasks, tasks status queries
+        c.execute("CREATE INDEX IF NOT EXISTS ix_tasks_job_level ON tasks (job_id, level)")
+        # pulse timeout query
+        c.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_tasks_running_pulse_time ON tasks (pulse_time) WHERE status = '{EStatus.RUNNING}'"
+        )
+
+    def migrate_v7(self, c):
+        # cluster wide leases, e.g. pulse timeout sweep runs at most once per interval (last sweep metrics stored)
+        c.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            "name TEXT PRIMARY KEY, "
+            "holder TEXT, "
+            f"acquire_time {self.timestamp_type}, "
+            "reaped INTEGER, "
+            "duration REAL"
+            ")"
+        )
+        c.execute(f"INSERT INTO leases (name) VALUES ('{__PULSE_TIMEOUT_LEASE__}')")
+
+    def migrate_v8(self, c):
+        # tasks changes notifications, db specific (no-op by default)
+        pass
+
+    def migrate_v9(self, c):
+        # tasks count per (job, level, name, status), maintained by db specific tasks triggers.
+        # null names / levels are counted as '' / 0 (primary key columns).
+        # counters may drift if triggers are bypassed (e.g. disabled, manual restore), see rebuild_task_counters.
+        c.execute(
+            "CREATE TABLE IF NOT EXISTS task_counters ("
+            "job_id INTEGER NOT NULL, "
+            "level REAL NOT NULL, "
+            "name TEXT NOT NULL, "
+            "status TEXT NOT NULL, "
+            "count INTEGER NOT NULL, "
+            "PRIMARY KEY (job_id, level, name, status), "
+            "CONSTRAINT fk_job_id FOREIGN KEY (job_id) REFERENCES jobs(job_id) ON DELETE CASCADE"
+            ")"
+        )
+        c.execute(f"INSERT INTO task_counters (job_id, level, name, status, count) {__COUNT_TASKS_QUERY__}")
+        self.create_task_counters_triggers(c)
+
+    def migrate_v10(self, c):
+        # jobs frontier (claim level barrier) lookup of active counters
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS ix_task_counters_status_job_level ON task_counters (status, job_id, level)"
+        )
+
+    @abstractmethod
+    def create_task_counters_triggers(self, c):
+        """create tasks insert, delete and update triggers maintaining task_counters"""
+        pass
+
+    def migrate_v11(self, c):
+        from ..models import EStatus
+
+        # explicit tasks dependencies (dag), task is claimable once all its parents succeed.
+        # blockers is the number of parents not succeeded yet, maintained by db specific tasks status triggers.
+        c.execute("ALTER TABLE tasks ADD COLUMN blockers INTEGER NOT NULL DEFAULT 0")
+        c.execute(
+            "CREATE TABLE IF NOT EXISTS task_deps ("
+            "task_id INTEGER NOT NULL, "
+            "parent_id INTEGER NOT NULL, "
+            "PRIMARY KEY (task_id, parent_id), "
+            "CONSTRAINT fk_task_id FOREIGN KEY (task_id) REFERENCES tasks(task_id) ON DELETE CASCADE, "
+            "CONSTRAINT fk_parent_id FOREIGN KEY (parent_id) REFERENCES tasks(task_id) ON DELETE CASCADE"
+            ")"
+        )
+        c.execute("CREATE INDEX IF NOT EXISTS ix_task_deps_parent ON task_deps (parent_id)")
+        # claimable (ready) tasks
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS ix_tasks_ready ON tasks (job_id, level, task_id) "
+            f"WHERE status = '{EStatus.PENDING}' AND blockers = 0"
+        )
+        self.create_task_deps_triggers(c)
+
+    def migrate_v12(self, c):
+        # job state kwargs, objects created once per worker process and injected to job tasks by name
+        # (may exist in db created with schema v5)
+        c.execute(
+            "CREATE TABLE IF NOT EXISTS state_kwargs ("
+            f"state_kwargs_id {self.primary_key}, "
+            "name TEXT, "
+            "entrypoint TEXT NOT NULL, "
+            f"targs {self.bytes_type}, "
+            "description TEXT, "
+            "job_id INTEGER NOT NULL, "
+            "CONSTRAINT uq_name_job_id UNIQUE(name, job_id), "
+            "CONSTRAINT fk_job_id FOREIGN KEY (job_id) REFERENCES jobs(job_id) ON DELETE CASCADE"
+            ")"
+        )
+
+    @abstractmethod
+    def create_task_deps_triggers(self, c):
+        """create tasks status triggers maintaining dependent tasks blockers (parent success / success undo) and
+        failing pending descendant tasks on parent failure"""
+        pass
+
+    @staticmethod
+    def descendants_query(task_id: str):
+        """task descendants (dependent tasks, recursively) ids query"""
+        return (
+            "WITH RECURSIVE descendants(task_id) AS ("
+            f"SELECT task_id FROM task_deps WHERE parent_id = {task_id} "
+            "UNION SELECT task_deps.task_id FROM task_deps JOIN descendants ON task_deps.parent_id = descendants.task_id"
+            ") SELECT task_id FROM descendants"
+        )
+
+    @transaction_decorator(exclusive=True)
+    def rebuild_task_counters(self, c) -> dict:
+        """Rebuild task_counters from tasks table, returns number of counters fixed `dict(drift=<counters>)`."""
+        c.execute("SELECT job_id, level, name, status, count FROM task_counters WHERE count <> 0")
+        counters = {tuple(row[:4]): row[4] for row in c.fetchall()}
+        c.execute(__COUNT_TASKS_QUERY__)
+        tasks = {tuple(row[:4]): row[4] for row in c.fetchall()}
+        drift = sum(1 for k in counters.keys() | tasks.keys() if counters.get(k) != tasks.get(k))
+
+        if drift:
+            c.execute("DELETE FROM task_counters")
+            c.execute(f"INSERT INTO task_counters (job_id, level, name, status, count) {__COUNT_TASKS_QUERY__}")
+        self.info(f"Rebuilt task counters, fixed {drift} counters")
+
+        return dict(drift=drift)
+
     @transaction_decorator()
     def count_query(self, c, model_cls: IModel, _where: str = None, _limit: int = None, _offset: int = 0):
         if _limit is None:
@@ -289,10 +691,18 @@ class DBHandler(Handler):
         _order_by=None,
         _limit: int = None,
         _offset: int = 0,
+        _fields: Union[str, List[str]] = None,
+        _after: Union[str, int] = None,
     ):
         if _limit is None:
             _limit = self.config["api"]["limit"]
-        query_str = f"SELECT * FROM {model_cls.table_key()}"
+        columns = "*" if _fields is None else ", ".join(query_fields(model_cls, _fields))
+        query_str = f"SELECT {columns} FROM {model_cls.table_key()}"
+        if _after is not None:
+            # keyset pagination, rows after last row id
+            assert _order_by is None, "keyset pagination (_after) supports default order only"
+            after_id = int(decode_cursor(_after, key=model_cls.id_key())[model_cls.id_key()])
+            _where = and_where(_where, f"{model_cls.table_key()}.{model_cls.id_key()} > {after_id}")
         if _order_by is None:
             _order_by = f"{model_cls.table_key()}.{model_cls.id_key()} ASC"
         query_str = expand_query_str(query_str, _where=_where, _order_by=_order_by, _limit=_limit, _offset=_offset)
@@ -308,94 +718,221 @@ class DBHandler(Handler):
     ##################
 
     @transaction_decorator(exclusive=True)
-    def take_next_task(self, c, job_id: int = None, level_start: int = None, level_stop: int = None):
+    def take_next_tasks(
+        self,
+        c,
+        num_tasks: int = 1,
+        job_id: int = None,
+        level_start: int = None,
+        level_stop: int = None,
+        _timeout: float = None,
+    ):
         # imported here to avoid circular dependency
         from ..models import Task, EStatus
         from .handler import EAction
 
-        # todo: add FOR UPDATE in the queries postgresql
+        num_tasks = int(num_tasks)
+        assert num_tasks > 0, f"num_tasks must be positive, got '{num_tasks}'"
+
         level_query = ""
         if level_start:
             level_query += f" AND level >= {level_start}"
         if level_stop:
             level_query += f" AND level < {level_stop}"
 
-        # get pending task with minimum level
         job_query = ""
         if job_id is not None:
             job_query += f" AND job_id = {job_id}"
 
-        query = (
-            f"SELECT * FROM tasks WHERE status IN ('{EStatus.PENDING}'){job_query}{level_query} AND level = "
-            f"(SELECT MIN(level) FROM tasks WHERE status IN ('{EStatus.PENDING}'){job_query}{level_query})"
-            f" ORDER BY job_id ASC, task_id ASC {self.for_update}"
-        )
-        query = query.strip()
-
-        c.execute(query)
-        row = c.fetchone()
-        if row is None:
-            ptask = None
+        # claim up to num_tasks ready (pending, no blockers) tasks at the jobs frontier level in a single statement.
+        # task_counters level is COALESCE(level, 0) (NULL level tasks are at level 0), claims match tasks the same way.
+        # level barrier: the frontier is the lowest level with pending or running tasks, claimable if it has pending
+        # tasks (no running tasks at lower level), read from task_counters instead of scanning tasks.
+        # dependencies: pending tasks with parents not succeeded yet (blockers) are not claimable.
+        frontier_query = self._frontier_query(job_query=job_query, level_query=level_query)
+        claim_policy = self.config["handler"]["claim_policy"]
+        assert (
+            claim_policy in __CLAIM_POLICIES__
+        ), f"unsupported claim policy '{claim_policy}', supported: {list(__CLAIM_POLICIES__.keys())}"
+
+        now = datetime.now()
+        if claim_policy == "fifo":
+            rows = self._claim_tasks(
+                c,
+                f"SELECT task_id FROM tasks WHERE status = '{EStatus.PENDING}' AND blockers = 0 "
+                f"AND (job_id, COALESCE(level, 0)) IN (SELECT job_id, level FROM ({frontier_query}) AS frontier WHERE pending > 0)"
+                f" ORDER BY job_id ASC, task_id ASC LIMIT {num_tasks} {self.for_update}",
+                now,
+            )
+            rows.sort(key=lambda r: (r["job_id"], r["task_id"]))
         else:
+            # allocate claims across claimable jobs by policy (one row per job), claim per job at its frontier level
+            c.execute(
+                "SELECT frontier.job_id, frontier.level, frontier.pending, frontier.running, jobs.priority "
+                f"FROM ({frontier_query}) AS frontier JOIN jobs ON jobs.job_id = frontier.job_id "
+                "WHERE frontier.pending > 0"
+            )
             col_names = [description[0] for description in c.description]
-            ptask = self.from_interface(Task, dict(zip(col_names, row)))
+            frontier = [dict(zip(col_names, row)) for row in c.fetchall()]
+            allocation = list(__CLAIM_POLICIES__[claim_policy](frontier, num_tasks))
+            rows = []
+            if allocation:
+                # single claim statement, union of jobs tasks slices
+                rows = self._claim_tasks(
+                    c,
+                    " UNION ALL ".join(
+                        [
+                            f"SELECT task_id FROM (SELECT task_id FROM tasks WHERE status = '{EStatus.PENDING}' AND blockers = 0 "
+                            f"AND job_id = {job['job_id']} AND COALESCE(level, 0) = {job['level']} "
+                            f"ORDER BY task_id ASC LIMIT {count} {self.for_update}) AS job_{i}"
+                            for i, (job, count) in enumerate(allocation)
+                        ]
+                    ),
+                    now,
+                )
+            # policy jobs order, task id order within job
+            jobs_order = {job["job_id"]: i for i, (job, _) in enumerate(allocation)}
+            rows.sort(key=lambda r: (jobs_order[r["job_id"]], r["task_id"]))
 
-        # get running task with minimum level
-        query = (
-            f"SELECT * FROM tasks WHERE status IN ('{EStatus.RUNNING}'){job_query}{level_query} AND level = "
-            f"(SELECT MIN(level) FROM tasks WHERE status IN ('{EStatus.RUNNING}'){job_query}{level_query})"
-            f" {self.for_update}"
-        )
-        query = query.strip()
-        c.execute(query)
-        row = c.fetchone()
-        if row is None:
-            rtask = None
-        else:
-            col_names = [description[0] for description in c.description]
-            rtask = self.from_interface(Task, dict(zip(col_names, row)))
+        if rows:
+            tasks = self.from_interface(Task, rows)
+
+            return EAction.RUN_TASK, tasks
 
-        action = None
-        if ptask is None and rtask is None:
+        # nothing claimed, check if there are tasks to wait for
+        c.execute(f"SELECT COUNT(*) FROM ({frontier_query}) AS frontier")
+        if c.fetchone()[0] == 0:
             # no more pending task, no more running tasks
             action = EAction.STOP
-        elif ptask is None and rtask is not None:
-            # no more pending tasks, tasks still running
+        else:
+            # pending tasks with level higher than running (wait for running to end),
+            # no more pending tasks and tasks still running or pending tasks are locked by concurrent transaction
             action = EAction.WAIT
-        elif ptask is not None and rtask is None:
-            # pending task next, no more running tasks
-            action = EAction.RUN_TASK
-        elif ptask is not None and rtask is not None:
-            if ptask.level > rtask.level:
-                # pending task with level higher than running (wait for running to end)
-                action = EAction.WAIT
-            elif rtask.level > ptask.level:
-                # should never happend
-                # running task with level higher than pending task (warn and take next task)
-                self.warning(
-                    f"Running task with level higher than pending detected, taking pending. running id: {rtask.task_id}, pending id: {ptask.task_id}."
-                )
-                action = EAction.RUN_TASK
-            else:
-                action = EAction.RUN_TASK
 
-        if action == EAction.RUN_TASK:
-            now = datetime.now()
-            c.execute(
-                f"UPDATE tasks SET status = '{EStatus.RUNNING}', take_time = {self.timestamp(now)}, pulse_time = {self.timestamp(now)} WHERE task_id = {ptask.task_id};"
+        return action, []
+
+    @transaction_decorator()
+    def add_task_deps(self, c, deps: List[Tuple[int, int]]):
+        self._add_task_deps(c, deps)
+
+    def _add_task_deps(self, c, deps: List[Tuple[int, int]]):
+        from ..models import EStatus
+
+        deps = sorted(set((int(task_id), int(parent_id)) for task_id, parent_id in deps))
+        if not deps:
+            return
+
+        task_ids = ", ".join(sorted(set(str(task_id) for task_id, _ in deps)))
+        parent_ids = ", ".join(sorted(set(str(parent_id) for _, parent_id in deps)))
+        # parents status changes wait for the dependencies to commit (and see them)
+        c.execute(f"SELECT task_id, level FROM tasks WHERE task_id IN ({parent_ids}) ORDER BY task_id {self.for_share}")
+        parents_level = {row[0]: row[1] or 0 for row in c.fetchall()}
+        c.execute(f"SELECT task_id, level FROM tasks WHERE task_id IN ({task_ids})")
+        tasks_level = {row[0]: row[1] or 0 for row in c.fetchall()}
+
+        # tasks are claimed level by level, a parent at a higher level than its dependent task never runs
+        for task_id, parent_id in deps:
+            assert task_id != parent_id, f"task '{task_id}' can't depend on itself"
+            assert task_id in tasks_level, f"task '{task_id}' not found"
+            assert parent_id in parents_level, f"task '{task_id}' dependency '{parent_id}' not found"
+            assert parents_level[parent_id] <= tasks_level[task_id], (
+                f"task '{task_id}' (level {tasks_level[task_id]}) can't depend on task '{parent_id}' "
+                f"of higher level ({parents_level[parent_id]})"
             )
-            ptask.status = EStatus.RUNNING
-            ptask.take_time = now
-            ptask.pulse_time = now
-            task = ptask
-        elif action == EAction.WAIT:
-            task = None
-        elif action == EAction.STOP:
-            task = None
-        else:
-            raise RuntimeError(f"Unsupported action '{EAction}'")
 
-        return action, task
+        chunk_size = self.config["handler"]["bulk_chunk_size"]
+        for start in range(0, len(deps), chunk_size):
+            values = ", ".join([f"({task_id}, {parent_id})" for task_id, parent_id in deps[start : start + chunk_size]])
+            c.execute(f"INSERT INTO task_deps (task_id, parent_id) VALUES {values}")
+
+        # a task reachable from itself (including by dependencies of this batch) never runs, rolled back
+        c.execute(
+            "WITH RECURSIVE reach(origin, task_id) AS ("
+            f"SELECT parent_id, task_id FROM task_deps WHERE parent_id IN ({task_ids}) "
+            "UNION SELECT reach.origin, task_deps.task_id FROM task_deps JOIN reach ON task_deps.parent_id = reach.task_id"
+            ") SELECT origin FROM reach WHERE origin = task_id LIMIT 1"
+        )
+        cycle = c.fetchone()
+        assert cycle is None, f"task '{cycle and cycle[0]}' dependencies cycle"
+
+        # blockers are the parents not succeeded yet, tasks with failed parents fail
+        parents_query = (
+            "SELECT COUNT(*) FROM task_deps JOIN tasks AS parents ON parents.task_id = task_deps.parent_id "
+            "WHERE task_deps.task_id = tasks.task_id"
+        )
+        c.execute(
+            f"UPDATE tasks SET blockers = ({parents_query} AND parents.status <> '{EStatus.SUCCESS}') "
+            f"WHERE task_id IN ({task_ids})"
+        )
+        c.execute(
+            f"UPDATE tasks SET status = '{EStatus.FAILURE}', done_time = {self.current_timestamp}, pulse_time = {self.current_timestamp} "
+            f"WHERE status = '{EStatus.PENDING}' AND task_id IN ({task_ids}) "
+            f"AND ({parents_query} AND parents.status = '{EStatus.FAILURE}') > 0"
+        )
+
+    def _claim_tasks(self, c, select_query: str, now: datetime) -> List[dict]:
+        from ..models import EStatus
+
+        c.execute(
+            f"UPDATE tasks SET status = '{EStatus.RUNNING}', take_time = {self.timestamp(now)}, pulse_time = {self.timestamp(now)} "
+            f"WHERE status IN ('{EStatus.PENDING}') AND task_id IN ({select_query}) RETURNING *"
+        )
+        rows = c.fetchall()
+        col_names = [description[0] for description in c.description]
+
+        return [dict(zip(col_names, row)) for row in rows]
+
+    def _frontier_query(self, job_query: str = "", level_query: str = ""):
+        from ..models import EStatus
+
+        # active (pending / running) tasks count per job level
+        levels_query = (
+            "SELECT job_id, level, "
+            f"SUM(CASE WHEN status = '{EStatus.PENDING}' THEN count ELSE 0 END) AS pending, "
+            f"SUM(CASE WHEN status = '{EStatus.RUNNING}' THEN count ELSE 0 END) AS running "
+            f"FROM task_counters WHERE status IN ('{EStatus.PENDING}', '{EStatus.RUNNING}') AND count > 0"
+            f"{job_query}{level_query} GROUP BY job_id, level"
+        )
+
+        # lowest active level per job
+        return (
+            "SELECT job_id, level, pending, running, pending_level FROM ("
+            "SELECT job_id, level, pending, running, "
+            "MIN(CASE WHEN pending > 0 THEN level END) OVER (PARTITION BY job_id) AS pending_level, "
+            "ROW_NUMBER() OVER (PARTITION BY job_id ORDER BY level) AS level_order "
+            f"FROM ({levels_query}) AS levels"
+            ") AS frontier WHERE level_order = 1"
+        )
+
+    @transaction_decorator()
+    def jobs_frontier(self, c, job_id: int = None):
+        """Jobs frontier, lowest level with pending or running tasks per job.
+
+        returns `dict(job_id, level, pending, running, pending_level)` per job with active tasks, where pending and
+        running are the frontier level tasks count and pending_level is the job lowest pending level.
+        """
+        job_query = "" if job_id is None else f" AND job_id = {int(job_id)}"
+        c.execute(f"{self._frontier_query(job_query=job_query)} ORDER BY job_id ASC")
+        rows = c.fetchall()
+        col_names = [description[0] for description in c.description]
+
+        ret = [dict(zip(col_names, row)) for row in rows]
+        return ret
+
+    @transaction_decorator()
+    def pulse_tasks(self, c, task_ids: List[int], pulse_time: datetime = None):
+        from ..models import EStatus
+
+        if not task_ids:
+            return
+
+        if pulse_time is None:
+            pulse_time = datetime.now()
+
+        c.execute(
+            f"UPDATE tasks SET pulse_time = {self.timestamp(pulse_time)} "
+            f"WHERE status = '{EStatus.RUNNING}' AND task_id IN ({', '.join([str(int(tid)) for tid in task_ids])})"
+        )
 
     @transaction_decorator()
     def tasks_status(
@@ -407,23 +944,42 @@ class DBHandler(Handler):
 
         # todo add group by to get_query_kwargs
 
+        _after = kwargs.pop("_after", None)
         if kwargs.get("_limit") is None:
             kwargs["_limit"] = self.config["api"]["limit"]
         if kwargs.get("_order_by") is None:
-            kwargs["_order_by"] = "name ASC"
+            kwargs["_order_by"] = "level ASC, COALESCE(name, '') ASC"
+        elif _after is not None:
+            raise Exception("keyset pagination (_after) supports default order only")
         if kwargs.get("_group_by") is None:
             kwargs["_group_by"] = ("level", "name")
         query_kwargs = get_query_kwargs(kwargs)
+        query_kwargs["_where"] = and_where(query_kwargs.get("_where"), "count > 0")
+
+        params = []
+        if _after is not None:
+            # keyset pagination, groups after last (level, name)
+            after = decode_cursor(_after)
+            level = float(after["level"])
+            query_kwargs["_where"] = and_where(
+                query_kwargs.get("_where"),
+                f"(level > {level} OR (level = {level} AND COALESCE(name, '') > {self.format_symbol}))",
+            )
+            params.append(after["name"] or "")
 
+        # counters are maintained per (job, level, name, status), O(counters) instead of O(tasks)
         query_str = (
-            "SELECT level, name,"
-            "COUNT(*) as total, "
-            + ",".join([f"SUM(CASE WHEN status = '{status}' THEN 1 ELSE 0 END) AS {status} " for status in EStatus])
-            + "FROM tasks"
+            "SELECT level, NULLIF(name, '') AS name, "
+            "SUM(count) as total, "
+            + ",".join([f"SUM(CASE WHEN status = '{status}' THEN count ELSE 0 END) AS {status} " for status in EStatus])
+            + "FROM task_counters"
         )
         query_str = expand_query_str(query_str, **query_kwargs)
 
-        c.execute(query_str)
+        if params:
+            c.execute(query_str, params)
+        else:
+            c.execute(query_str)
         rows = c.fetchall()
         col_names = [description[0] for description in c.description]
 
@@ -431,18 +987,32 @@ class DBHandler(Handler):
         return ret
 
     @transaction_decorator()
-    def jobs_status(self, c, _order_by: str = None, _limit: int = None, _offset: int = 0):
+    def jobs_status(
+        self, c, _order_by: str = None, _limit: int = None, _offset: int = 0, _after: Union[str, int] = None
+    ):
         from ..models import EStatus
 
         if _limit is None:
             _limit = self.config["api"]["limit"]
 
+        where = ""
+        if _after is not None:
+            # keyset pagination, jobs before last job id (desc order)
+            assert _order_by is None, "keyset pagination (_after) supports default order only"
+            where = f"WHERE jobs.job_id < {int(decode_cursor(_after, key='job_id')['job_id'])} "
+
         query_str = (
             "SELECT jobs.job_id, jobs.name, jobs.description, jobs.priority, "
-            "COUNT(*) as tasks, "
-            + ", ".join([f"SUM(CASE WHEN status = '{status}' THEN 1 ELSE 0 END) AS {status}" for status in EStatus])
+            "COALESCE(SUM(count), 0) as tasks, "
+            + ", ".join(
+                [
+                    f"COALESCE(SUM(CASE WHEN status = '{status}' THEN count ELSE 0 END), 0) AS {status}"
+                    for status in EStatus
+                ]
+            )
             + f" FROM jobs "
-            "LEFT JOIN tasks ON jobs.job_id = tasks.job_id "
+            "LEFT JOIN task_counters ON jobs.job_id = task_counters.job_id "
+            f"{where}"
             "GROUP BY jobs.job_id"
         )
 
@@ -459,14 +1029,41 @@ class DBHandler(Handler):
         return ret
 
     @transaction_decorator()
-    def fail_pulse_timeout_tasks(self, c, timeout_sec=None):
+    def fail_pulse_timeout_tasks(self, c, timeout_sec=None, interval_sec=None):
+        """Fail running tasks with no pulse in the last `timeout_sec` seconds.
+
+        If `interval_sec` is set the sweep runs at most once per interval across all workers (db lease),
+        returns None when skipped, otherwise sweep metrics `dict(reaped=<tasks count>, duration=<sec>)`.
+        """
         from ..models import EStatus
 
         if timeout_sec is None:
-            return
+            return None
+
+        now = datetime.now()
+        if interval_sec is not None:
+            # acquire lease, concurrent workers block on the lease row and skip once the holder commits.
+            # lease times are db times (workers clocks may differ)
+            c.execute(
+                f"UPDATE leases SET holder = '{socket.gethostname()}:{os.getpid()}', acquire_time = {self.current_timestamp} "
+                f"WHERE name = '{__PULSE_TIMEOUT_LEASE__}' "
+                f"AND (acquire_time IS NULL OR acquire_time <= {self.current_timestamp_offset(-interval_sec)})"
+            )
+            if c.rowcount == 0:
+                return None
 
         # set timeout tasks
-        last_valid_pulse = datetime.now() - timedelta(seconds=timeout_sec)
+        start = time.perf_counter()
+        last_valid_pulse = now - timedelta(seconds=timeout_sec)
+        c.execute(
+            f"UPDATE tasks SET status = '{EStatus.FAILURE}' WHERE status = '{EStatus.RUNNING}' AND pulse_time < {self.timestamp(last_valid_pulse)};"
+        )
+        reaped = c.rowcount
+        duration = time.perf_counter() - start
+
         c.execute(
-            f"UPDATE tasks SET status = '{EStatus.FAILURE}' WHERE pulse_time < {self.timestamp(last_valid_pulse)} AND status NOT IN ('{EStatus.SUCCESS}', '{EStatus.FAILURE}');"
+            f"UPDATE leases SET reaped = {reaped}, duration = {duration} WHERE name = '{__PULSE_TIMEOUT_LEASE__}'"
         )
+        self.info(f"Pulse timeout sweep failed {reaped} tasks in {duration:.3f} sec")
+
+        return dict(reaped=reaped, duration=duration)
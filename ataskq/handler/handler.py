@@ -1,8 +1,11 @@
 from abc import abstractmethod
-from typing import Union, List, Dict
+from typing import Union, List, Dict, Tuple
 from datetime import datetime
 from enum import Enum
 import copy
+import time
+import base64
+import json
 
 from ..env import ATASKQ_CONFIG
 from ..logger import Logger
@@ -21,7 +24,7 @@ def get_query_kwargs(kwargs):
     for k, v in kwargs.items():
         if k == "_where":
             continue
-        if k in ["_group_by", "_order_by", "_limit", "_offset"]:
+        if k in ["_group_by", "_order_by", "_limit", "_offset", "_fields", "_after"]:
             ret[k] = v
             continue
         if v is None:
@@ -35,6 +38,47 @@ def get_query_kwargs(kwargs):
     return ret
 
 
+def query_fields(model_cls: IModel, _fields: Union[str, List[str]]) -> List[str]:
+    """validated projection fields (list or comma separated str), model id is always included"""
+    if isinstance(_fields, str):
+        _fields = [f.strip() for f in _fields.split(",") if f.strip()]
+
+    for f in _fields:
+        assert f in model_cls.__annotations__, f"'{f}' not a possible class '{model_cls.__name__}' field."
+
+    ret = [model_cls.id_key()] + [f for f in _fields if f != model_cls.id_key()]
+
+    return list(dict.fromkeys(ret))
+
+
+def encode_cursor(**values) -> str:
+    """opaque keyset pagination cursor of last row sort key values"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: Union[str, int, dict], key: str = None) -> dict:
+    """keyset pagination cursor values, cursor is an opaque token or the last row id (key) value"""
+    if isinstance(cursor, dict):
+        return cursor
+
+    if isinstance(cursor, int) or str(cursor).lstrip("-").isdigit():
+        assert key is not None, f"cursor '{cursor}' must be an opaque cursor token"
+        return {key: int(cursor)}
+
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception as ex:
+        raise Exception(f"invalid cursor '{cursor}'") from ex
+
+
+def next_cursor(rows: List[dict], keys: List[str], limit: int) -> Union[str, None]:
+    """cursor of the next page, None if last page"""
+    if not rows or limit is None or len(rows) < int(limit):
+        return None
+
+    return encode_cursor(**{k: rows[-1][k] for k in keys})
+
+
 def to_datetime(string: Union[str, datetime, None]):
     if string is None:
         return None
@@ -105,7 +149,7 @@ class Handler(IModelSerializer, Logger):
         pass
 
     @abstractmethod
-    def _create_bulk(self, model_cls: IModel, ikwargs: List[dict]):
+    def _create_bulk(self, model_cls: IModel, ikwargs: List[dict], deps: List[tuple] = None):
         pass
 
     @abstractmethod
@@ -137,13 +181,18 @@ class Handler(IModelSerializer, Logger):
 
         return model_id
 
-    def create_bulk(self, model_cls: IModel, mkwargs: List[dict]) -> List[int]:
+    def create_bulk(self, model_cls: IModel, mkwargs: List[dict], deps: List[tuple] = None) -> List[int]:
+        """create models, returns created ids.
+
+        deps - created tasks dependencies (task index, parent id, parent index) added in the same transaction, parent
+        is an existing task id or (if parent id is None) the index of a task created with it.
+        """
         for i, v in enumerate(mkwargs):
             assert (
                 model_cls.id_key() not in v
             ), f"item [{i}]: id '{model_cls.id_key()}' can't be passed to create '{model_cls.__name__}({model_cls.table_key()})'"
         ikwargs = self.m2i(model_cls, mkwargs)
-        model_ids = self._create_bulk(model_cls, ikwargs)
+        model_ids = self._create_bulk(model_cls, ikwargs, deps=deps)
 
         return model_ids
 
@@ -160,19 +209,70 @@ class Handler(IModelSerializer, Logger):
         ikwargs = self.m2i(model_cls, mkwargs)
         self._update(model_cls, model_id, **ikwargs)
 
+    @abstractmethod
+    def _update_bulk(self, model_cls: IModel, ikwargs: List[dict]):
+        pass
+
+    def update_bulk(self, model_cls: IModel, mkwargs: List[dict]):
+        """update multiple models in a single transaction, each item holds the model id and the fields to update"""
+        for i, v in enumerate(mkwargs):
+            assert (
+                v.get(model_cls.id_key()) is not None
+            ), f"item [{i}]: id '{model_cls.id_key()}' must be passed to update '{model_cls.__name__}({model_cls.table_key()})'"
+        ikwargs = self.m2i(model_cls, mkwargs)
+        self._update_bulk(model_cls, ikwargs)
+
     ##########
     # Custom #
     ##########
     @abstractmethod
-    def take_next_task(self, job_id=None, level_start: int = None, level_stop: int = None) -> tuple:
+    def take_next_tasks(
+        self, num_tasks: int = 1, job_id=None, level_start: int = None, level_stop: int = None, _timeout: float = None
+    ) -> tuple:
+        """claim up to num_tasks tasks, returns (action, tasks).
+
+        _timeout - long poll timeout sec overriding 'handler.long_poll_timeout' config (0 never holds the claim),
+        db handlers claims are never held.
+        """
+        pass
+
+    def take_next_task(
+        self, job_id=None, level_start: int = None, level_stop: int = None, _timeout: float = None
+    ) -> tuple:
+        action, tasks = self.take_next_tasks(
+            num_tasks=1, job_id=job_id, level_start=level_start, level_stop=level_stop, _timeout=_timeout
+        )
+        task = tasks[0] if tasks else None
+
+        return action, task
+
+    def wait_for_tasks(self, timeout: float):
+        """wait up to timeout sec for tasks changes (new tasks, status changes). default polls by sleeping timeout."""
+        time.sleep(timeout)
+
+    @abstractmethod
+    def pulse_tasks(self, task_ids: List[int], pulse_time: datetime = None):
+        pass
+
+    @abstractmethod
+    def add_task_deps(self, deps: List[Tuple[int, int]]):
+        """add (task_id, parent_id) dependencies, tasks are claimable once all parents succeed"""
+        pass
+
+    @abstractmethod
+    def jobs_frontier(self, job_id: int = None) -> List[dict]:
         pass
 
     @abstractmethod
-    def tasks_status(self, job_id=None, _order_by: str = None, _limit: int = None, _offset: int = 0) -> List[dict]:
+    def tasks_status(
+        self, job_id=None, _order_by: str = None, _limit: int = None, _offset: int = 0, _after: str = None
+    ) -> List[dict]:
         pass
 
     @abstractmethod
-    def jobs_status(self, _order_by: str = None, _limit: int = None, _offset: int = 0) -> List[dict]:
+    def jobs_status(
+        self, _order_by: str = None, _limit: int = None, _offset: int = 0, _after: Union[str, int] = None
+    ) -> List[dict]:
         pass
 
 
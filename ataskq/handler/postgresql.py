@@ -1,7 +1,10 @@
 import re
-from typing import NamedTuple, Union
+from typing import NamedTuple, Union, List
 from datetime import datetime
 import logging
+import select
+import os
+import io
 
 try:
     import psycopg2
@@ -10,8 +13,28 @@ except ModuleNotFoundError:
 
 from psycopg2.extras import LoggingConnection
 
-from .db_handler import DBHandler
+from .db_handler import DBHandler, __FORK_INHERITED_CONNECTIONS__
 from .handler import to_datetime, from_datetime
+from ..imodel import IModel
+
+# tasks changes notification channel (new tasks, tasks status changes)
+__TASKS_CHANNEL__ = "ataskq_tasks"
+
+# minimal number of rows to insert with COPY instead of multi-row INSERT
+__COPY_MIN_ROWS__ = 100
+
+
+def _copy_value(v) -> str:
+    """COPY text format value"""
+    if v is None:
+        return "\\N"
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        # bytea hex format, backslash escaped
+        return "\\\\x" + bytes(v).hex()
+    if isinstance(v, bool):
+        return "t" if v else "f"
+
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace("\r", "\\r").replace("\t", "\\t")
 
 
 class PostgresConnection(NamedTuple):
@@ -30,8 +53,19 @@ class PostgresConnection(NamedTuple):
 
 class PostgresqlDBHandler(DBHandler):
     def __init__(self, **kwargs) -> None:
+        # dedicated per process LISTEN connection (outside the pool)
+        self._listen_conn = None
+        self._listen_pid = None
         super().__init__(**kwargs)
 
+    def __getstate__(self):
+        # listen connection is process specific
+        state = self.__dict__.copy()
+        state["_listen_conn"] = None
+        state["_listen_pid"] = None
+
+        return state
+
     @staticmethod
     def from_connection_str(conn):
         # https://www.postgresql.org/docs/current/libpq-connect.html#LIBPQ-CONNSTRING-URIS
@@ -92,10 +126,25 @@ class PostgresqlDBHandler(DBHandler):
     def timestamp(self, ts):
         return f"'{ts}'::timestamp"
 
+    @property
+    def current_timestamp(self):
+        return "LOCALTIMESTAMP"
+
+    def current_timestamp_offset(self, seconds: float):
+        return f"(LOCALTIMESTAMP + interval '{float(seconds)} seconds')"
+
     @property
     def for_update(self):
+        # skip rows locked by concurrent claims instead of waiting on them
+        if self.config["handler"]["skip_locked"]:
+            return "FOR UPDATE SKIP LOCKED"
+
         return "FOR UPDATE"
 
+    def schema_lock(self, c):
+        # serialize concurrent schema init / migration
+        c.execute("SELECT pg_advisory_xact_lock(hashtext('ataskq_schema'))")
+
     def connect(self):
         conn = psycopg2.connect(
             host=self.connection.host,
@@ -109,3 +158,168 @@ class PostgresqlDBHandler(DBHandler):
         conn.initialize(logger)
 
         return conn
+
+    def close(self):
+        self._close_listen()
+        super().close()
+
+    def migrate_v8(self, c):
+        from ..models import EStatus
+
+        # notify waiting workers on new tasks and tasks status changes (notifications are delivered on commit and
+        # deduplicated per transaction). claims (pending -> running) are not notified to avoid waking waiting workers.
+        c.execute(
+            "CREATE OR REPLACE FUNCTION ataskq_tasks_notify() RETURNS trigger AS $$ "
+            f"BEGIN PERFORM pg_notify('{__TASKS_CHANNEL__}', ''); RETURN NULL; END; "
+            "$$ LANGUAGE plpgsql"
+        )
+        c.execute(
+            "CREATE TRIGGER tasks_notify_insert AFTER INSERT OR DELETE ON tasks "
+            "FOR EACH STATEMENT EXECUTE PROCEDURE ataskq_tasks_notify()"
+        )
+        c.execute(
+            "CREATE TRIGGER tasks_notify_status AFTER UPDATE OF status ON tasks FOR EACH ROW "
+            f"WHEN (OLD.status IS DISTINCT FROM NEW.status AND NEW.status <> '{EStatus.RUNNING}') "
+            "EXECUTE PROCEDURE ataskq_tasks_notify()"
+        )
+
+    def create_task_counters_triggers(self, c):
+        # statement level triggers, counters are updated once per statement with the net delta per key
+        # (e.g. batch claim is a single update of the job level pending and running counters).
+        # zero counters are kept (filtered by status queries, removed by rebuild).
+        def delta(rows, sign, where=""):
+            return (
+                f"SELECT job_id, COALESCE(level, 0) AS level, COALESCE(name, '') AS name, status, {sign} AS count "
+                f"FROM {rows} WHERE status IS NOT NULL{where}"
+            )
+
+        # transition tables can't be used with an update columns list (UPDATE OF), the update trigger fires on every
+        # tasks update (e.g. pulse) but only rows with a changed counter key / status are counted, statements with no
+        # changed rows don't touch task_counters (status changes still update the job level counters rows).
+        changed = (
+            "WITH changed AS (SELECT task_id FROM new_rows AS n JOIN old_rows AS o USING (task_id) "
+            "WHERE (n.job_id, n.level, n.name, n.status) IS DISTINCT FROM (o.job_id, o.level, o.name, o.status)) "
+        )
+        changed_where = " AND task_id IN (SELECT task_id FROM changed)"
+        deltas = dict(
+            insert=delta("new_rows", 1),
+            delete=delta("old_rows", -1),
+            update=f"{changed}{delta('new_rows', 1, changed_where)} UNION ALL {delta('old_rows', -1, changed_where)}",
+        )
+        for op, query in deltas.items():
+            c.execute(
+                f"CREATE OR REPLACE FUNCTION ataskq_task_counters_{op}() RETURNS trigger AS $$ "
+                "BEGIN "
+                "INSERT INTO task_counters (job_id, level, name, status, count) "
+                f"SELECT job_id, level, name, status, SUM(count) FROM ({query}) AS d "
+                # job delete cascades to its counters before its tasks
+                "WHERE EXISTS (SELECT 1 FROM jobs WHERE jobs.job_id = d.job_id) "
+                "GROUP BY job_id, level, name, status HAVING SUM(count) <> 0 "
+                # deterministic locking order of concurrent statements
+                "ORDER BY job_id, level, name, status "
+                "ON CONFLICT (job_id, level, name, status) DO UPDATE SET count = task_counters.count + EXCLUDED.count; "
+                "RETURN NULL; "
+                "END; "
+                "$$ LANGUAGE plpgsql"
+            )
+
+        c.execute(
+            "CREATE TRIGGER task_counters_insert AFTER INSERT ON tasks REFERENCING NEW TABLE AS new_rows "
+            "FOR EACH STATEMENT EXECUTE PROCEDURE ataskq_task_counters_insert()"
+        )
+        c.execute(
+            "CREATE TRIGGER task_counters_delete AFTER DELETE ON tasks REFERENCING OLD TABLE AS old_rows "
+            "FOR EACH STATEMENT EXECUTE PROCEDURE ataskq_task_counters_delete()"
+        )
+        c.execute(
+            "CREATE TRIGGER task_counters_update AFTER UPDATE ON tasks "
+            "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows "
+            "FOR EACH STATEMENT EXECUTE PROCEDURE ataskq_task_counters_update()"
+        )
+
+    def create_task_deps_triggers(self, c):
+        from ..models import EStatus
+
+        children_query = "SELECT task_id FROM task_deps WHERE parent_id = NEW.task_id"
+        # a failure fails all pending descendants in a single update (recursive cte), propagated failures (nested
+        # trigger) are already covered so dag depth is not bounded by the triggers nesting depth (max_stack_depth).
+        c.execute(
+            "CREATE OR REPLACE FUNCTION ataskq_task_deps_status() RETURNS trigger AS $$ "
+            "BEGIN "
+            f"IF NEW.status = '{EStatus.SUCCESS}' THEN "
+            f"UPDATE tasks SET blockers = blockers - 1 WHERE task_id IN ({children_query}); "
+            f"ELSIF NEW.status = '{EStatus.FAILURE}' AND pg_trigger_depth() = 1 THEN "
+            f"UPDATE tasks SET status = '{EStatus.FAILURE}', done_time = {self.current_timestamp}, pulse_time = {self.current_timestamp} "
+            f"WHERE status = '{EStatus.PENDING}' AND task_id IN ({self.descendants_query('NEW.task_id')}); "
+            "END IF; "
+            f"IF OLD.status = '{EStatus.SUCCESS}' THEN "
+            f"UPDATE tasks SET blockers = blockers + 1 WHERE task_id IN ({children_query}); "
+            "END IF; "
+            "RETURN NULL; "
+            "END; "
+            "$$ LANGUAGE plpgsql"
+        )
+        c.execute(
+            "CREATE TRIGGER task_deps_status AFTER UPDATE OF status ON tasks FOR EACH ROW "
+            "WHEN (OLD.status IS DISTINCT FROM NEW.status) EXECUTE PROCEDURE ataskq_task_deps_status()"
+        )
+
+    @property
+    def for_share(self):
+        return "FOR SHARE"
+
+    def _close_listen(self):
+        if self._listen_conn is not None and self._listen_pid == os.getpid():
+            self._listen_conn.close()
+        elif self._listen_conn is not None:
+            # inherited from parent process on fork, never closed by child process
+            __FORK_INHERITED_CONNECTIONS__.append(self._listen_conn)
+        self._listen_conn = None
+        self._listen_pid = None
+
+    def wait_for_tasks(self, timeout: float):
+        if not self.config["handler"]["notify"]:
+            return super().wait_for_tasks(timeout)
+
+        if self._listen_conn is None or self._listen_pid != os.getpid():
+            self._close_listen()
+            try:
+                conn = self.connect()
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                conn.cursor().execute(f"LISTEN {__TASKS_CHANNEL__}")
+            except psycopg2.Error:
+                self.warning("Failed to listen for tasks notifications, fallback to polling.", exc_info=True)
+                return super().wait_for_tasks(timeout)
+            self._listen_conn = conn
+            self._listen_pid = os.getpid()
+            # changes before listening started are not notified, caller should check for tasks again
+            return
+
+        # notifications received since last wait are handled immediately
+        try:
+            self._listen_conn.poll()
+            if not self._listen_conn.notifies:
+                select.select([self._listen_conn], [], [], timeout)
+                self._listen_conn.poll()
+            del self._listen_conn.notifies[:]
+        except (psycopg2.Error, OSError):
+            self.warning("Tasks notifications connection failed, reconnecting on next wait.", exc_info=True)
+            self._close_listen()
+
+    def _insert_rows(self, c, model_cls: IModel, keys: List[str], rows: List[list]) -> List[int]:
+        if len(rows) < __COPY_MIN_ROWS__:
+            return super()._insert_rows(c, model_cls, keys, rows)
+
+        # reserve ids, COPY doesn't support RETURNING
+        table = model_cls.table_key()
+        id_key = model_cls.id_key()
+        c.execute(f"SELECT nextval(pg_get_serial_sequence('{table}', '{id_key}')) FROM generate_series(1, {len(rows)})")
+        model_ids = sorted([row[0] for row in c.fetchall()])
+
+        data = io.StringIO()
+        for model_id, row in zip(model_ids, rows):
+            data.write("\t".join([str(model_id)] + [_copy_value(v) for v in row]) + "\n")
+        data.seek(0)
+        c.copy_expert(f'COPY {table} ({id_key}, {", ".join(keys)}) FROM STDIN', data)
+
+        return model_ids
@@ -1,16 +1,23 @@
 from typing import List, NamedTuple, Tuple, Union
-from enum import Enum
 from datetime import datetime
-import base64
+import os
 
 from ataskq.imodel import IModel
 
 try:
     import requests
 except ImportError:
-    raise Exception("install psycopg2 for using ataskq REST handler.")
+    raise Exception("install requests for using ataskq REST handler.")
 
-from .handler import Handler, EAction, from_datetime, get_query_kwargs, to_datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .handler import Handler, EAction, get_query_kwargs, query_fields
+from .wire_format import WireFormat, JSONFormat, get_wire_format, from_content_type
+
+
+# sessions inherited from parent process on fork, kept referenced and never used or closed by the child process
+__FORK_INHERITED_SESSIONS__ = []
 
 
 class RESTConnection(NamedTuple):
@@ -23,7 +30,62 @@ class RESTConnection(NamedTuple):
 class RESTHandler(Handler):
     # todo: remove max jobs
     def __init__(self, **kwargs) -> None:
+        # server already waited for tasks on last take next task (long poll)
+        self._long_polled = False
+        # keep-alive session, process specific
+        self._session = None
+        self._session_pid = None
         super().__init__(**kwargs)
+        self._wire_format = get_wire_format(self.config["rest"]["wire_format"])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_session"] = None
+        state["_session_pid"] = None
+
+        return state
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is not None and self._session_pid != os.getpid():
+            # forked process, connections are shared with parent process
+            __FORK_INHERITED_SESSIONS__.append(self._session)
+            self._session = None
+
+        if self._session is None:
+            config = self.config["rest"]
+            # retry connection errors and server busy (back-pressure) responses only,
+            # failed reads are not retried since the request may have been applied (e.g. task claimed)
+            retry = Retry(
+                total=config["retries"],
+                connect=config["retries"],
+                read=0,
+                status=config["retries"],
+                status_forcelist=[503],
+                allowed_methods=None,
+                backoff_factor=config["backoff_factor"],
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config["pool_size"], max_retries=retry)
+            self._session = requests.Session()
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+            self._session.headers["Accept"] = self._wire_format.content_type
+            self._session_pid = os.getpid()
+
+        return self._session
+
+    def close(self):
+        if self._session is not None and self._session_pid == os.getpid():
+            self._session.close()
+        self._session = None
+        self._session_pid = None
+
+    def timeout(self, read_timeout: float = 0):
+        # (connect, read) timeouts, read timeout extended by expected server side wait (long poll)
+        config = self.config["rest"]
+        return (config["connect_timeout"], config["read_timeout"] + read_timeout)
 
     @staticmethod
     def from_connection_str(conn):
@@ -31,59 +93,67 @@ class RESTHandler(Handler):
 
         return ret
 
-    @staticmethod
-    def m2i_serialize():
-        type_handlers = {
-            datetime: lambda v: from_datetime(v),
-            Enum: lambda v: v.value,
-            bytes: lambda v: base64.b64encode(v).decode("ascii"),
-        }
+    ######################
+    # interface handlers #
+    ######################
 
-        return type_handlers
+    @property
+    def wire_format(self) -> WireFormat:
+        return self._wire_format
 
-    @staticmethod
-    def i2m_serialize():
-        type_handlers = {datetime: lambda v: to_datetime(v), bytes: lambda v: base64.b64decode(v.encode("ascii"))}
+    # model serialization is wire format dependent (handler instance is the models serializer)
+    def m2i_serialize(self):
+        return self._wire_format.m2i_serialize()
+
+    def i2m_serialize(self):
+        return self._wire_format.i2m_serialize()
 
-        return type_handlers
+    def i2m(self, model_cls, kwargs: Union[dict, List[dict]]) -> Union[dict, List[dict]]:
+        return model_cls.i2m(kwargs, self)
+
+    def from_interface(self, model_cls: IModel, kwargs: Union[dict, List[dict]]) -> Union[IModel, List[IModel]]:
+        return model_cls.from_interface(kwargs, self)
+
+    def m2i(self, model_cls: IModel, kwargs: Union[dict, List[dict]]) -> Union[dict, List[dict]]:
+        return model_cls.m2i(kwargs, self)
+
+    def to_interface(self, model: IModel) -> IModel:
+        return model.to_interface(self)
 
     @property
     def api_url(self):
         return f"{self._connection.url}/api"
 
-    def rest_get(self, url, *args, **kwargs):
+    def rest_request(self, method, url, *args, **kwargs):
         url = f"{self.api_url}/{url}"
-        res = requests.get(url, *args, **kwargs)
-        assert res.ok, f"get url '{url}' failed. message: {res.text}"
+        kwargs.setdefault("timeout", self.timeout())
+        if "json" in kwargs and self._wire_format is not JSONFormat:
+            kwargs["data"] = self._wire_format.dumps(kwargs.pop("json"))
+            kwargs["headers"] = {"Content-Type": self._wire_format.content_type, **kwargs.get("headers", {})}
+        res = self.session.request(method, url, *args, **kwargs)
+        assert res.ok, f"{method.lower()} url '{url}' failed. message: {res.text}"
 
-        return res.json()
+        return from_content_type(res.headers.get("Content-Type")).loads(res.content)
 
-    def rest_post(self, url, *args, **kwargs):
-        url = f"{self.api_url}/{url}"
-        res = requests.post(url, *args, **kwargs)
-        assert res.ok, f"post url '{url}' failed. message: {res.text}"
+    def rest_get(self, url, *args, **kwargs):
+        return self.rest_request("GET", url, *args, **kwargs)
 
-        return res.json()
+    def rest_post(self, url, *args, **kwargs):
+        return self.rest_request("POST", url, *args, **kwargs)
 
     def rest_put(self, url, *args, **kwargs):
-        url = f"{self.api_url}/{url}"
-        res = requests.put(url, *args, **kwargs)
-        assert res.ok, f"put url '{url}' failed. message: {res.text}"
-
-        return res.json()
+        return self.rest_request("PUT", url, *args, **kwargs)
 
     def rest_delete(self, url, *args, **kwargs):
-        url = f"{self.api_url}/{url}"
-        res = requests.delete(url, *args, **kwargs)
-        assert res.ok, f"delete url '{url}' failed. message: {res.text}"
-
-        return res.json()
+        return self.rest_request("DELETE", url, *args, **kwargs)
 
     #########
     # Model #
     #########
     def get_all(self, model_cls: IModel, **kwargs) -> List[dict]:
         query_kwargs = get_query_kwargs(kwargs)
+        if query_kwargs.get("_fields") is not None:
+            query_kwargs["_fields"] = ",".join(query_fields(model_cls, query_kwargs["_fields"]))
         res = self.rest_get(model_cls.table_key(), params=query_kwargs)
         return res
 
@@ -101,8 +171,18 @@ class RESTHandler(Handler):
 
         return res
 
-    def _create_bulk(self, model_cls: IModel, ikwargs: List[dict]) -> List[int]:
-        res = self.rest_post(f"{model_cls.table_key()}/bulk", json=ikwargs)
+    def _create_bulk(self, model_cls: IModel, ikwargs: List[dict], deps: List[tuple] = None) -> List[int]:
+        if deps:
+            # dependencies refer to models by index, created in a single request (transaction)
+            return self.rest_post(
+                f"{model_cls.table_key()}/bulk", json=dict(models=ikwargs, deps=[list(d) for d in deps])
+            )
+
+        # post in chunks to bound request body size
+        chunk_size = self.config["handler"]["bulk_chunk_size"]
+        res = []
+        for start in range(0, len(ikwargs), chunk_size):
+            res += self.rest_post(f"{model_cls.table_key()}/bulk", json=ikwargs[start : start + chunk_size])
 
         return res
 
@@ -116,6 +196,12 @@ class RESTHandler(Handler):
     def _update(self, model_cls: IModel, model_id, **ikwargs):
         self.rest_put(f"{model_cls.table_key()}/{model_id}", json=ikwargs)
 
+    def _update_bulk(self, model_cls: IModel, ikwargs: List[dict]):
+        # put in chunks to bound request body size
+        chunk_size = self.config["handler"]["bulk_chunk_size"]
+        for start in range(0, len(ikwargs), chunk_size):
+            self.rest_put(f"{model_cls.table_key()}/bulk", json=ikwargs[start : start + chunk_size])
+
     def update_all(self, model_cls: IModel, **ikwargs):
         self.rest_put(f"{model_cls.table_key()}", json=ikwargs)
 
@@ -123,16 +209,73 @@ class RESTHandler(Handler):
     # Custom Queries #
     ##################
 
+    def _long_poll_params(self, kwargs: dict) -> dict:
+        # explicit _timeout overrides the config long poll timeout
+        if kwargs.get("_timeout") is None:
+            kwargs = dict(kwargs, _timeout=self.config["handler"]["long_poll_timeout"])
+        if kwargs["_timeout"] is None:
+            kwargs.pop("_timeout")
+
+        return kwargs
+
+    def _long_poll_timeout(self, params: dict):
+        return self.timeout(params.get("_timeout") or 0)
+
+    def _set_long_polled(self, action: EAction, params: dict):
+        self._long_polled = action == EAction.WAIT and bool(params.get("_timeout"))
+
+    def wait_for_tasks(self, timeout: float):
+        # server held the request until tasks changes or timeout, poll again immediately
+        if self._long_polled:
+            self._long_polled = False
+            return
+
+        super().wait_for_tasks(timeout)
+
     def take_next_task(self, **kwargs) -> Tuple:
         from ..models import Task
 
-        res = self.rest_get("custom_query/take_next_task", params=kwargs)
+        params = self._long_poll_params(kwargs)
+        res = self.rest_get("custom_query/take_next_task", params=params, timeout=self._long_poll_timeout(params))
 
         action = EAction(res["action"])
+        self._set_long_polled(action, params)
         task = self.from_interface(Task, res["task"]) if res["task"] is not None else None
 
         return (action, task)
 
+    def take_next_tasks(self, **kwargs) -> Tuple:
+        from ..models import Task
+
+        params = self._long_poll_params(kwargs)
+        res = self.rest_get("custom_query/take_next_tasks", params=params, timeout=self._long_poll_timeout(params))
+
+        action = EAction(res["action"])
+        self._set_long_polled(action, params)
+        tasks = self.from_interface(Task, res["tasks"])
+
+        return (action, tasks)
+
+    def pulse_tasks(self, task_ids: List[int], pulse_time: datetime = None):
+        if not task_ids:
+            return
+
+        if pulse_time is None:
+            pulse_time = datetime.now()
+
+        self.rest_put(
+            "custom_query/pulse_tasks",
+            json=dict(task_ids=list(task_ids), pulse_time=self.m2i_serialize()[datetime](pulse_time)),
+        )
+
+    def add_task_deps(self, deps: List[Tuple[int, int]]):
+        self.rest_post("custom_query/task_deps", json=dict(deps=[list(d) for d in deps]))
+
+    def jobs_frontier(self, job_id: int = None):
+        res = self.rest_get(f"custom_query/jobs_frontier", params=dict(job_id=job_id))
+
+        return res
+
     def tasks_status(self, **kwargs):
         res = self.rest_get(f"custom_query/tasks_status", params=kwargs)
 
@@ -5,7 +5,7 @@ from datetime import datetime
 
 from ..imodel import IModel
 from .handler import to_datetime, from_datetime
-from .db_handler import DBHandler, transaction_decorator
+from .db_handler import DBHandler
 
 
 class SqliteConnection(NamedTuple):
@@ -76,16 +76,63 @@ class SQLite3DBHandler(DBHandler):
     def timestamp(self, ts):
         return f"'{ts}'"
 
+    @property
+    def current_timestamp(self):
+        # local time with fraction seconds, as python datetime timestamps are stored
+        return "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"
+
+    def current_timestamp_offset(self, seconds: float):
+        return f"strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime', '{float(seconds):+f} seconds')"
+
     @property
     def for_update(self):
         return ""
 
     def connect(self):
-        conn = sqlite3.connect(self.db_path)
+        # pooled connections are used by a single thread at a time, but not necessarily the creating thread
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
         conn.set_trace_callback(self.debug)
 
         return conn
 
+    def create_task_counters_triggers(self, c: sqlite3.Cursor):
+        # zero counters are kept (filtered by status queries, removed by rebuild)
+        def add(row, delta):
+            return (
+                "INSERT INTO task_counters (job_id, level, name, status, count) "
+                f"SELECT {row}.job_id, COALESCE({row}.level, 0), COALESCE({row}.name, ''), {row}.status, {delta} "
+                # job delete cascades to its counters before its tasks
+                f"WHERE {row}.status IS NOT NULL AND EXISTS (SELECT 1 FROM jobs WHERE job_id = {row}.job_id) "
+                "ON CONFLICT (job_id, level, name, status) DO UPDATE SET count = count + excluded.count;"
+            )
+
+        c.execute(f"CREATE TRIGGER task_counters_insert AFTER INSERT ON tasks BEGIN {add('NEW', 1)} END")
+        c.execute(f"CREATE TRIGGER task_counters_delete AFTER DELETE ON tasks BEGIN {add('OLD', -1)} END")
+        c.execute(
+            "CREATE TRIGGER task_counters_update AFTER UPDATE OF job_id, level, name, status ON tasks "
+            "WHEN OLD.job_id IS NOT NEW.job_id OR OLD.level IS NOT NEW.level "
+            "OR OLD.name IS NOT NEW.name OR OLD.status IS NOT NEW.status "
+            f"BEGIN {add('OLD', -1)} {add('NEW', 1)} END"
+        )
+
+    def create_task_deps_triggers(self, c: sqlite3.Cursor):
+        from ..models import EStatus
+
+        children_query = "SELECT task_id FROM task_deps WHERE parent_id = NEW.task_id"
+        # a failure fails all pending descendants in a single update (recursive cte), the trigger is not fired
+        # recursively by the propagated failures (recursive_triggers is off) so dag depth is not bounded by the
+        # triggers recursion depth.
+        c.execute(
+            "CREATE TRIGGER task_deps_status AFTER UPDATE OF status ON tasks "
+            "WHEN OLD.status IS NOT NEW.status AND EXISTS (SELECT 1 FROM task_deps WHERE parent_id = NEW.task_id) "
+            "BEGIN "
+            f"UPDATE tasks SET blockers = blockers - 1 WHERE NEW.status = '{EStatus.SUCCESS}' AND task_id IN ({children_query}); "
+            f"UPDATE tasks SET blockers = blockers + 1 WHERE OLD.status = '{EStatus.SUCCESS}' AND task_id IN ({children_query}); "
+            f"UPDATE tasks SET status = '{EStatus.FAILURE}', done_time = {self.current_timestamp}, pulse_time = {self.current_timestamp} "
+            f"WHERE NEW.status = '{EStatus.FAILURE}' AND status = '{EStatus.PENDING}' AND task_id IN ({self.descendants_query('NEW.task_id')}); "
+            "END"
+        )
+
     def transaction_start(self, c: sqlite3.Cursor, exclusive=False):
         # enable foreign keys for each connection (sqlite default is off)
         # https://www.sqlite.org/foreignkeys.html
@@ -100,19 +147,34 @@ class SQLite3DBHandler(DBHandler):
         if exclusive:
             conn.commit()
 
-    @transaction_decorator()
-    def _create_bulk(self, c: sqlite3.Cursor, model_cls: IModel, ikwargs: List[dict]) -> List[int]:
-        # todo: consolidate all ikwargs with same keys to single insert command
-        model_ids = []
-        for v in ikwargs:
-            d = {k: v for k, v in v.items() if model_cls.id_key() not in k}
-            keys = list(d.keys())
-            values = list(d.values())
-            c.execute(
-                f'INSERT INTO {model_cls.table_key()} ({", ".join(keys)}) VALUES ({", ".join([self.format_symbol] * len(keys))})',
-                values,
-            )
-            model_id = c.lastrowid
-            model_ids.append(model_id)
+    def _insert_rows(self, c: sqlite3.Cursor, model_cls: IModel, keys: List[str], rows: List[list]) -> List[int]:
+        c.executemany(
+            f'INSERT INTO {model_cls.table_key()} ({", ".join(keys)}) VALUES ({", ".join([self.format_symbol] * len(keys))})',
+            rows,
+        )
+        # the transaction holds the db write lock, hence autoincrement ids are consecutive
+        c.execute("SELECT last_insert_rowid()")
+        last_id = c.fetchone()[0]
+        model_ids = list(range(last_id - len(rows) + 1, last_id + 1))
 
         return model_ids
+
+    def _claim_tasks(self, c: sqlite3.Cursor, select_query: str, now: datetime) -> List[dict]:
+        from ..models import EStatus
+
+        # UPDATE ... RETURNING requires sqlite >= 3.35, claims run in an exclusive transaction so the selected tasks
+        # are claimed (and read back) as is
+        c.execute(select_query)
+        task_ids = ", ".join([str(row[0]) for row in c.fetchall()])
+        if not task_ids:
+            return []
+
+        c.execute(
+            f"UPDATE tasks SET status = '{EStatus.RUNNING}', take_time = {self.timestamp(now)}, pulse_time = {self.timestamp(now)} "
+            f"WHERE task_id IN ({task_ids})"
+        )
+        c.execute(f"SELECT * FROM tasks WHERE task_id IN ({task_ids})")
+        rows = c.fetchall()
+        col_names = [description[0] for description in c.description]
+
+        return [dict(zip(col_names, row)) for row in rows]
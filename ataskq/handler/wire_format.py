@@ -0,0 +1,114 @@
+from abc import abstractmethod
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Dict
+import base64
+import json
+
+from ..imodel import IModelSerializer
+from .handler import from_datetime, to_datetime
+
+try:
+    import msgpack
+except ModuleNotFoundError:
+    msgpack = None
+
+# integer timestamps epoch (naive datetimes)
+__EPOCH__ = datetime(1970, 1, 1)
+
+
+class WireFormat(IModelSerializer):
+    """REST api payloads encoding (content type, model types serialization and body encoding)."""
+
+    content_type: str = None
+
+    @staticmethod
+    @abstractmethod
+    def dumps(obj) -> bytes:
+        pass
+
+    @staticmethod
+    @abstractmethod
+    def loads(data: bytes):
+        pass
+
+
+class JSONFormat(WireFormat):
+    """json body, string datetimes and base64 bytes (default)."""
+
+    content_type = "application/json"
+
+    @staticmethod
+    def m2i_serialize():
+        type_handlers = {
+            datetime: lambda v: from_datetime(v),
+            Enum: lambda v: v.value,
+            bytes: lambda v: base64.b64encode(v).decode("ascii"),
+        }
+
+        return type_handlers
+
+    @staticmethod
+    def i2m_serialize():
+        type_handlers = {datetime: lambda v: to_datetime(v), bytes: lambda v: base64.b64decode(v.encode("ascii"))}
+
+        return type_handlers
+
+    @staticmethod
+    def dumps(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+    @staticmethod
+    def loads(data: bytes):
+        return json.loads(data)
+
+
+class MsgpackFormat(WireFormat):
+    """msgpack body, raw bytes and integer (microseconds since epoch) datetimes."""
+
+    content_type = "application/msgpack"
+
+    @staticmethod
+    def m2i_serialize():
+        type_handlers = {
+            datetime: lambda v: (v - __EPOCH__) // timedelta(microseconds=1),
+            Enum: lambda v: v.value,
+        }
+
+        return type_handlers
+
+    @staticmethod
+    def i2m_serialize():
+        type_handlers = {
+            datetime: lambda v: __EPOCH__ + timedelta(microseconds=v),
+            bytes: lambda v: bytes(v),
+        }
+
+        return type_handlers
+
+    @staticmethod
+    def dumps(obj) -> bytes:
+        return msgpack.packb(obj, use_bin_type=True)
+
+    @staticmethod
+    def loads(data: bytes):
+        return msgpack.unpackb(data, raw=False)
+
+
+__WIRE_FORMATS__: Dict[str, WireFormat] = {"json": JSONFormat, "msgpack": MsgpackFormat}
+
+
+def get_wire_format(name: str) -> WireFormat:
+    assert name in __WIRE_FORMATS__, f"unsupported wire format '{name}', supported: {list(__WIRE_FORMATS__.keys())}"
+    if name == "msgpack" and msgpack is None:
+        raise Exception("install msgpack for using ataskq msgpack wire format.")
+
+    return __WIRE_FORMATS__[name]
+
+
+def from_content_type(content_type: str) -> WireFormat:
+    """wire format of content type / accept header, defaults to json"""
+    if content_type and MsgpackFormat.content_type in content_type and msgpack is not None:
+        return MsgpackFormat
+
+    return JSONFormat
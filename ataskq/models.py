@@ -1,9 +1,8 @@
-from typing import Union, List, Dict
+from typing import Union, List, Dict, Iterable, Callable
 from enum import Enum
 import pickle
 from importlib import import_module
 from datetime import datetime
-from copy import copy
 
 from .imodel import IModel, IModelSerializer
 from .handler import get_handler, Handler
@@ -35,6 +34,32 @@ class EStatus(str, Enum):
         return self.value
 
 
+# per process resolved entrypoints cache (inherited by forked workers)
+__ENTRYPOINTS__: Dict[str, Callable] = dict()
+
+
+def load_entrypoint(ep: str) -> Callable:
+    """resolve '<module>.<func>' entrypoint, resolved entrypoints are cached per process"""
+    func = __ENTRYPOINTS__.get(ep)
+    if func is not None:
+        return func
+
+    assert "." in ep, "entry point must be inside a module."
+    module_name, func_name = ep.rsplit(".", 1)
+    try:
+        m = import_module(module_name)
+    except ImportError as ex:
+        raise RuntimeError(f"Failed to load module '{module_name}'. Exception: '{ex}'")
+    assert hasattr(
+        m, func_name
+    ), f"failed to load entry point, module '{module_name}' doen't have func named '{func_name}'."
+    func = getattr(m, func_name)
+    assert callable(func), f"entry point is not callable, '{module_name}.{func}'."
+    __ENTRYPOINTS__[ep] = func
+
+    return func
+
+
 class EntryPoint:
     @staticmethod
     def init(kwargs) -> None:
@@ -68,16 +93,7 @@ class EntryPoint:
         ep = self.entrypoint
 
         try:
-            assert "." in ep, "entry point must be inside a module."
-            module_name, func_name = ep.rsplit(".", 1)
-            m = import_module(module_name)
-            assert hasattr(
-                m, func_name
-            ), f"failed to load entry point, module '{module_name}' doen't have func named '{func_name}'."
-            func = getattr(m, func_name)
-            assert callable(func), f"entry point is not callable, '{module_name}.{func}'."
-        except ImportError as ex:
-            raise EntrypointLoadRuntimeError(f"Failed to load module '{module_name}'. Exception: '{ex}'")
+            func = load_entrypoint(ep)
         except Exception as ex:
             raise EntrypointLoadRuntimeError(f"Failed to load entry point '{ep}'. Exception: '{ex}'") from ex
 
@@ -236,7 +252,24 @@ class Model(IModel):
 
     def to_interface(self, serializer: IModelSerializer) -> dict:
         """model to interface"""
-        ret = self.m2i(self.__dict__, serializer)
+        ret = self.m2i(self._mkwargs(), serializer)
+
+        return ret
+
+    def _mkwargs(self) -> dict:
+        """model members (annotated fields) dict, non member attributes are excluded"""
+        return {k: v for k, v in self.__dict__.items() if k in self.__annotations__}
+
+    @classmethod
+    def _create_deps(cls, models: list):
+        """dependencies created with models (see Handler.create_bulk), models are the created items (models or dicts)"""
+        return None
+
+    @classmethod
+    def _partial(cls, mkwargs: dict):
+        """lightweight partial model of projected fields only (not projected fields are not set)"""
+        ret = cls.__new__(cls)
+        ret.__dict__.update(mkwargs)
 
         return ret
 
@@ -259,8 +292,11 @@ class Model(IModel):
         return ret
 
     @classmethod
-    def get_all(cls, _handler: Handler = None, **kwargs):
-        ret = cls.get_all_dict(_handler=_handler, **kwargs)
+    def get_all(cls, _handler: Handler = None, _fields: Union[str, List[str]] = None, **kwargs):
+        ret = cls.get_all_dict(_handler=_handler, _fields=_fields, **kwargs)
+        if _fields is not None:
+            return [cls._partial(r) for r in ret]
+
         ret = [cls(**r, _serialize=False) for r in ret]
 
         return ret
@@ -287,7 +323,7 @@ class Model(IModel):
             assert (
                 getattr(self, self.id_key()) is None
             ), f"id '{self.id_key()}' can't be assigned when creating '{self.__class__.__name__}({self.table_key()})'"
-            mkwargs = copy(self.__dict__)
+            mkwargs = self._mkwargs()
             mkwargs.pop(self.id_key())
 
         assert (
@@ -297,8 +333,12 @@ class Model(IModel):
         if _handler is None:
             _handler = get_handler(assert_registered=True)
 
-        ikwargs = self.m2i(mkwargs, _handler)
-        model_id = _handler._create(self.__class__, **ikwargs)
+        deps = self._create_deps([self])
+        if deps:
+            model_id = _handler.create_bulk(self.__class__, [mkwargs], deps=deps)[0]
+        else:
+            ikwargs = self.m2i(mkwargs, _handler)
+            model_id = _handler._create(self.__class__, **ikwargs)
 
         setattr(self, self.id_key(), model_id)
 
@@ -309,7 +349,7 @@ class Model(IModel):
             assert (
                 getattr(self, self.id_key()) is not None
             ), f"id '{self.id_key()}' must be assigned when updating '{self.__class__.__name__}({self.table_key()})'"
-            mkwargs = copy(self.__dict__)
+            mkwargs = self._mkwargs()
             mkwargs.pop(self.id_key())
 
         assert (
@@ -350,29 +390,17 @@ class Model(IModel):
 
         return self
 
-    def add_children(
-        self,
-        child_cls: IModel,
-        children: Union[Union[IModel, dict], List[Union[IModel, dict]]],
-        _handler: Handler = None,
-    ):
-        if not children:
-            return
-
-        if not isinstance(children, list):
-            children = [children]
-
-        assert child_cls in self.children(), f"no children association defined for '{child_cls}'"
+    def _add_children_chunk(self, child_cls: IModel, children: list, first_index: int, _handler: Handler):
         parent_key = self.children()[child_cls]
         parent_key_val = getattr(self, self.id_key())
 
         children_mkwargs = []
-        for i, c in enumerate(children):
+        for i, c in enumerate(children, first_index):
             if isinstance(c, child_cls):
                 assert (
                     getattr(c, c.id_key()) is None
                 ), f"id '{child_cls.id_key()}' can't be assigned when creating '{child_cls.__name__}({child_cls.table_key()})'"
-                mkwargs = copy(c.__dict__)
+                mkwargs = c._mkwargs()
                 mkwargs.pop(c.id_key())
             elif isinstance(c, dict):
                 mkwargs = c
@@ -386,17 +414,60 @@ class Model(IModel):
             mkwargs[parent_key] = parent_key_val
             children_mkwargs.append(mkwargs)
 
+        child_ids = _handler.create_bulk(child_cls, children_mkwargs, deps=child_cls._create_deps(children))
+        for cid, c in zip(child_ids, children):
+            if isinstance(c, child_cls):
+                setattr(c, parent_key, parent_key_val)
+                setattr(c, child_cls.id_key(), cid)
+
+        return child_ids
+
+    def add_children(
+        self,
+        child_cls: IModel,
+        children: Union[Union[IModel, dict], Iterable[Union[IModel, dict]]],
+        _handler: Handler = None,
+        _chunk_size: int = None,
+    ):
+        """Create children of current model.
+
+        children are inserted in chunks of _chunk_size (default handler 'handler.bulk_chunk_size' config),
+        any iterable (e.g. generator) of children is consumed chunk by chunk so memory is bounded by the chunk size.
+
+        Returns:
+            list of created children ids (model children are assigned with their created ids).
+        """
+        if isinstance(children, list) and not children:
+            return []
+
+        if isinstance(children, (child_cls, dict)):
+            children = [children]
+
+        assert child_cls in self.children(), f"no children association defined for '{child_cls}'"
+
         if _handler is None:
             _handler = get_handler(assert_registered=True)
 
-        child_ids = _handler.create_bulk(child_cls, children_mkwargs)
-        for cid, c in zip(child_ids, children):
-            setattr(c, parent_key, parent_key_val)
-            setattr(c, child_cls.id_key(), cid)
+        if _chunk_size is None:
+            _chunk_size = _handler.config["handler"]["bulk_chunk_size"]
+        assert _chunk_size > 0, "chunk size must be positive"
+
+        child_ids = []
+        chunk = []
+        first_index = 0
+        for c in children:
+            chunk.append(c)
+            if len(chunk) == _chunk_size:
+                child_ids.extend(self._add_children_chunk(child_cls, chunk, first_index, _handler))
+                first_index += len(chunk)
+                chunk = []
 
-        return children
+        if chunk:
+            child_ids.extend(self._add_children_chunk(child_cls, chunk, first_index, _handler))
 
-    def get_children_dict(self, child_cls: IModel, _handler: Handler = None):
+        return child_ids
+
+    def get_children_dict(self, child_cls: IModel, _handler: Handler = None, _fields: Union[str, List[str]] = None):
         assert child_cls in self.children(), f"no children association defined for '{child_cls}'"
         parent_key = self.children()[child_cls]
         primary_key_val = getattr(self, self.id_key())
@@ -404,13 +475,16 @@ class Model(IModel):
         if _handler is None:
             _handler = get_handler(assert_registered=True)
 
-        ikwargs = _handler.get_all(child_cls, **{f"{parent_key}": primary_key_val})
+        ikwargs = _handler.get_all(child_cls, _fields=_fields, **{f"{parent_key}": primary_key_val})
         mkwargs = child_cls.i2m(ikwargs, _handler)
 
         return mkwargs
 
-    def get_children(self, child_cls: IModel, _handler: Handler = None):
-        mkwargs = self.get_children_dict(child_cls, _handler)
+    def get_children(self, child_cls: IModel, _handler: Handler = None, _fields: Union[str, List[str]] = None):
+        mkwargs = self.get_children_dict(child_cls, _handler, _fields=_fields)
+        if _fields is not None:
+            return [child_cls._partial(kw) for kw in mkwargs]
+
         ret = [child_cls(**kw, _serialize=False) for kw in mkwargs]
 
         return ret
@@ -430,8 +504,13 @@ class Task(Model, EntryPoint):
     description: str
     # summary_cookie = None,
     job_id: int
+    # number of upstream dependencies not succeeded yet, task is claimable when 0 (maintained by db)
+    blockers: int
 
-    __DEFAULTS__ = dict(status=EStatus.PENDING, entrypoint="", level=0.0)
+    __DEFAULTS__ = dict(status=EStatus.PENDING, entrypoint="", level=0.0, blockers=0)
+
+    # upstream dependencies (tasks or task ids), registered on create (not a db member)
+    depends_on = None
 
     @staticmethod
     def id_key():
@@ -441,14 +520,70 @@ class Task(Model, EntryPoint):
     def table_key():
         return "tasks"
 
-    def __init__(self, **kwargs) -> None:
+    def __init__(self, depends_on: Iterable[Union["Task", int]] = None, **kwargs) -> None:
+        """depends_on - upstream tasks (or task ids), the task runs as soon as they succeed and fails if any of them
+        fails. levels still run in order so dependencies must share the task level (a higher level dependency is
+        rejected, a lower level one is already met by the level order)."""
         EntryPoint.init(kwargs)
+        if depends_on is not None:
+            depends_on = list(depends_on)
+            # not claimable until dependencies are registered
+            kwargs.setdefault("blockers", len(depends_on))
         Model.__init__(self, **kwargs)
+        self.depends_on = depends_on
+
+    @classmethod
+    def _create_deps(cls, models: list):
+        tasks = [(i, task) for i, task in enumerate(models) if isinstance(task, Task) and task.depends_on]
+        if not tasks:
+            return None
+
+        # parents created with the tasks are referred by index
+        indices = {id(task): i for i, task in enumerate(models) if isinstance(task, Task)}
+        deps = []
+        for i, task in tasks:
+            for parent in task.depends_on:
+                if isinstance(parent, Task) and parent.task_id is None:
+                    assert id(parent) in indices, f"task '{task}' dependency must be created before (or with) the task"
+                    deps.append((i, None, indices[id(parent)]))
+                else:
+                    deps.append((i, parent.task_id if isinstance(parent, Task) else parent, None))
+
+        return deps
 
     def __str__(self):
         return f"{self.name}({self.task_id})" if self.name else f"{self.task_id}"
 
 
+class StateKWArg(Model, EntryPoint):
+    """job state kwarg, entrypoint(*targs) creates an object once per worker process which is injected to the job tasks
+    entrypoints with a parameter named as the state kwarg name."""
+
+    state_kwargs_id: int
+    name: str
+    entrypoint: str
+    targs: bytes
+    description: str
+    job_id: int
+
+    __DEFAULTS__ = dict(entrypoint="")
+
+    @staticmethod
+    def id_key():
+        return "state_kwargs_id"
+
+    @staticmethod
+    def table_key():
+        return "state_kwargs"
+
+    def __init__(self, **kwargs) -> None:
+        EntryPoint.init(kwargs)
+        Model.__init__(self, **kwargs)
+
+    def __str__(self):
+        return f"{self.name}({self.state_kwargs_id})"
+
+
 class Job(Model):
     job_id: int
     name: str
@@ -467,16 +602,23 @@ class Job(Model):
     def children():
         return {
             Task: "job_id",
+            StateKWArg: "job_id",
         }
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-    def get_tasks(self, _handler=None) -> List[Task]:
-        return self.get_children(Task, _handler=_handler)
+    def get_tasks(self, _handler=None, _fields: Union[str, List[str]] = None) -> List[Task]:
+        return self.get_children(Task, _handler=_handler, _fields=_fields)
+
+    def add_tasks(self, tasks: Iterable[Task], _handler=None, _chunk_size: int = None):
+        return self.add_children(Task, tasks, _handler=_handler, _chunk_size=_chunk_size)
+
+    def get_state_kwargs(self, _handler=None) -> List[StateKWArg]:
+        return self.get_children(StateKWArg, _handler=_handler)
 
-    def add_tasks(self, tasks: List[Task], _handler=None):
-        return self.add_children(Task, tasks, _handler=_handler)
+    def add_state_kwargs(self, state_kwargs: Iterable[StateKWArg], _handler=None):
+        return self.add_children(StateKWArg, state_kwargs, _handler=_handler)
 
 
-__MODELS__: Dict[str, Model] = {m.table_key(): m for m in [Task, Job]}
+__MODELS__: Dict[str, Model] = {m.table_key(): m for m in [Task, StateKWArg, Job]}
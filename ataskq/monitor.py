@@ -1,24 +1,50 @@
-from threading import Thread, Event
+from threading import Thread, Event, Lock
+from typing import Dict
 
-from .models import Task, EStatus
+from .models import Task
 
 
 class MonitorThread(Thread):
+    """Process tasks monitor, pulses all monitored tasks of the process in a single batch every pulse interval."""
+
     # task runner is .task_runner TaskRunner, avoiding circular import
-    def __init__(self, task: Task, ataskq, pulse_interval: float = 60) -> None:
+    def __init__(self, ataskq, pulse_interval: float = 60) -> None:
         from .taskq import TaskQ  # here to avoid circular dependency
 
         super().__init__(daemon=True)
         self._stop_event = Event()
-        self._task = task
+        self._lock = Lock()
+        self._tasks: Dict[int, Task] = dict()
         self._ataskq: TaskQ = ataskq
         self._pulse_interval = pulse_interval
 
+    def add(self, task: Task):
+        with self._lock:
+            self._tasks[task.task_id] = task
+
+    def remove(self, task: Task):
+        with self._lock:
+            self._tasks.pop(task.task_id, None)
+
+    @property
+    def task_ids(self):
+        with self._lock:
+            return list(self._tasks.keys())
+
+    def pulse(self):
+        task_ids = self.task_ids
+        if not task_ids:
+            return
+
+        try:
+            self._ataskq.handler.pulse_tasks(task_ids)
+        except Exception:
+            self._ataskq.warning(f"Failed to pulse tasks {task_ids}.", exc_info=True)
+
     def run(self) -> None:
-        self._ataskq.info(f"Running monitor thread for task '{self._task}'")
-        while not self._stop_event.is_set():
-            self._ataskq.update_task_status(self._task, EStatus.RUNNING)
-            self._stop_event.wait(self._pulse_interval)
+        self._ataskq.info(f"Running monitor thread, pulse interval {self._pulse_interval} sec")
+        while not self._stop_event.wait(self._pulse_interval):
+            self.pulse()
 
     def stop(self):
         self._stop_event.set()
@@ -1,7 +1,9 @@
 import asyncio
 import logging
+import time
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
@@ -11,15 +13,14 @@ from ataskq.env import ATASKQ_SERVER_CONFIG
 logger = logging.getLogger("uvicorn")
 
 
-def db_handler() -> DBHandler:
-    return from_config(ATASKQ_SERVER_CONFIG or "server")
-
-
-async def set_timeout_tasks_task():
-    dbh = db_handler()
+async def set_timeout_tasks_task(dbh: DBHandler):
     while True:
         logger.info(f"Set Timeout Tasks - {dbh.config['background']['pulse_timeout_interval']} sec interval")
-        dbh.fail_pulse_timeout_tasks(dbh.config["monitor"]["pulse_timeout"])
+        await run_in_threadpool(
+            dbh.fail_pulse_timeout_tasks,
+            dbh.config["monitor"]["pulse_timeout"],
+            interval_sec=dbh.config["background"]["pulse_timeout_interval"],
+        )
         await asyncio.sleep(dbh.config["background"]["pulse_timeout_interval"])
 
 
@@ -27,16 +28,22 @@ async def set_timeout_tasks_task():
 async def lifespan(app: FastAPI):
     logger.info("enter lifspan")
 
+    # handler created once, shared by background tasks
+    start = time.perf_counter()
+    app.state.handler = from_config(ATASKQ_SERVER_CONFIG or "server")
     logger.info("init db")
-    db_handler().init_db()
+    app.state.handler.init_db()
+    app.state.startup_time = time.perf_counter() - start
+    logger.info(f"Background startup took {app.state.startup_time:.3f} sec")
 
-    task = asyncio.create_task(set_timeout_tasks_task())
+    task = asyncio.create_task(set_timeout_tasks_task(app.state.handler))
 
     # Load the ML model
     yield
     # Clean up the ML models and release the resources
     logger.info("cancel task")
     task.cancel()
+    app.state.handler.close()
     logger.info("exit lifspan")
 
 
@@ -56,3 +63,8 @@ app.add_middleware(
 @app.get("/health")
 async def health():
     return "Background manager is running"
+
+
+@app.get("/stats")
+async def stats(request: Request):
+    return dict(startup_time=request.app.state.startup_time, pool=request.app.state.handler.pool.stats())
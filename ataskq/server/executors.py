@@ -0,0 +1,52 @@
+import asyncio
+import functools
+import time
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+# current request times (sec): db calls (including executors queue time) and long poll wait
+request_times: ContextVar[dict] = ContextVar("request_times", default=None)
+
+
+class Executor:
+    """Bounded thread pool for blocking db calls of the server.
+
+    Calls run off the event loop on at most `max_workers` threads. Calls beyond `max_pending`
+    (running and queued) are rejected with 503 (back-pressure) instead of queueing without bound.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_pending: int) -> None:
+        self._name = name
+        self._max_pending = max_pending
+        self._pending = 0  # accessed by the event loop thread only
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"ataskq-{name}")
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def pending(self):
+        return self._pending
+
+    async def run(self, func, *args, **kwargs):
+        if self._pending >= self._max_pending:
+            raise HTTPException(
+                status_code=503, detail=f"server '{self._name}' executor is busy", headers={"Retry-After": "1"}
+            )
+
+        self._pending += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._pool, functools.partial(func, *args, **kwargs)
+            )
+        finally:
+            self._pending -= 1
+            if (times := request_times.get()) is not None:
+                times["db"] += time.perf_counter() - start
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
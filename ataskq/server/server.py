@@ -1,29 +1,167 @@
 import logging
 import asyncio
+import time
+from datetime import datetime
 from pathlib import Path
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Request, Depends
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi import FastAPI, Request, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, RedirectResponse, Response, JSONResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
 
-from ataskq.handler import DBHandler, from_config
-from ataskq.handler.rest_handler import RESTHandler as rh
+from ataskq.handler import DBHandler, EAction, from_config
+from ataskq.handler.handler import next_cursor
+from ataskq.handler.wire_format import WireFormat, JSONFormat, from_content_type
 from ataskq.models import Model, __MODELS__
 from ataskq.env import ATASKQ_SERVER_CONFIG
+from ataskq.config import load_config
+from .executors import Executor, request_times
+from .stats import ServerStats
 
 # from .form_utils import form_data_array
 
 logger = logging.getLogger("uvicorn")
 
 
-# DB Handler
-def db_handler() -> DBHandler:
-    return from_config(ATASKQ_SERVER_CONFIG or "server")
+# DB Handler, created once per server worker at startup
+async def db_handler(request: Request) -> DBHandler:
+    return request.app.state.handler
 
 
-app = FastAPI()
+def claim_executor(request: Request) -> Executor:
+    return request.app.state.executors["claim"]
+
+
+def query_executor(request: Request) -> Executor:
+    return request.app.state.executors["query"]
+
+
+# Wire format, negotiated by request content type (body) and accept (response) headers, defaults to json
+def request_format(request: Request) -> WireFormat:
+    return from_content_type(request.headers.get("content-type"))
+
+
+def response_format(request: Request) -> WireFormat:
+    return from_content_type(request.headers.get("accept"))
+
+
+async def read_body(request: Request):
+    return request_format(request).loads(await request.body())
+
+
+def respond(request: Request, content, headers: dict = None):
+    fmt = response_format(request)
+    if fmt is JSONFormat:
+        return content if headers is None else JSONResponse(content=jsonable_encoder(content), headers=headers)
+
+    return Response(content=fmt.dumps(content), media_type=fmt.content_type, headers=headers)
+
+
+def paginate(request: Request, rows: list, keys: list, dbh: DBHandler):
+    # keyset pagination, next page cursor ('_after' query param) header
+    limit = request.query_params.get("_limit") or dbh.config["api"]["limit"]
+    cursor = next_cursor(rows, keys, limit)
+
+    return respond(request, rows, headers={"X-Next-Cursor": cursor} if cursor is not None else None)
+
+
+class TasksChanged:
+    """Wakes up long polling requests on tasks changes.
+
+    Changes are signaled by tasks writes through the server and by a single db watcher per server
+    (`DBHandler.wait_for_tasks`, db notifications or `run.pull_interval` polling fallback).
+    """
+
+    def __init__(self) -> None:
+        self._event = None
+        self._watcher = None
+
+    @property
+    def event(self) -> asyncio.Event:
+        if self._event is None:
+            self._event = asyncio.Event()
+
+        return self._event
+
+    def notify(self):
+        self.event.set()
+        self._event = asyncio.Event()
+
+    def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    def watch(self, dbh: DBHandler):
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.create_task(self._watch(dbh))
+
+    async def _watch(self, dbh: DBHandler):
+        interval = dbh.config["run"]["pull_interval"]
+        while True:
+            try:
+                await run_in_threadpool(dbh.wait_for_tasks, interval)
+            except Exception:
+                logger.warning("Tasks changes watcher failed.", exc_info=True)
+                await asyncio.sleep(interval)
+            self.notify()
+
+
+tasks_changed = TasksChanged()
+
+
+async def long_poll(request: Request, dbh: DBHandler, take_func, **kwargs):
+    # hold WAIT response up to '_timeout' sec until tasks become claimable (claims run in threadpool)
+    timeout = float(kwargs.pop("_timeout", None) or 0)
+    deadline = time.monotonic() + timeout
+    while True:
+        # changes signaled after this point wake up the wait below
+        event = tasks_changed.event
+        action, ret = await claim_executor(request).run(take_func, **kwargs)
+        remaining = deadline - time.monotonic()
+        if action != EAction.WAIT or remaining <= 0 or await request.is_disconnected():
+            return action, ret
+
+        tasks_changed.watch(dbh)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(event.wait(), remaining)
+        except asyncio.TimeoutError:
+            pass
+        if (times := request_times.get()) is not None:
+            times["wait"] += time.perf_counter() - start
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # config, handler (connections pool) and db calls executors are shared by all requests of the worker
+    start = time.perf_counter()
+    config = load_config(ATASKQ_SERVER_CONFIG or "server")
+    app.state.config = config
+    app.state.handler = from_config(config)
+    # blocking db calls executors, claims (runners) lane is separated from queries (status pages, model api) lane
+    app.state.executors = {
+        lane: Executor(
+            lane, max_workers=config["server"][f"{lane}_workers"], max_pending=config["server"]["max_pending"]
+        )
+        for lane in ["claim", "query"]
+    }
+    app.state.stats = ServerStats(startup_time=time.perf_counter() - start)
+    logger.info(f"Server startup took {app.state.stats.startup_time:.3f} sec")
+
+    yield
+
+    tasks_changed.stop()
+    for e in app.state.executors.values():
+        e.shutdown()
+    app.state.handler.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 # allow all cors
@@ -33,6 +171,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Custom exception handler
@@ -47,6 +186,34 @@ app.add_middleware(
 # Example route with intentional exception
 
 
+@app.middleware("http")
+async def request_stats(request: Request, call_next):
+    # request time, server overhead is the request time not spent on db calls or long poll waits
+    start = time.perf_counter()
+    times = dict(db=0.0, wait=0.0)
+    token = request_times.set(times)
+    try:
+        response = await call_next(request)
+    finally:
+        total = time.perf_counter() - start
+        request_times.reset(token)
+    request.app.state.stats.add(total, times["db"], times["wait"])
+    response.headers["Server-Timing"] = ", ".join(
+        [f"{k};dur={v * 1000:.3f}" for k, v in dict(total=total, **times).items()]
+    )
+
+    return response
+
+
+@app.middleware("http")
+async def notify_tasks_changes(request: Request, call_next):
+    response = await call_next(request)
+    if request.method != "GET" and request.url.path.startswith(("/api/tasks", "/api/jobs")):
+        tasks_changed.notify()
+
+    return response
+
+
 # static folder
 app.mount("/www", StaticFiles(directory=Path(__file__).parent / "www"), name="www")
 
@@ -67,6 +234,15 @@ async def api():
     return {"message": "Welcome to A-TASK-Q Server API"}
 
 
+@app.get("/api/stats")
+async def stats(request: Request, dbh: DBHandler = Depends(db_handler)):
+    return dict(
+        **request.app.state.stats.to_dict(),
+        executors={lane: e.pending for lane, e in request.app.state.executors.items()},
+        pool=dbh.pool.stats(),
+    )
+
+
 ####################
 # Custom Query API #
 ####################
@@ -76,24 +252,68 @@ async def take_next_task(
     dbh: DBHandler = Depends(db_handler),
 ):
     # take next task
-    action, task = dbh.take_next_task(**request.query_params)
-    task = rh.to_interface(task) if task is not None else None
+    action, task = await long_poll(request, dbh, dbh.take_next_task, **request.query_params)
+    task = task.to_interface(response_format(request)) if task is not None else None
+
+    return respond(request, dict(action=action.value, task=task))
+
+
+@app.get("/api/custom_query/take_next_tasks")
+async def take_next_tasks(
+    request: Request,
+    dbh: DBHandler = Depends(db_handler),
+):
+    # take next tasks batch
+    action, tasks = await long_poll(request, dbh, dbh.take_next_tasks, **request.query_params)
+    tasks = [t.to_interface(response_format(request)) for t in tasks]
+
+    return respond(request, dict(action=action.value, tasks=tasks))
+
+
+@app.put("/api/custom_query/pulse_tasks")
+async def pulse_tasks(request: Request, dbh: DBHandler = Depends(db_handler)):
+    body = await read_body(request)
+    pulse_time = body.get("pulse_time")
+    if pulse_time is not None:
+        pulse_time = request_format(request).i2m_serialize()[datetime](pulse_time)
+    await claim_executor(request).run(dbh.pulse_tasks, body["task_ids"], pulse_time)
+
+    return respond(request, dict(task_ids=body["task_ids"]))
+
+
+@app.post("/api/custom_query/task_deps")
+async def add_task_deps(request: Request, dbh: DBHandler = Depends(db_handler)):
+    body = await read_body(request)
+    try:
+        await query_executor(request).run(dbh.add_task_deps, body["deps"])
+    except AssertionError as ex:
+        # invalid dependencies (missing or higher level parents, cycles)
+        raise HTTPException(status_code=400, detail=str(ex))
+    # dependencies change tasks blockers (and may fail tasks), not covered by the tasks changes middleware
+    tasks_changed.notify()
 
-    return dict(action=action, task=task)
+    return respond(request, dict(deps=len(body["deps"])))
+
+
+@app.get("/api/custom_query/jobs_frontier")
+async def jobs_frontier(request: Request, job_id: int = None, dbh: DBHandler = Depends(db_handler)):
+    ret = await claim_executor(request).run(dbh.jobs_frontier, job_id=job_id)
+
+    return respond(request, ret)
 
 
 @app.get("/api/custom_query/jobs_status")
 async def jobs_status(request: Request, dbh: DBHandler = Depends(db_handler)):
-    ret = dbh.jobs_status(**request.query_params)
+    ret = await query_executor(request).run(dbh.jobs_status, **request.query_params)
 
-    return ret
+    return paginate(request, ret, ["job_id"], dbh)
 
 
 @app.get("/api/custom_query/tasks_status")
 async def tasks_status(request: Request, dbh: DBHandler = Depends(db_handler)):
-    ret = dbh.tasks_status(**request.query_params)
+    ret = await query_executor(request).run(dbh.tasks_status, **request.query_params)
 
-    return ret
+    return paginate(request, ret, ["level", "name"], dbh)
 
 
 #############
@@ -103,65 +323,82 @@ async def tasks_status(request: Request, dbh: DBHandler = Depends(db_handler)):
 async def get_model_all(model: str, request: Request, dbh: DBHandler = Depends(db_handler)):
     # logger.info(f"query_params: {request.query_params}")
     model_cls = __MODELS__[model]
-    mkwargs = model_cls.get_all_dict(_handler=dbh, **request.query_params)
-    ikwargs = rh.m2i(model_cls, mkwargs)
+    mkwargs = await query_executor(request).run(model_cls.get_all_dict, _handler=dbh, **request.query_params)
+    ikwargs = model_cls.m2i(mkwargs, response_format(request))
 
-    return ikwargs
+    return paginate(request, ikwargs, [model_cls.id_key()], dbh)
 
 
 @app.get("/api/{model}/count")
 async def count_model_all(model: str, request: Request, dbh: DBHandler = Depends(db_handler)):
     model_cls = __MODELS__[model]
-    count = model_cls.count_all(_handler=dbh, **request.query_params)
+    count = await query_executor(request).run(model_cls.count_all, _handler=dbh, **request.query_params)
 
-    return count
+    return respond(request, count)
 
 
 @app.get("/api/{model}/{model_id}")
-async def get_model(model: str, model_id: int, dbh: DBHandler = Depends(db_handler)):
+async def get_model(model: str, model_id: int, request: Request, dbh: DBHandler = Depends(db_handler)):
     model_cls = __MODELS__[model]
-    mkwargs = model_cls.get_dict(model_id, _handler=dbh)
-    ikwargs = rh.m2i(model_cls, mkwargs)
+    mkwargs = await query_executor(request).run(model_cls.get_dict, model_id, _handler=dbh)
+    ikwargs = model_cls.m2i(mkwargs, response_format(request))
 
-    return ikwargs
+    return respond(request, ikwargs)
 
 
 @app.post("/api/{model}")
 async def create_model(model: str, request: Request, dbh: DBHandler = Depends(db_handler)):
     model_cls: Model = __MODELS__[model]
-    ikwargs = await request.json()
-    mkwargs = rh.i2m(model_cls, ikwargs)
-    model_id = dbh.create(model_cls, **mkwargs)
+    ikwargs = await read_body(request)
+    mkwargs = model_cls.i2m(ikwargs, request_format(request))
+    model_id = await query_executor(request).run(dbh.create, model_cls, **mkwargs)
 
-    return model_id
+    return respond(request, model_id)
 
 
 @app.post("/api/{model}/bulk")
 async def create_model_bulk(model: str, request: Request, dbh: DBHandler = Depends(db_handler)):
     model_cls: Model = __MODELS__[model]
-    ikwargs = await request.json()
-    mkwargs = rh.i2m(model_cls, ikwargs)
-    model_ids = dbh.create_bulk(model_cls, mkwargs)
+    body = await read_body(request)
+    # models list or models with tasks dependencies
+    ikwargs, deps = (body["models"], body["deps"]) if isinstance(body, dict) else (body, None)
+    mkwargs = model_cls.i2m(ikwargs, request_format(request))
+    try:
+        model_ids = await query_executor(request).run(dbh.create_bulk, model_cls, mkwargs, deps=deps)
+    except AssertionError as ex:
+        # invalid dependencies (missing or higher level parents, cycles)
+        raise HTTPException(status_code=400, detail=str(ex))
+
+    return respond(request, model_ids)
+
+
+@app.put("/api/{model}/bulk")
+async def update_model_bulk(model: str, request: Request, dbh: DBHandler = Depends(db_handler)):
+    model_cls: Model = __MODELS__[model]
+    ikwargs = await read_body(request)
+    mkwargs = model_cls.i2m(ikwargs, request_format(request))
+    await claim_executor(request).run(dbh.update_bulk, model_cls, mkwargs)
 
-    return model_ids
+    return respond(request, [kw[model_cls.id_key()] for kw in mkwargs])
 
 
 @app.put("/api/{model}/{model_id}")
 async def update_model(model: str, model_id: int, request: Request, dbh: DBHandler = Depends(db_handler)):
     model_cls: Model = __MODELS__[model]
-    ikwargs = await request.json()
-    mkwargs = rh.i2m(model_cls, ikwargs)
-    dbh.update(model_cls, model_id, **mkwargs)
+    ikwargs = await read_body(request)
+    mkwargs = model_cls.i2m(ikwargs, request_format(request))
+    # runners tasks status updates share the claims lane
+    await claim_executor(request).run(dbh.update, model_cls, model_id, **mkwargs)
 
-    return {model_cls.id_key(): model_id}
+    return respond(request, {model_cls.id_key(): model_id})
 
 
 @app.delete("/api/{model}/{model_id}")
-async def delete_model(model: str, model_id: int, dbh: DBHandler = Depends(db_handler)):
+async def delete_model(model: str, model_id: int, request: Request, dbh: DBHandler = Depends(db_handler)):
     model_cls: Model = __MODELS__[model]
-    dbh.delete(model_cls, model_id)
+    await query_executor(request).run(dbh.delete, model_cls, model_id)
 
-    return {model_cls.id_key(): model_id}
+    return respond(request, {model_cls.id_key(): model_id})
 
 
 #######
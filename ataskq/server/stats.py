@@ -0,0 +1,28 @@
+class ServerStats:
+    """Server worker startup time and requests time stats (sec).
+
+    Request overhead is the request time not spent on db calls or long poll waits (routing, serialization, middlewares).
+    """
+
+    def __init__(self, startup_time: float) -> None:
+        self.startup_time = startup_time
+        self.requests = 0
+        self.total_time = 0.0
+        self.overhead_time = 0.0
+        self.max_overhead_time = 0.0
+
+    def add(self, total_time: float, db_time: float, wait_time: float = 0.0):
+        overhead = max(total_time - db_time - wait_time, 0.0)
+        self.requests += 1
+        self.total_time += total_time
+        self.overhead_time += overhead
+        self.max_overhead_time = max(self.max_overhead_time, overhead)
+
+    def to_dict(self) -> dict:
+        return dict(
+            startup_time=self.startup_time,
+            requests=self.requests,
+            mean_request_time=self.total_time / self.requests if self.requests else None,
+            mean_overhead_time=self.overhead_time / self.requests if self.requests else None,
+            max_overhead_time=self.max_overhead_time,
+        )
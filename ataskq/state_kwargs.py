@@ -0,0 +1,172 @@
+from collections import OrderedDict
+from threading import RLock
+from typing import Callable, Dict, List, Tuple, Union
+import inspect
+import logging
+
+from .logger import Logger
+from .models import StateKWArg
+from .handler import Handler
+
+
+class StateKWArgsCache(Logger):
+    """Per process state kwargs objects cache.
+
+    a state kwarg entrypoint is called once per process (per job and name), the object is injected to the job tasks
+    entrypoints with a parameter named as the state kwarg (unless passed by the task targs).
+
+    at most max_size objects are cached, least recently used objects are evicted. objects injected to running tasks are
+    pinned (until released) and never evicted, the cache exceeds max_size while more objects are in use.
+    evicted (or cleared) objects are torn down: generator entrypoints are resumed after their single yield
+    (setup / yield object / teardown), otherwise the object close() is called (if exists).
+
+    job state kwargs are fetched on first use, state kwargs added later are fetched once per job entrypoint with
+    unresolved parameters (add state kwargs before running the job tasks).
+    """
+
+    def __init__(self, handler: Handler, max_size: int = None, logger: Union[str, logging.Logger, None] = None) -> None:
+        super().__init__(logger)
+        self._handler = handler
+        self._max_size = max_size
+        self._lock = RLock()
+        self._state_kwargs: Dict[int, Dict[str, StateKWArg]] = dict()  # job_id -> name -> state kwarg
+        self._params: Dict[Callable, set] = dict()  # entrypoint -> parameters names
+        self._objs: "OrderedDict[Tuple[int, str], tuple]" = OrderedDict()  # (job_id, name) -> (obj, generator)
+        self._pins: Dict[Tuple[int, str], int] = dict()  # (job_id, name) -> running tasks using the object
+        self._resolved: set = set()  # (job_id, entrypoint) with state kwargs fetched after first use
+
+    def __len__(self):
+        return len(self._objs)
+
+    def _job_state_kwargs(self, job_id: int, refresh=False) -> Dict[str, StateKWArg]:
+        # job state kwargs are fetched once per process (unless refreshed)
+        ret = self._state_kwargs.get(job_id)
+        if ret is None or refresh:
+            ret = {s.name: s for s in StateKWArg.get_all(_handler=self._handler, job_id=job_id)}
+            self._state_kwargs[job_id] = ret
+
+        return ret
+
+    def _entrypoint_params(self, func: Callable) -> set:
+        ret = self._params.get(func)
+        if ret is None:
+            try:
+                ret = set(inspect.signature(func).parameters.keys())
+            except (TypeError, ValueError):
+                # no signature (e.g. builtins)
+                ret = set()
+            self._params[func] = ret
+
+        return ret
+
+    def _create(self, state_kwarg: StateKWArg) -> tuple:
+        self.info(f"Creating state kwarg '{state_kwarg}'")
+        args, kwargs = state_kwarg.get_targs()
+        obj = state_kwarg.get_entrypoint()(*args, **kwargs)
+        if inspect.isgenerator(obj):
+            gen = obj
+            obj = next(gen)
+        else:
+            gen = None
+
+        return obj, gen
+
+    def _teardown(self, key: Tuple[int, str], obj, gen):
+        self.info(f"Tearing down state kwarg '{key[1]}' of job '{key[0]}'")
+        try:
+            if gen is not None:
+                next(gen, None)
+            elif callable(getattr(obj, "close", None)):
+                obj.close()
+        except Exception:
+            self.warning(f"State kwarg '{key[1]}' of job '{key[0]}' teardown failed.", exc_info=True)
+
+    def _evict(self, keep: Tuple[int, str] = None):
+        # evict least recently used objects not in use
+        if self._max_size is None:
+            return
+
+        for key in list(self._objs.keys()):
+            if len(self._objs) <= max(self._max_size, 1):
+                break
+            if key == keep or self._pins.get(key):
+                continue
+            self._teardown(key, *self._objs.pop(key))
+
+    def get(self, job_id: int, name: str, _pin=False):
+        """job state kwarg object, created on first use"""
+        key = (job_id, name)
+        with self._lock:
+            if key in self._objs:
+                self._objs.move_to_end(key)
+            else:
+                state_kwarg = self._job_state_kwargs(job_id).get(name)
+                if state_kwarg is None:
+                    # added after job state kwargs were fetched
+                    state_kwarg = self._job_state_kwargs(job_id, refresh=True).get(name)
+                assert state_kwarg is not None, f"job '{job_id}' has no state kwarg named '{name}'"
+                self._objs[key] = self._create(state_kwarg)
+
+            if _pin:
+                self._pins[key] = self._pins.get(key, 0) + 1
+            self._evict(keep=key)
+
+            return self._objs[key][0]
+
+    def inject(self, job_id: int, func: Callable, kwargs: dict) -> Tuple[dict, List[Tuple[int, str]]]:
+        """task kwargs with injected job state kwargs requested by func parameters.
+
+        returns (kwargs, pinned), injected objects are pinned (not evicted) until release(pinned) is called once the
+        task is done.
+        """
+        params = self._entrypoint_params(func)
+        if not params:
+            return kwargs, []
+
+        with self._lock:
+            state_kwargs = self._job_state_kwargs(job_id)
+            unresolved = params - kwargs.keys() - state_kwargs.keys()
+            if unresolved and (job_id, func) not in self._resolved:
+                # entrypoint first use, parameters may be state kwargs added after job state kwargs were fetched
+                state_kwargs = self._job_state_kwargs(job_id, refresh=True)
+                self._resolved.add((job_id, func))
+
+            names = [n for n in state_kwargs.keys() if n in params and n not in kwargs]
+            if not names:
+                return kwargs, []
+
+            pinned = []
+            try:
+                injected = dict()
+                for n in names:
+                    injected[n] = self.get(job_id, n, _pin=True)
+                    pinned.append((job_id, n))
+            except Exception:
+                self.release(pinned)
+                raise
+
+            return dict(kwargs, **injected), pinned
+
+    def release(self, pinned: List[Tuple[int, str]]):
+        """release objects pinned by inject, evicts least recently used objects exceeding max size"""
+        if not pinned:
+            return
+
+        with self._lock:
+            for key in pinned:
+                count = self._pins.get(key, 0) - 1
+                if count > 0:
+                    self._pins[key] = count
+                else:
+                    self._pins.pop(key, None)
+            self._evict()
+
+    def clear(self):
+        """tear down all cached objects (most recently used first)"""
+        with self._lock:
+            while self._objs:
+                key, (obj, gen) = self._objs.popitem()
+                self._teardown(key, obj, gen)
+            self._state_kwargs.clear()
+            self._pins.clear()
+            self._resolved.clear()
@@ -1,17 +1,26 @@
 import multiprocessing
+import asyncio
+import os
 from typing import Union
 import pickle
 import logging
 from importlib import import_module
+from importlib.util import find_spec
+import gc
 from multiprocessing import Process
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
 import time
-from typing import List
+from typing import List, Iterable, Dict
 from datetime import datetime
+from collections import deque
 
 
 from .logger import Logger
-from .models import EStatus, Job, Task
+from .models import EStatus, Job, Task, StateKWArg, load_entrypoint
 from .monitor import MonitorThread
+from .worker_pool import WorkerPool, worker_rss
+from .state_kwargs import StateKWArgsCache
 from .handler import Handler, DBHandler, from_config, EAction
 from .config import load_config
 
@@ -20,6 +29,14 @@ def targs(*args, **kwargs):
     return (args, kwargs)
 
 
+def _module_exists(name: str):
+    try:
+        return find_spec(name) is not None
+    except ModuleNotFoundError:
+        # parent is not a package (e.g. '<module>.<func>')
+        return False
+
+
 class TaskQ(Logger):
     def __init__(
         self,
@@ -54,6 +71,26 @@ class TaskQ(Logger):
         self._job = job
 
         self._running = False
+        self._monitor = None
+        self._monitor_pid = None
+        self._pulse_timeout_sweep_time = None
+        # dispatch worker process pipe, tasks updates are sent to the dispatcher instead of the db
+        self._dispatcher_conn = None
+        self._worker_pool = None
+        self._worker_stats = []
+        self._state_kwargs = None
+        self._state_kwargs_pid = None
+
+    def __getstate__(self):
+        # monitor thread, worker pool and state kwargs objects are process specific
+        state = self.__dict__.copy()
+        state["_monitor"] = None
+        state["_monitor_pid"] = None
+        state["_worker_pool"] = None
+        state["_state_kwargs"] = None
+        state["_state_kwargs_pid"] = None
+
+        return state
 
     @property
     def config(self):
@@ -79,6 +116,49 @@ class TaskQ(Logger):
     def monitor_pulse_interval(self):
         return self._monitor_pulse_interval
 
+    @property
+    def worker_stats(self) -> List[dict]:
+        """dispatch executor per worker stats, of the running (or last) run"""
+        if self._worker_pool is not None:
+            return self._worker_pool.stats()
+
+        return self._worker_stats
+
+    @property
+    def monitor(self) -> MonitorThread:
+        # single monitor thread per process
+        if self._monitor is None or self._monitor_pid != os.getpid():
+            self._monitor = MonitorThread(self, pulse_interval=self.config["monitor"]["pulse_interval"])
+            self._monitor_pid = os.getpid()
+            self._monitor.start()
+
+        return self._monitor
+
+    @property
+    def state_kwargs(self) -> StateKWArgsCache:
+        # state kwargs objects are created once per process
+        if self._state_kwargs is None or self._state_kwargs_pid != os.getpid():
+            self._state_kwargs = StateKWArgsCache(
+                self._handler, max_size=self.config["run"]["state_kwargs_cache_size"], logger=self._logger
+            )
+            self._state_kwargs_pid = os.getpid()
+
+        return self._state_kwargs
+
+    def clear_state_kwargs(self):
+        """tear down current process state kwargs objects"""
+        if self._state_kwargs is not None and self._state_kwargs_pid == os.getpid():
+            self._state_kwargs.clear()
+        self._state_kwargs = None
+        self._state_kwargs_pid = None
+
+    def _stop_monitor(self):
+        if self._monitor is not None and self._monitor_pid == os.getpid():
+            self._monitor.stop()
+            self._monitor.join()
+        self._monitor = None
+        self._monitor_pid = None
+
     def clear_job(self):
         self._job = None
 
@@ -87,10 +167,10 @@ class TaskQ(Logger):
         self._handler.set_job_id(job.job_id)  # todo remove - handler should need job id ...
         self._job = job
 
-    def create_job(self, name=None, description=None):
+    def create_job(self, name=None, description=None, priority=None):
         assert self._job is None, "job already assigned to current taskq, run clear_job to create new job."
 
-        job = Job(name=name, description=description).create(_handler=self._handler)
+        job = Job(name=name, description=description, priority=priority).create(_handler=self._handler)
         self._job = job
 
         if self.config["db"]["max_jobs"] is not None:
@@ -106,19 +186,43 @@ class TaskQ(Logger):
         self.job.delete(_handler=self.handler)
         self._job = None
 
-    def get_tasks(self) -> List[Task]:
-        return self.job.get_tasks(self._handler)
+    def get_tasks(self, fields: List[str] = None) -> List[Task]:
+        """job tasks, partial tasks with given fields only if fields is set (e.g. skip targs payload)"""
+        return self.job.get_tasks(self._handler, _fields=fields)
+
+    def add_tasks(self, tasks: Iterable[Task], chunk_size: int = None):
+        """add tasks to job, tasks can be a list or any iterable (e.g. generator), inserted in chunks of chunk_size"""
+        self.job.add_tasks(tasks, _handler=self._handler, _chunk_size=chunk_size)
+
+        return self
+
+    def get_state_kwargs(self) -> List[StateKWArg]:
+        return self.job.get_state_kwargs(self._handler)
+
+    def add_state_kwargs(self, state_kwargs: Iterable[StateKWArg]):
+        """add job state kwargs, objects created once per worker process and injected to job tasks by name.
 
-    def add_tasks(self, tasks):
-        self.job.add_tasks(tasks, _handler=self._handler)
+        state kwargs should be added before running the job tasks, running workers fetch state kwargs added later once
+        per job entrypoint.
+        """
+        self.job.add_state_kwargs(state_kwargs, _handler=self._handler)
 
         return self
 
+    def _update_task(self, task: Task, **mkwargs):
+        if self._dispatcher_conn is not None:
+            # dispatched task, updates are written by the dispatcher in batches
+            self._dispatcher_conn.send(("update", task.task_id, mkwargs))
+            for k, v in mkwargs.items():
+                setattr(task, k, v)
+        else:
+            task.update(_handler=self._handler, **mkwargs)
+
     def update_task_start_time(self, task: Task, start_time: datetime = None):
         if start_time is None:
             start_time = datetime.now()
 
-        task.update(start_time=start_time, _handler=self._handler)
+        self._update_task(task, start_time=start_time)
 
     def update_task_status(self, task: Task, status: EStatus, timestamp: datetime = None):
         if timestamp is None:
@@ -126,10 +230,10 @@ class TaskQ(Logger):
 
         if status == EStatus.RUNNING:
             # for running task update pulse_time
-            task.update(_handler=self._handler, status=status, pulse_time=timestamp)
+            self._update_task(task, status=status, pulse_time=timestamp)
         elif status == EStatus.SUCCESS or status == EStatus.FAILURE:
             # for done task update pulse_time and done_time time as well
-            task.update(_handler=self._handler, status=status, pulse_time=timestamp, done_time=timestamp)
+            self._update_task(task, status=status, pulse_time=timestamp, done_time=timestamp)
         else:
             raise RuntimeError(f"Unsupported status '{status}' for status update")
 
@@ -140,70 +244,112 @@ class TaskQ(Logger):
         )
         return ret
 
-    def _run_task(self, task: Task):
+    def _load_task(self, task: Task):
+        """load task entrypoint and targs and update task start time.
+
+        returns (func, targs, pinned) or None if task should not run (skipped or failed loading targs).
+        pinned state kwargs must be released once the task is done.
+        """
         self.info(f"Running task '{task}'")
 
         # get entry point func to execute
         ep = task.entrypoint
         if ep == "ataskq.skip_run_task":
             self.info(f"task '{task}' is marked as 'skip_run_task', skipping run task.")
-            return
+            return None
 
-        assert "." in ep, "entry point must be inside a module."
-        module_name, func_name = ep.rsplit(".", 1)
-        try:
-            m = import_module(module_name)
-        except ImportError as ex:
-            raise RuntimeError(f"Failed to load module '{module_name}'. Exception: '{ex}'")
-        assert hasattr(
-            m, func_name
-        ), f"failed to load entry point, module '{module_name}' doen't have func named '{func_name}'."
-        func = getattr(m, func_name)
-        assert callable(func), f"entry point is not callable, '{module_name},{func}'."
+        func = load_entrypoint(ep)
 
         # get targs
         if task.targs is not None:
             try:
                 targs = pickle.loads(task.targs)
             except Exception as ex:
-                if self.config["run"]["raise_exception"]:  # for debug purposes only
-                    self.warning("Getting tasks args failed.")
-                    self.update_task_status(task, EStatus.FAILURE)
-                    raise ex
-
-                self.warning("Getting tasks args failed.", exc_info=True)
-                self.update_task_status(task, EStatus.FAILURE)
-
-                return
+                return self._load_task_failure(task, "Getting tasks args failed.", ex)
         else:
             targs = ((), {})
 
+        # inject job state kwargs requested by entrypoint parameters
+        try:
+            kwargs, pinned = self.state_kwargs.inject(task.job_id, func, targs[1])
+        except Exception as ex:
+            return self._load_task_failure(task, "Getting tasks state kwargs failed.", ex)
+        targs = (targs[0], kwargs)
+
         # update task start time
-        self.update_task_start_time(task)
+        try:
+            self.update_task_start_time(task)
+        except Exception:
+            self.state_kwargs.release(pinned)
+            raise
 
-        # run task
-        monitor = MonitorThread(task, self, pulse_interval=self.config["monitor"]["pulse_interval"])
-        monitor.start()
+        return func, targs, pinned
+
+    def _load_task_failure(self, task: Task, msg: str, ex: Exception):
+        if self.config["run"]["raise_exception"]:  # for debug purposes only
+            self.warning(msg)
+            self.update_task_status(task, EStatus.FAILURE)
+            raise ex
+
+        self.warning(msg, exc_info=True)
+        self.update_task_status(task, EStatus.FAILURE)
+
+        return None
+
+    def _task_exception(self, task: Task, ex: Exception) -> EStatus:
+        msg = f"Running task '{task}' failed with exception."
+        if self.config["run"]["raise_exception"]:  # for debug purposes only
+            self.warning(msg)
+            self.update_task_status(task, EStatus.FAILURE)
+            raise ex
+
+        self.warning(msg, exc_info=True)
 
+        return EStatus.FAILURE
+
+    def _run_task(self, task: Task):
+        loaded = self._load_task(task)
+        if loaded is None:
+            return
+        func, targs, pinned = loaded
+
+        # run task
         try:
-            func(*targs[0], **targs[1])
+            ret = func(*targs[0], **targs[1])
+            if asyncio.iscoroutine(ret):
+                # coroutine entrypoint, run on a task event loop
+                asyncio.run(ret)
             status = EStatus.SUCCESS
         except Exception as ex:
-            msg = f"Running task '{task}' failed with exception."
-            if self.config["run"]["raise_exception"]:  # for debug purposes only
-                self.warning(msg)
-                self.update_task_status(task, EStatus.FAILURE)
-                monitor.stop()
-                monitor.join()
-                raise ex
-
-            self.warning(msg, exc_info=True)
-            status = EStatus.FAILURE
-
-        monitor.stop()
-        monitor.join()
+            status = self._task_exception(task, ex)
+        finally:
+            self.state_kwargs.release(pinned)
+
         self.update_task_status(task, status)
 
+    async def _run_task_async(self, task: Task):
+        # db calls and blocking entrypoints run in threads, the event loop runs coroutine entrypoints only
+        loaded = await asyncio.to_thread(self._load_task, task)
+        if loaded is None:
+            return
+        func, targs, pinned = loaded
+
+        # run task
+        try:
+            if asyncio.iscoroutinefunction(func):
+                await func(*targs[0], **targs[1])
+            else:
+                ret = await asyncio.to_thread(func, *targs[0], **targs[1])
+                if asyncio.iscoroutine(ret):
+                    await ret
+            status = EStatus.SUCCESS
+        except Exception as ex:
+            status = await asyncio.to_thread(self._task_exception, task, ex)
+        finally:
+            self.state_kwargs.release(pinned)
+
+        await asyncio.to_thread(self.update_task_status, task, status)
+
     def _take_next_task(self, level=None):
         level_start = level.start if level is not None else None
         level_stop = level.stop if level is not None else None
@@ -211,34 +357,292 @@ class TaskQ(Logger):
         job_id = self.job_id if self.job is not None else None
         return self._handler.take_next_task(job_id=job_id, level_start=level_start, level_stop=level_stop)
 
+    def _take_next_tasks(self, level=None, num_tasks=1, _timeout: float = None):
+        level_start = level.start if level is not None else None
+        level_stop = level.stop if level is not None else None
+
+        job_id = self.job_id if self.job is not None else None
+        return self._handler.take_next_tasks(
+            num_tasks=num_tasks, job_id=job_id, level_start=level_start, level_stop=level_stop, _timeout=_timeout
+        )
+
+    def _release_tasks(self, tasks: List[Task]):
+        # return claimed tasks which were not started back to pending
+        for task in tasks:
+            self.info(f"Releasing not started task '{task}'")
+            self.monitor.remove(task)
+            task.update(_handler=self._handler, status=EStatus.PENDING, take_time=None, pulse_time=None)
+
+    def _fail_pulse_timeout_tasks(self):
+        # sweep at most once per interval, locally throttled and db leased across workers
+        interval = self.config["background"]["pulse_timeout_interval"]
+        if self._pulse_timeout_sweep_time is not None and time.time() - self._pulse_timeout_sweep_time < interval:
+            return
+
+        self._pulse_timeout_sweep_time = time.time()
+        self._handler.fail_pulse_timeout_tasks(self.config["monitor"]["pulse_timeout"], interval_sec=interval)
+
     def _run(self, level):
         self.info(f"Started task pulling loop.")
 
+        # local buffer of claimed tasks
+        tasks = deque()
+        try:
+            self._run_loop(level, tasks)
+        finally:
+            self._release_tasks(tasks)
+            self._stop_monitor()
+            self.clear_state_kwargs()
+
+    def _run_loop(self, level, tasks: deque):
         # check for error code
         task_pull_start = time.time()
         while True:
-            # if the taskq handler is db handler, the taskq performs background tasks before each run
+            # run tasks claimed in previous batch
+            if tasks:
+                task = tasks.popleft()
+                try:
+                    self._run_task(task)
+                finally:
+                    self.monitor.remove(task)
+                continue
+
+            # if the taskq handler is db handler, the taskq performs background tasks
             if self.config["run"]["fail_pulse_timeout"] and isinstance(self._handler, DBHandler):
-                self._handler.fail_pulse_timeout_tasks(self.config["monitor"]["pulse_timeout"])
+                self._fail_pulse_timeout_tasks()
             # grab tasks and set them in Q
-            action, task = self._take_next_task(level)
+            action, claimed = self._take_next_tasks(level, num_tasks=self.config["run"]["prefetch"])
 
             # handle no task available
             if not self.config["run"]["run_forever"] and action == EAction.STOP:
                 break
             if action == EAction.RUN_TASK:
-                self._run_task(task)
+                # claimed tasks are pulsed until done (including buffered tasks)
+                for task in claimed:
+                    self.monitor.add(task)
+                tasks.extend(claimed)
             elif action == EAction.WAIT or action == EAction.STOP:
-                if (
-                    wait_timeout := self.config["run"]["wait_timeout"]
-                ) is not None and time.time() - task_pull_start > wait_timeout:
-                    raise Exception(f"task pull timeout of '{wait_timeout}' sec reached.")
+                self._check_wait_timeout(task_pull_start)
 
-                self.info(f'Task pulling loop - waiting for {self.config["run"]["pull_interval"]} sec')
-                time.sleep(self.config["run"]["pull_interval"])
+                # wakes up on tasks changes if supported by handler, pull interval is the fallback
+                self.info(f'Task pulling loop - waiting up to {self.config["run"]["pull_interval"]} sec')
+                self._handler.wait_for_tasks(self.config["run"]["pull_interval"])
             else:
                 raise Exception(f"Unsupported action {action}")
 
+    def _check_wait_timeout(self, task_pull_start: float):
+        if (
+            wait_timeout := self.config["run"]["wait_timeout"]
+        ) is not None and time.time() - task_pull_start > wait_timeout:
+            raise Exception(f"task pull timeout of '{wait_timeout}' sec reached.")
+
+    def _claim_tasks(self, level, num_tasks: int, has_running: bool, task_pull_start: float, long_poll=True):
+        """claim tasks for a single claimer feeding workers, returns claimed tasks or None to stop running.
+
+        long_poll False never holds the claim (rest handler), e.g. while tasks changes are pending in the claimer.
+        """
+        if self.config["run"]["fail_pulse_timeout"] and isinstance(self._handler, DBHandler):
+            self._fail_pulse_timeout_tasks()
+        action, claimed = self._take_next_tasks(level, num_tasks=num_tasks, _timeout=None if long_poll else 0)
+
+        if action == EAction.RUN_TASK:
+            # claimed tasks are pulsed until done
+            for task in claimed:
+                self.monitor.add(task)
+            return claimed
+        if action != EAction.WAIT and action != EAction.STOP:
+            raise Exception(f"Unsupported action {action}")
+        if not self.config["run"]["run_forever"] and action == EAction.STOP and not has_running:
+            return None
+
+        self._check_wait_timeout(task_pull_start)
+        return []
+
+    def _run_threads(self, level, num_workers: int):
+        self.info(f"Started task pulling loop, running tasks in {num_workers} threads.")
+
+        running = dict()  # future -> task
+        pull_interval = self.config["run"]["pull_interval"]
+        task_pull_start = time.time()
+        try:
+            with ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="ataskq") as executor:
+                while True:
+                    for future in [f for f in running if f.done()]:
+                        self.monitor.remove(running.pop(future))
+                        future.result()
+
+                    claimed = []
+                    if len(running) < num_workers:
+                        claimed = self._claim_tasks(level, num_workers - len(running), bool(running), task_pull_start)
+                        if claimed is None:
+                            break
+                        for task in claimed:
+                            running[executor.submit(self._run_task, task)] = task
+                    if claimed:
+                        continue
+
+                    # wait for a running task to end (frees a worker, may unblock tasks) or for tasks changes
+                    if running:
+                        timeout = pull_interval if len(running) < num_workers else None
+                        futures.wait(running, timeout=timeout, return_when=futures.FIRST_COMPLETED)
+                    else:
+                        self.info(f"Task pulling loop - waiting up to {pull_interval} sec")
+                        self._handler.wait_for_tasks(pull_interval)
+        finally:
+            self._stop_monitor()
+            self.clear_state_kwargs()
+
+    async def _run_async(self, level, num_workers: int):
+        self.info(f"Started task pulling loop, running up to {num_workers} tasks on event loop.")
+
+        running = dict()  # asyncio task -> task
+        pull_interval = self.config["run"]["pull_interval"]
+        task_pull_start = time.time()
+        try:
+            while True:
+                for aio_task in [t for t in running if t.done()]:
+                    self.monitor.remove(running.pop(aio_task))
+                    aio_task.result()
+
+                claimed = []
+                if len(running) < num_workers:
+                    claimed = await asyncio.to_thread(
+                        self._claim_tasks, level, num_workers - len(running), bool(running), task_pull_start
+                    )
+                    if claimed is None:
+                        break
+                    for task in claimed:
+                        running[asyncio.create_task(self._run_task_async(task))] = task
+                if claimed:
+                    continue
+
+                # wait for a running task to end (frees a worker, may unblock tasks) or for tasks changes
+                if running:
+                    timeout = pull_interval if len(running) < num_workers else None
+                    await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    self.info(f"Task pulling loop - waiting up to {pull_interval} sec")
+                    await asyncio.to_thread(self._handler.wait_for_tasks, pull_interval)
+        finally:
+            # let running tasks end
+            await asyncio.gather(*running, return_exceptions=True)
+            self._stop_monitor()
+            self.clear_state_kwargs()
+
+    def _run_worker(self, conn):
+        # dispatch worker process main, runs tasks received from the dispatcher until None is received
+        self._dispatcher_conn = conn
+        try:
+            while (task := conn.recv()) is not None:
+                error = None
+                try:
+                    self._run_task(task)
+                except Exception as ex:
+                    error = ex
+
+                try:
+                    conn.send(("done", task.task_id, (error, worker_rss())))
+                except Exception:
+                    # not picklable exception
+                    conn.send(("done", task.task_id, (Exception(repr(error)), worker_rss())))
+        finally:
+            self.clear_state_kwargs()
+
+    def _flush_updates(self, updates: Dict[int, dict]):
+        if not updates:
+            return
+
+        self._handler.update_bulk(Task, list(updates.values()))
+        updates.clear()
+
+    def _handle_worker_messages(self, messages: list, updates: Dict[int, dict]):
+        """merge workers tasks updates by task, returns first done task error (if any)"""
+        error = None
+        for kind, task, value in messages:
+            if kind == "update":
+                updates.setdefault(task.task_id, dict(task_id=task.task_id)).update(value)
+            elif kind == "done":
+                self.monitor.remove(task)
+                error = error or value
+            elif kind == "crashed":
+                self.error(f"Worker process running task '{task}' crashed with exitcode '{value}'")
+                if task is not None:
+                    self.monitor.remove(task)
+                    now = datetime.now()
+                    updates.setdefault(task.task_id, dict(task_id=task.task_id)).update(
+                        status=EStatus.FAILURE, pulse_time=now, done_time=now
+                    )
+            else:
+                raise Exception(f"Unsupported worker message '{kind}'")
+
+        return error
+
+    def _run_dispatch(self, level, num_workers: int):
+        self.info(f"Started task pulling loop, dispatching tasks to {num_workers} worker processes.")
+
+        # workers are forked before any thread (monitor) is started, recycled / restarted workers are forked later
+        pool = WorkerPool(
+            num_workers,
+            self._run_worker,
+            max_tasks_per_child=self.config["run"]["max_tasks_per_child"],
+            max_rss_per_child=self.config["run"]["max_rss_per_child"],
+        )
+        self._worker_pool = pool
+        tasks = deque()  # claimed tasks, not dispatched yet
+        updates = dict()  # task_id -> workers tasks updates, written in batches
+        max_claimed = num_workers * self.config["run"]["prefetch"]
+        pull_interval = self.config["run"]["pull_interval"]
+        task_pull_start = time.time()
+        try:
+            while True:
+                # done tasks status is written before claiming (may unblock tasks)
+                self._flush_updates(updates)
+                if not pool.workers:
+                    raise Exception("All worker processes crashed, see logs for details")
+
+                for worker in pool.idle():
+                    if not tasks:
+                        break
+                    worker.send(tasks.popleft())
+
+                claimed = []
+                in_flight = len(pool.busy()) + len(tasks)
+                if in_flight < max_claimed:
+                    # running tasks status is written by this loop, a held (long poll) claim waits for changes it
+                    # can't write, claims are held only with no tasks in flight
+                    claimed = self._claim_tasks(
+                        level, max_claimed - in_flight, bool(in_flight), task_pull_start, long_poll=in_flight == 0
+                    )
+                    if claimed is None:
+                        break
+                    tasks.extend(claimed)
+                if claimed:
+                    continue
+
+                # wait for workers messages (a done task frees a worker, may unblock tasks) or for tasks changes
+                if pool.busy():
+                    timeout = pull_interval if in_flight < max_claimed else None
+                    error = self._handle_worker_messages(pool.wait(timeout), updates)
+                    if error is not None:
+                        raise error
+                else:
+                    self.info(f"Task pulling loop - waiting up to {pull_interval} sec")
+                    self._handler.wait_for_tasks(pull_interval)
+        finally:
+            # let dispatched tasks end
+            try:
+                while pool.busy():
+                    self._handle_worker_messages(pool.wait(), updates)
+                self._flush_updates(updates)
+            finally:
+                self._worker_stats = pool.stats()
+                self._worker_pool = None
+                pool.close()
+                for stats in self._worker_stats:
+                    self.info(f"Worker stats {stats}")
+                self._release_tasks(tasks)
+                self._stop_monitor()
+
     def assert_level(self, level):
         if isinstance(level, int):
             level = range(level, level + 1)
@@ -248,38 +652,118 @@ class TaskQ(Logger):
         else:
             assert isinstance(level, range), "level must be int, list, tuple or range"
 
-        # check all task < level.start are done
-        count = self.count_pending_tasks_below_level(level.start)
-        assert count == 0, f"all tasks below level must be done before running tasks at levels {level}"
+        # check all task < level.start are done (lowest pending level, across jobs frontier when job_id is None)
+        job_id = self.job_id if self.job is not None else None
+        frontier = self._handler.jobs_frontier(job_id=job_id)
+        pending_level = min([r["pending_level"] for r in frontier if r["pending_level"] is not None], default=None)
+        assert (
+            pending_level is None or pending_level >= level.start
+        ), f"all tasks below level must be done before running tasks at levels {level}"
 
         return level
 
-    def run(self, concurrency=None, level=None):
+    def preload(self, modules: Union[str, List[str]]):
+        """import modules / resolve entrypoints ('<module>' or '<module>.<func>', list or comma separated str) in the
+        current process, forked workers share the preloaded modules (copy-on-write) instead of importing in first task.
+        """
+        if isinstance(modules, str):
+            modules = [m.strip() for m in modules.split(",") if m.strip()]
+
+        start = time.time()
+        for name in modules:
+            try:
+                import_module(name)
+            except ImportError:
+                # not a module, '<module>.<func>' entrypoint (import errors raised by existing modules are raised)
+                if "." not in name or _module_exists(name):
+                    raise
+                load_entrypoint(name)
+        self.info(f"Preloaded {modules} in {time.time() - start:.3f} sec")
+
+        return self
+
+    def run(self, concurrency=None, level=None, executor: str = None, preload: List[str] = None):
+        """Run tasks.
+
+        preload (default 'run.preload' config) modules / entrypoints are imported before running (see preload), with
+        'run.gc_freeze' config the gc is frozen before forking workers (process and dispatch executors).
+
+        executor (default 'run.executor' config):
+            process - concurrency processes, each claiming and running tasks (concurrency None runs in current process).
+            thread - single claimer feeding a pool of concurrency threads.
+            async - single claimer running up to concurrency tasks on an event loop, coroutine entrypoints are awaited
+                and blocking entrypoints run in threads.
+            dispatch - single claimer dispatching tasks to concurrency long lived worker processes, workers tasks status
+                is written by the claimer in batches ('run.prefetch' tasks are claimed per worker). workers are recycled after
+                'run.max_tasks_per_child' tasks or 'run.max_rss_per_child' MB private memory and restarted if crashed, per worker
+                stats are available by worker_stats.
+        """
+        if executor is None:
+            executor = self.config["run"]["executor"]
+        assert executor in ["process", "thread", "async", "dispatch"], f"unsupported executor '{executor}'"
+
         self.info(f"Start running with connection {self.config['connection']}")
         if level is not None:
             level = self.assert_level(level)
 
+        if preload is None:
+            preload = self.config["run"]["preload"]
+        if preload:
+            self.preload(preload)
+
         self._running = True
 
         # default to run in current process
-        if concurrency is None:
+        if concurrency is None and executor == "process":
             self._run(level)
             self._running = False
             return
 
-        assert isinstance(concurrency, (int, float))
-
-        if isinstance(concurrency, float):
-            assert 0.0 <= concurrency <= 1.0
-            nprocesses = int(multiprocessing.cpu_count() * concurrency)
-        elif concurrency < 0:
-            nprocesses = multiprocessing.cpu_count() - concurrency
+        if concurrency is None:
+            nprocesses = 1
         else:
-            nprocesses = concurrency
+            assert isinstance(concurrency, (int, float))
+
+            if isinstance(concurrency, float):
+                assert 0.0 <= concurrency <= 1.0
+                nprocesses = int(multiprocessing.cpu_count() * concurrency)
+            elif concurrency < 0:
+                nprocesses = multiprocessing.cpu_count() - concurrency
+            else:
+                nprocesses = concurrency
+
+        if executor == "thread":
+            try:
+                self._run_threads(level, nprocesses)
+            finally:
+                self._running = False
+            return self
+        elif executor == "async":
+            try:
+                asyncio.run(self._run_async(level, nprocesses))
+            finally:
+                self._running = False
+            return self
+
+        # forked workers don't dirty parent objects pages (copy-on-write) by gc
+        gc_freeze = self.config["run"]["gc_freeze"]
+        if gc_freeze:
+            gc.freeze()
+
+        if executor == "dispatch":
+            try:
+                self._run_dispatch(level, nprocesses)
+            finally:
+                if gc_freeze:
+                    gc.unfreeze()
+                self._running = False
+            return self
 
         # set processes and Q
         processes = [Process(target=self._run, args=(level,)) for i in range(nprocesses)]
         [p.start() for p in processes]
+        if gc_freeze:
+            gc.unfreeze()
 
         # join all processes
         [p.join() for p in processes]
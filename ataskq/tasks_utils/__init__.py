@@ -1,3 +1,3 @@
-from .basic import hello_world, dummy_args_task, exception_task
+from .basic import hello_world, dummy_args_task, exception_task, crash_task
 from .counter_task import counter_task, counter_kwarg
-from .write_to_file_tasks import write_to_file, write_to_file_mp_lock
+from .write_to_file_tasks import write_to_file, write_to_file_mp_lock, async_write_to_file
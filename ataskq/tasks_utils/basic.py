@@ -1,3 +1,4 @@
+import os
 import time
 
 
@@ -13,3 +14,8 @@ def dummy_args_task(*args, **kwargs):
 
 def exception_task(etype=Exception, message="This is an exception task"):
     raise etype(message)
+
+
+def crash_task(exitcode=1):
+    # exits the running process without cleanup (simulates a crash)
+    os._exit(exitcode)
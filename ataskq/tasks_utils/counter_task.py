@@ -2,6 +2,7 @@ class CounterKWArg:
     def __init__(self, val=0, name="counter") -> None:
         self._val = val
         self._name = name
+        self._closed = False
 
     @property
     def val(self):
@@ -11,20 +12,32 @@ class CounterKWArg:
     def name(self):
         return self._name
 
+    @property
+    def closed(self):
+        return self._closed
+
     def count(self):
+        assert not self._closed, "counter is closed"
         ret = self._val
         self._val += 1
 
         return ret
 
+    def close(self):
+        # state kwarg teardown
+        self._closed = True
+
 
-def counter_kwarg():
-    return CounterKWArg()
+def counter_kwarg(val=0, name="counter"):
+    return CounterKWArg(val=val, name=name)
 
 
-def counter_task(counter: CounterKWArg = None, print_counter=False):
+def counter_task(counter: CounterKWArg = None, print_counter=False, filepath=None):
     assert counter is not None, "counter value must be provided"
 
     if print_counter:
         print(f"counter name: {counter.name}, val: {counter.val}")
+    if filepath is not None:
+        with open(filepath, "a") as f:
+            f.write(f"{counter.name} {counter.val}\n")
     counter.count()
@@ -1,3 +1,4 @@
+import asyncio
 from multiprocessing import Lock
 import os
 import time
@@ -22,3 +23,11 @@ def write_to_file_mp_lock(filepath, text, sleep=None):
     with __lock__:
         with open(filepath, "a") as f:
             f.write(text)
+
+
+async def async_write_to_file(filepath, text, sleep=None):
+    if sleep is not None:
+        await asyncio.sleep(sleep)
+    text = text.replace(r"@{pid}", f"{os.getpid()}").replace(r"@{now}", f"{datetime.now()}")
+    with open(filepath, "a") as f:
+        f.write(text)
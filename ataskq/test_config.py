@@ -38,7 +38,7 @@ def test_load_default_none():
     config = load_config(environ=False)
     count = assert_config(get_config_set(), config)
     # sanity
-    assert count == 12, "invalid number of configurations."
+    assert count == 34, "invalid number of configurations."
 
 
 def test_load_default():
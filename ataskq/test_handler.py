@@ -1,11 +1,16 @@
 # todo: add queries order_by tests
 
+from multiprocessing import Process, Queue
+from threading import Thread
+import time
+
 import pytest
 
 from .config import load_config
 from .handler import Handler, from_config
 from .handler.db_handler import DBHandler, transaction_decorator
 from .handler import register_handler
+from .models import Job, StateKWArg
 
 
 @pytest.fixture
@@ -78,3 +83,289 @@ def test_db_invalid_format_no_connectino():
     with pytest.raises(RuntimeError) as excinfo:
         from_config(load_config({"connection": "sqlite://"}, environ=False))
     assert "missing connection string, connection must be of format <type>://<connection string>" == str(excinfo.value)
+
+
+@pytest.mark.parametrize("skip_locked", [True, False])
+def test_pg_for_update_skip_locked(config, skip_locked):
+    if "pg://" not in config["connection"]:
+        pytest.skip()
+
+    config["handler"]["skip_locked"] = skip_locked
+    handler = from_config(config)
+    if skip_locked:
+        assert handler.for_update == "FOR UPDATE SKIP LOCKED"
+    else:
+        assert handler.for_update == "FOR UPDATE"
+
+
+def test_wait_for_tasks(config):
+    handler = from_config(config)
+
+    # first wait starts listening for notifications (if supported) and returns immediately
+    handler.wait_for_tasks(0.1)
+
+    # tasks changes wake up waiting handler before timeout
+    job = Job().create(_handler=handler)
+    if "pg://" in config["connection"]:
+        from .models import Task
+
+        Thread(
+            target=lambda: job.add_tasks(
+                [Task(entrypoint="ataskq.tasks_utils.dummy_args_task")], _handler=from_config(config)
+            )
+        ).start()
+        start = time.time()
+        handler.wait_for_tasks(10)
+        assert time.time() - start < 5
+    else:
+        start = time.time()
+        handler.wait_for_tasks(0.1)
+        assert time.time() - start >= 0.1
+
+
+def test_rest_long_poll(config):
+    if "http" not in config["connection"]:
+        pytest.skip()
+
+    from .models import Task, EStatus
+    from .handler import EAction
+
+    config["handler"]["long_poll_timeout"] = 10
+    handler = from_config(config)
+    job = Job().create(_handler=handler)
+    job.add_tasks(
+        [
+            Task(entrypoint="ataskq.tasks_utils.dummy_args_task", level=1),
+            Task(entrypoint="ataskq.tasks_utils.dummy_args_task", level=2),
+        ],
+        _handler=handler,
+    )
+    _, task = handler.take_next_task(job_id=job.job_id)
+
+    def finish():
+        time.sleep(0.5)
+        task.update(_handler=handler, status=EStatus.SUCCESS)
+
+    # server holds the request until level 1 task is done
+    Thread(target=finish).start()
+    start = time.time()
+    action, task = handler.take_next_task(job_id=job.job_id)
+    assert action == EAction.RUN_TASK
+    assert task.level == 2
+    assert time.time() - start < 5
+
+
+def _rest_session_in_process(handler, q):
+    q.put(Job.count_all(_handler=handler))
+
+
+def test_rest_session_fork(config):
+    if "http" not in config["connection"]:
+        pytest.skip()
+
+    handler = from_config(config)
+    Job(name="job").create(_handler=handler)
+    session = handler.session
+    assert handler.session is session  # keep-alive session reused
+
+    # forked process creates its own session
+    q = Queue()
+    p = Process(target=_rest_session_in_process, args=(handler, q))
+    p.start()
+    count = q.get(timeout=10)
+    p.join()
+    assert count == 1
+    assert handler.session is session
+    assert Job.count_all(_handler=handler) == 1
+
+
+def test_pool_reuse_connections(config):
+    config["handler"]["pool_size"] = 2
+    handler = from_config(config)
+    if not isinstance(handler, DBHandler):
+        pytest.skip()
+
+    for _ in range(5):
+        Job.count_all(_handler=handler)
+
+    stats = handler.pool.stats()
+    assert stats["created"] == 1
+    assert stats["idle"] == 1
+    assert stats["in_use"] == 0
+    assert stats["checkouts"] >= 5
+
+
+def test_pool_disabled(config):
+    config["handler"]["pool_size"] = 0
+    handler = from_config(config)
+    if not isinstance(handler, DBHandler):
+        pytest.skip()
+
+    created = handler.pool.stats()["created"]
+    for _ in range(3):
+        Job.count_all(_handler=handler)
+
+    stats = handler.pool.stats()
+    assert stats["created"] == created + 3
+    assert stats["idle"] == 0
+
+
+def test_pool_threads(config):
+    config["handler"]["pool_size"] = 2
+    handler = from_config(config)
+    if not isinstance(handler, DBHandler):
+        pytest.skip()
+
+    def count_jobs():
+        for _ in range(20):
+            Job.count_all(_handler=handler)
+
+    threads = [Thread(target=count_jobs) for _ in range(4)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+
+    stats = handler.pool.stats()
+    assert stats["created"] <= 2
+    assert stats["in_use"] == 0
+
+
+def _count_jobs_in_process(handler, q):
+    q.put((Job.count_all(_handler=handler), handler.pool.stats()["created"]))
+
+
+def test_pool_fork(config):
+    handler = from_config(config)
+    if not isinstance(handler, DBHandler):
+        pytest.skip()
+
+    Job(name="job").create(_handler=handler)
+    assert handler.pool.stats()["idle"] == 1
+
+    q = Queue()
+    p = Process(target=_count_jobs_in_process, args=(handler, q))
+    p.start()
+    count, created = q.get(timeout=10)
+    p.join()
+
+    # child process opened its own connection
+    assert count == 1
+    assert created == 1
+
+    # parent connection still usable
+    assert Job.count_all(_handler=handler) == 1
+
+
+def _sqlite_schema_v5(db_path):
+    import sqlite3
+
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("CREATE TABLE schema_version (version INTEGER PRIMARY KEY)")
+    c.execute("INSERT INTO schema_version (version) VALUES (5)")
+    c.execute(
+        "CREATE TABLE jobs (job_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, description TEXT, priority REAL DEFAULT 0)"
+    )
+    c.execute(
+        "CREATE TABLE tasks (task_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, level REAL, entrypoint TEXT NOT NULL, "
+        "targs MEDIUMBLOB, status TEXT ,take_time DATETIME, start_time DATETIME, done_time DATETIME, pulse_time DATETIME, "
+        "description TEXT, job_id INTEGER NOT NULL, CONSTRAINT fk_job_id FOREIGN KEY (job_id) REFERENCES jobs(job_id) ON DELETE CASCADE)"
+    )
+    c.execute(
+        "CREATE TABLE state_kwargs (state_kwargs_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, entrypoint TEXT NOT NULL, "
+        "targs MEDIUMBLOB, description TEXT, job_id INTEGER NOT NULL, CONSTRAINT uq_name_job_id UNIQUE(name, job_id), "
+        "CONSTRAINT fk_job_id FOREIGN KEY (job_id) REFERENCES jobs(job_id) ON DELETE CASCADE)"
+    )
+    c.execute("INSERT INTO jobs (name) VALUES ('v5 job')")
+    c.execute("INSERT INTO tasks (name, level, entrypoint, status, job_id) VALUES ('v5 task', 0, '', 'pending', 1)")
+    conn.commit()
+    conn.close()
+
+
+def test_init_db_migration(config, tmp_path):
+    if "sqlite" not in config["connection"]:
+        pytest.skip()
+
+    from . import __schema_version__
+
+    db_path = tmp_path / "ataskq.v5.sqlite3"
+    _sqlite_schema_v5(db_path)
+    config["connection"] = f"sqlite://{db_path}"
+    handler = from_config(config)
+
+    @transaction_decorator()
+    def query(handler, c, query_str):
+        c.execute(query_str)
+        return c.fetchall()
+
+    assert query(handler, "SELECT version FROM schema_version") == [(__schema_version__,)]
+    indexes = [r[0] for r in query(handler, "SELECT name FROM sqlite_master WHERE type = 'index'")]
+    assert "ix_tasks_status_job_level" in indexes
+    assert "ix_tasks_job_level" in indexes
+    assert "ix_tasks_running_pulse_time" in indexes
+
+    # existing data kept
+    assert [j.name for j in Job.get_all(_handler=handler)] == ["v5 job"]
+    # status counters of existing tasks
+    assert [(s["name"], s["pending"]) for s in handler.tasks_status()] == [("v5 task", 1)]
+    # v5 state kwargs table is used as is
+    job = Job.get_all(_handler=handler)[0]
+    job.add_state_kwargs([StateKWArg(name="counter", entrypoint="ataskq.tasks_utils.counter_kwarg")], _handler=handler)
+    assert [s.name for s in job.get_state_kwargs(_handler=handler)] == ["counter"]
+
+    # init of migrated db is a no-op
+    handler.init_db()
+    assert query(handler, "SELECT version FROM schema_version") == [(__schema_version__,)]
+
+
+def test_init_db_newer_schema_version(config):
+    handler = from_config(config)
+    if not isinstance(handler, DBHandler):
+        pytest.skip()
+
+    from . import __schema_version__
+
+    @transaction_decorator()
+    def set_version(handler, c, version):
+        c.execute(f"UPDATE schema_version SET version = {version}")
+
+    set_version(handler, __schema_version__ + 1)
+    with pytest.raises(AssertionError) as excinfo:
+        handler.init_db()
+    assert "Schema version mismatch" in str(excinfo.value)
+    set_version(handler, __schema_version__)
+
+
+def test_fail_pulse_timeout_tasks_lease(config):
+    handler = from_config(config)
+    if not isinstance(handler, DBHandler):
+        pytest.skip()
+
+    from datetime import datetime, timedelta
+    from .models import Task, EStatus
+
+    job = Job().create(_handler=handler)
+    pulse_time = datetime.now() - timedelta(minutes=10)
+    job.add_tasks(
+        [
+            Task(entrypoint="ataskq.tasks_utils.dummy_args_task", status=EStatus.RUNNING, pulse_time=pulse_time),
+            Task(entrypoint="ataskq.tasks_utils.dummy_args_task", status=EStatus.RUNNING, pulse_time=pulse_time),
+        ],
+        _handler=handler,
+    )
+
+    @transaction_decorator()
+    def query(handler, c, query_str):
+        c.execute(query_str)
+        return c.fetchall()
+
+    # first sweep acquires the lease
+    ret = handler.fail_pulse_timeout_tasks(60, interval_sec=60)
+    assert ret["reaped"] == 2
+    assert query(handler, "SELECT reaped FROM leases WHERE name = 'pulse_timeout'") == [(2,)]
+    assert all([t.status == EStatus.FAILURE for t in Task.get_all(_handler=handler)])
+
+    # sweeps in the same interval are skipped
+    assert handler.fail_pulse_timeout_tasks(60, interval_sec=60) is None
+
+    # lease expired
+    assert handler.fail_pulse_timeout_tasks(60, interval_sec=0) == dict(reaped=0, duration=pytest.approx(0, abs=1))
@@ -103,3 +103,35 @@ def test_run_concurrency(tmp_path, config):
 
     assert filepath.exists()
     assert len(set([l for l in filepath.read_text().split("\n") if l])) == 3
+
+
+@pytest.mark.parametrize("executor", ["thread", "dispatch"])
+def test_run_executor(tmp_path, config, executor):
+    filepath = tmp_path / "file.txt"
+    with open(configpath := tmp_path / "config.json", "w") as f:
+        json.dump(config, f)
+
+    taskq = TaskQ(config=config).create_job()
+    taskq.add_tasks([Task(entrypoint=write_to_file, targs=targs(filepath, f"task {i}\n")) for i in range(3)])
+
+    args = ["run", "-c", str(configpath), "--job-id", str(taskq.job_id), "--concurrency", "2", "--executor", executor]
+    args += ["--preload", "json", "ataskq.tasks_utils.write_to_file_tasks.write_to_file"]
+    main(args=args)
+
+    assert sorted(filepath.read_text().splitlines()) == ["task 0", "task 1", "task 2"]
+
+
+def test_rebuild_counters(tmp_path, config):
+    if "http" in config["connection"]:
+        pytest.skip()
+
+    with open(configpath := tmp_path / "config.json", "w") as f:
+        json.dump(config, f)
+
+    taskq = TaskQ(config=config).create_job()
+    taskq.add_tasks([Task(entrypoint=write_to_file), Task(entrypoint=write_to_file)])
+
+    args = ["rebuild-counters", "-c", str(configpath)]
+    main(args=args)
+
+    assert taskq.handler.tasks_status(job_id=taskq.job_id)[0]["pending"] == 2
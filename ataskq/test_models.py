@@ -1,6 +1,8 @@
+from datetime import datetime
+
 import pytest
 
-from .models import Model, __MODELS__, Job
+from .models import Model, __MODELS__, Job, Task, EStatus
 from .handler import Handler, from_config, register_handler, unregister_handler
 
 
@@ -72,6 +74,24 @@ def test_get_all(handler, model_cls):
         assert_model(m_src, m_rec, model_cls, first_id, i)
 
 
+def test_get_all_fields(handler):
+    job = create(Job, name="job")
+    job.add_tasks([Task(name=f"task {i}", entrypoint="dummy entry point", targs=b"payload") for i in range(3)])
+
+    tasks = Task.get_all(_fields=["name", "status"])
+    assert [t.name for t in tasks] == ["task 0", "task 1", "task 2"]
+    assert all([t.task_id is not None for t in tasks])  # id always projected
+    assert not hasattr(tasks[0], "targs")
+
+    tasks = job.get_tasks(_fields="name")
+    assert [t.name for t in tasks] == ["task 0", "task 1", "task 2"]
+    assert not hasattr(tasks[0], "targs")
+
+    with pytest.raises(Exception) as excinfo:
+        Task.get_all(_fields=["name", "invalid"])
+    assert "invalid" in str(excinfo.value)
+
+
 @pytest.mark.parametrize("model_cls", __MODELS__.values(), ids=__MODELS__.keys())
 def test_get_all_where(handler, model_cls: Model):
     m1 = create(model_cls, name="test 1")
@@ -144,3 +164,116 @@ def test_add_get_children(handler, model_cls: Model, child_cls, parent_key):
     rec_children = m2.get_children(child_cls)
     assert len(rec_children) == 4
     assert all([getattr(c, parent_key) == getattr(m2, model_cls.id_key()) for c in rec_children])
+
+
+def test_create_bulk_chunks(config):
+    config["handler"]["bulk_chunk_size"] = 7
+    handler = from_config(config)
+    job = Job(name="job").create(_handler=handler)
+
+    tasks = [Task(name=f"task {i}", entrypoint="dummy entry point") for i in range(30)]
+    job.add_tasks(tasks, _handler=handler)
+
+    task_ids = [t.task_id for t in tasks]
+    assert len(set(task_ids)) == 30
+    rec_tasks = job.get_tasks(_handler=handler)
+    assert [t.task_id for t in rec_tasks] == task_ids
+    assert [t.name for t in rec_tasks] == [f"task {i}" for i in range(30)]
+
+
+def test_create_bulk_mixed_keys(handler):
+    job = create(Job)
+
+    mkwargs = [
+        dict(entrypoint="ep 0", job_id=job.job_id),
+        dict(entrypoint="ep 1", name="task 1", job_id=job.job_id),
+        dict(entrypoint="ep 2", job_id=job.job_id),
+    ]
+    task_ids = handler.create_bulk(Task, mkwargs)
+    assert len(set(task_ids)) == 3
+
+    for i, task_id in enumerate(task_ids):
+        task = Task.get(task_id)
+        assert task.entrypoint == f"ep {i}"
+    assert Task.get(task_ids[1]).name == "task 1"
+
+
+def test_update_bulk(handler):
+    job = create(Job)
+    task_ids = handler.create_bulk(Task, [dict(entrypoint=f"ep {i}", job_id=job.job_id) for i in range(3)])
+
+    now = datetime.now()
+    handler.update_bulk(
+        Task,
+        [
+            dict(task_id=task_ids[0], status=EStatus.SUCCESS, done_time=now),
+            dict(task_id=task_ids[1], status=EStatus.FAILURE),
+            dict(task_id=task_ids[2], status=EStatus.SUCCESS, done_time=now),
+        ],
+    )
+
+    tasks = [Task.get(task_id) for task_id in task_ids]
+    assert [t.status for t in tasks] == [EStatus.SUCCESS, EStatus.FAILURE, EStatus.SUCCESS]
+    assert [t.done_time for t in tasks] == [now, None, now]
+
+
+def test_add_children_generator(config):
+    handler = from_config(config)
+    job = Job(name="job").create(_handler=handler)
+
+    chunks = []
+    create_bulk = handler.create_bulk
+
+    def create_bulk_spy(model_cls, mkwargs, deps=None):
+        chunks.append(len(mkwargs))
+        return create_bulk(model_cls, mkwargs, deps=deps)
+
+    handler.create_bulk = create_bulk_spy
+
+    tasks = (Task(name=f"task {i}", entrypoint="dummy entry point") for i in range(25))
+    task_ids = job.add_tasks(tasks, _handler=handler, _chunk_size=10)
+
+    assert chunks == [10, 10, 5]
+    assert isinstance(task_ids, list)
+    assert len(task_ids) == 25
+    assert len(set(task_ids)) == 25
+    rec_tasks = job.get_tasks(_handler=handler)
+    assert [t.task_id for t in rec_tasks] == task_ids
+
+    # list input (children assigned with created ids), empty input
+    tasks = [Task(name="list task", entrypoint="dummy entry point"), dict(name="dict task", entrypoint="")]
+    task_ids = job.add_tasks(tasks, _handler=handler)
+    assert task_ids == [t.task_id for t in job.get_tasks(_handler=handler)[25:]]
+    assert task_ids[0] == tasks[0].task_id
+    assert job.add_tasks([], _handler=handler) == []
+    assert [t.name for t in rec_tasks] == [f"task {i}" for i in range(25)]
+
+
+@pytest.mark.parametrize("wire_format", ["json", "msgpack"])
+def test_wire_format(wire_format):
+    from datetime import datetime
+    from .models import EStatus
+    from .handler.wire_format import get_wire_format
+
+    if wire_format == "msgpack":
+        pytest.importorskip("msgpack")
+
+    fmt = get_wire_format(wire_format)
+    task = Task(
+        task_id=1,
+        entrypoint="dummy entry point",
+        targs=b"\x00\xff" * 10,
+        status=EStatus.RUNNING,
+        take_time=datetime(2024, 1, 2, 3, 4, 5, 678901),
+    )
+
+    data = fmt.dumps(task.to_interface(fmt))
+    ret = Task.from_interface(fmt.loads(data), fmt)
+
+    assert ret.targs == task.targs
+    assert ret.status == EStatus.RUNNING
+    assert ret.take_time == task.take_time
+    if wire_format == "msgpack":
+        # raw bytes and integer timestamps
+        assert fmt.loads(data)["targs"] == task.targs
+        assert isinstance(fmt.loads(data)["take_time"], int)
@@ -1,7 +1,10 @@
+from datetime import datetime
+
 import pytest
 
 from . import TaskQ, Task
-from .handler import from_config
+from .handler import from_config, DBHandler
+from .handler.handler import next_cursor
 
 
 @pytest.fixture()
@@ -80,3 +83,198 @@ def test_jobs_status(handler, job_ids):
     assert status[0]["name"] == "job2"
     assert status[0]["tasks"] == 3
     assert status[0]["pending"] == 3
+
+
+def test_tasks_status_after(handler, job_ids):
+    status = handler.tasks_status(_limit=2)
+    assert [s["name"] for s in status] == ["n1", "n2"]
+
+    cursor = next_cursor(status, ["level", "name"], 2)
+    status = handler.tasks_status(_limit=2, _after=cursor)
+    assert [s["name"] for s in status] == ["n3", "n4"]
+
+    assert handler.tasks_status(_limit=2, _after=next_cursor(status, ["level", "name"], 2)) == []
+
+
+def test_jobs_status_after(handler, job_ids):
+    status = handler.jobs_status(_limit=1)
+    assert [s["job_id"] for s in status] == [job_ids[1]]
+
+    # cursor token or last job id
+    assert [s["job_id"] for s in handler.jobs_status(_after=next_cursor(status, ["job_id"], 1))] == [job_ids[0]]
+    assert [s["job_id"] for s in handler.jobs_status(_after=job_ids[1])] == [job_ids[0]]
+
+
+def test_get_all_after(handler, job_ids):
+    tasks = Task.get_all(_handler=handler, _limit=4)
+    assert len(tasks) == 4
+
+    tasks = Task.get_all(_handler=handler, _limit=4, _after=tasks[-1].task_id)
+    assert [t.name for t in tasks] == ["n4", "n4"]
+
+    tasks = Task.get_all(_handler=handler, _after=next_cursor([{"task_id": tasks[0].task_id}], ["task_id"], 1))
+    assert [t.name for t in tasks] == ["n4"]
+
+
+def test_status_counters(handler, job_ids):
+    from .models import Job, EStatus
+
+    # claim, status update
+    _, tasks = handler.take_next_tasks(num_tasks=2, job_id=job_ids[0])
+    tasks[0].update(status=EStatus.SUCCESS, _handler=handler)
+    status = handler.tasks_status(job_id=job_ids[0])
+    assert [(s["name"], s["total"], s["pending"], s["running"], s["success"]) for s in status] == [
+        ("n1", 2, 0, 1, 1),
+        ("n2", 1, 1, 0, 0),
+    ]
+
+    # updates not changing counters key / status (e.g. pulse), key change
+    tasks[1].update(pulse_time=datetime.now(), _handler=handler)
+    assert [s["running"] for s in handler.tasks_status(job_id=job_ids[0])] == [1, 0]
+    tasks[0].update(name="n2", _handler=handler)
+    status = handler.tasks_status(job_id=job_ids[0])
+    assert [(s["name"], s["total"], s["running"], s["success"]) for s in status] == [("n1", 1, 1, 0), ("n2", 2, 0, 1)]
+    tasks[0].update(name="n1", _handler=handler)
+
+    # delete
+    tasks[1].delete(_handler=handler)
+    status = handler.tasks_status(job_id=job_ids[0])
+    assert [(s["name"], s["total"], s["running"], s["success"]) for s in status] == [("n1", 1, 0, 1), ("n2", 1, 0, 0)]
+    assert handler.jobs_status()[1]["tasks"] == 2
+
+    # job delete
+    Job.get(job_ids[1], _handler=handler).delete(_handler=handler)
+    assert handler.tasks_status(job_id=job_ids[1]) == []
+    assert [s["job_id"] for s in handler.jobs_status()] == [job_ids[0]]
+
+
+def test_rebuild_task_counters(handler, job_ids):
+    if not isinstance(handler, DBHandler):
+        pytest.skip()
+
+    assert handler.rebuild_task_counters() == dict(drift=0)
+
+    with handler.pool.connection() as conn:
+        conn.cursor().execute(f"UPDATE task_counters SET count = 5 WHERE job_id = {job_ids[0]}")
+        conn.commit()
+    assert handler.tasks_status(job_id=job_ids[0])[0]["total"] == 5
+
+    assert handler.rebuild_task_counters() == dict(drift=2)
+    assert [s["total"] for s in handler.tasks_status(job_id=job_ids[0])] == [2, 1]
+
+
+def test_jobs_frontier(handler, config):
+    from .models import EStatus
+    from .handler import EAction
+
+    taskq = TaskQ(config=config).create_job(name="job1")
+    taskq.add_tasks(
+        [
+            Task(name="l0", level=0, entrypoint=""),
+            Task(name="l1", level=1, entrypoint=""),
+            Task(name="l1", level=1, entrypoint=""),
+        ]
+    )
+    frontier = handler.jobs_frontier(job_id=taskq.job_id)
+    assert [(f["level"], f["pending"], f["running"], f["pending_level"]) for f in frontier] == [(0, 1, 0, 0)]
+
+    # running task blocks next level
+    action, tasks = handler.take_next_tasks(num_tasks=3, job_id=taskq.job_id)
+    assert action == EAction.RUN_TASK and [t.name for t in tasks] == ["l0"]
+    frontier = handler.jobs_frontier(job_id=taskq.job_id)
+    assert [(f["level"], f["pending"], f["running"], f["pending_level"]) for f in frontier] == [(0, 0, 1, 1)]
+    assert handler.take_next_tasks(num_tasks=3, job_id=taskq.job_id) == (EAction.WAIT, [])
+
+    # frontier advances once level drains
+    tasks[0].update(status=EStatus.SUCCESS, _handler=handler)
+    frontier = handler.jobs_frontier(job_id=taskq.job_id)
+    assert [(f["level"], f["pending"], f["running"], f["pending_level"]) for f in frontier] == [(1, 2, 0, 1)]
+    action, tasks = handler.take_next_tasks(num_tasks=3, job_id=taskq.job_id)
+    assert [t.name for t in tasks] == ["l1", "l1"]
+
+    for t in tasks:
+        t.update(status=EStatus.SUCCESS, _handler=handler)
+    assert handler.jobs_frontier(job_id=taskq.job_id) == []
+    assert handler.take_next_tasks(job_id=taskq.job_id) == (EAction.STOP, [])
+
+
+def test_claim_null_level(handler, config):
+    from .models import EStatus
+    from .handler import EAction
+
+    # null level tasks are counted and claimed at level 0
+    taskq = TaskQ(config=config).create_job(name="job1")
+    taskq.add_tasks([Task(name="null", level=None, entrypoint="")])
+    action, tasks = handler.take_next_tasks(num_tasks=2, job_id=taskq.job_id)
+    assert action == EAction.RUN_TASK and [t.name for t in tasks] == ["null"]
+    tasks[0].update(status=EStatus.SUCCESS, _handler=handler)
+    assert handler.take_next_tasks(job_id=taskq.job_id) == (EAction.STOP, [])
+
+    taskq = TaskQ(config=config).create_job(name="job2")
+    taskq.add_tasks(
+        [
+            Task(name="null", level=None, entrypoint="ataskq.tasks_utils.hello_world"),
+            Task(name="l0", level=0, entrypoint="ataskq.tasks_utils.hello_world"),
+            Task(name="l1", level=1, entrypoint="ataskq.tasks_utils.hello_world"),
+        ]
+    )
+    taskq.run()
+    assert [t.status for t in taskq.get_tasks()] == [EStatus.SUCCESS] * 3
+
+
+def test_jobs_frontier_per_job(handler, config):
+    from .handler import EAction
+
+    taskq1 = TaskQ(config=config).create_job(name="job1")
+    taskq1.add_tasks([Task(name="a", level=0, entrypoint=""), Task(name="b", level=1, entrypoint="")])
+    taskq2 = TaskQ(config=config).create_job(name="job2")
+    taskq2.add_tasks([Task(name="c", level=0, entrypoint="")])
+
+    # level barrier is per job, running job1 level 0 doesn't block job2 level 0
+    action, tasks = handler.take_next_tasks(num_tasks=1)
+    assert [t.name for t in tasks] == ["a"]
+    action, tasks = handler.take_next_tasks(num_tasks=2)
+    assert [t.name for t in tasks] == ["c"]
+    assert [f["job_id"] for f in handler.jobs_frontier()] == [taskq1.job_id, taskq2.job_id]
+
+
+@pytest.mark.parametrize("claim_policy", ["fifo", "priority", "fair"])
+def test_claim_policy(config, claim_policy):
+    if "http" in config["connection"]:
+        # claim policy is server config
+        pytest.skip()
+
+    config["handler"]["claim_policy"] = claim_policy
+    handler = from_config(config)
+    job_ids = []
+    for priority in [0, 2]:
+        taskq = TaskQ(config=config).create_job(priority=priority)
+        # null level tasks are claimed at level 0
+        taskq.add_tasks([Task(entrypoint="", level=None if i % 2 else 0) for i in range(6)])
+        job_ids.append(taskq.job_id)
+
+    _, tasks = handler.take_next_tasks(num_tasks=4)
+    claimed = [t.job_id for t in tasks]
+    if claim_policy == "fifo":
+        assert claimed == [job_ids[0]] * 4
+    elif claim_policy == "priority":
+        assert claimed == [job_ids[1]] * 4
+    else:
+        # weights 1:3
+        assert sorted(claimed) == [job_ids[0]] + [job_ids[1]] * 3
+
+        # shares by running tasks, 1 running (weight 1) vs 3 running (weight 3)
+        _, tasks = handler.take_next_tasks(num_tasks=4)
+        assert sorted([t.job_id for t in tasks]) == [job_ids[0]] + [job_ids[1]] * 3
+
+
+def test_assert_level_jobs(handler, config):
+    # job1 lowest pending level is 2, job2 lowest pending level is 0
+    TaskQ(config=config).create_job(name="job1").add_tasks([Task(name="l2", level=2, entrypoint="")])
+    TaskQ(config=config).create_job(name="job2").add_tasks([Task(name="l0", level=0, entrypoint="")])
+
+    # no job, lowest pending level across jobs
+    taskq = TaskQ(config=config)
+    assert taskq.assert_level(0) == range(0, 1)
+    with pytest.raises(AssertionError, match="below level"):
+        taskq.assert_level(1)
@@ -1,16 +1,19 @@
 from pathlib import Path
 from datetime import datetime, timedelta
 from copy import copy
-from multiprocessing import Process, Pool
+from multiprocessing import Process, Pool, Pipe
 import time
 
 import pytest
 
-from . import TaskQ, Job, Task, targs, EStatus
+from . import TaskQ, Job, Task, StateKWArg, targs, EStatus
+from .models import __ENTRYPOINTS__
 from .handler import DBHandler
 from .handler import EAction, from_config
 
-from .tasks_utils import dummy_args_task, write_to_file
+from .tasks_utils import dummy_args_task, write_to_file, async_write_to_file, counter_task, counter_kwarg
+from .state_kwargs import StateKWArgsCache
+from .worker_pool import worker_rss
 
 
 def non_decreasing(L):
@@ -276,6 +279,39 @@ def test_take_next_task(jtaskq):
     assert task is None
 
 
+def test_take_next_tasks(jtaskq):
+    in_task1 = Task(entrypoint=dummy_args_task, level=1, name="task1")
+    in_task2 = Task(entrypoint=dummy_args_task, level=1, name="task2")
+    in_task3 = Task(entrypoint=dummy_args_task, level=1, name="task3")
+    in_task4 = Task(entrypoint=dummy_args_task, level=2, name="task4")
+
+    jtaskq.add_tasks(
+        [
+            in_task4,
+            in_task1,
+            in_task2,
+            in_task3,
+        ]
+    )
+
+    action, tasks = jtaskq._take_next_tasks(level=None, num_tasks=2)
+    assert action == EAction.RUN_TASK
+    assert len(tasks) == 2
+    _compare_tasks(in_task1, tasks[0])
+    _compare_tasks(in_task2, tasks[1])
+    assert all([t.status == EStatus.RUNNING for t in tasks])
+
+    action, tasks = jtaskq._take_next_tasks(level=None, num_tasks=2)
+    assert action == EAction.RUN_TASK
+    assert len(tasks) == 1
+    _compare_tasks(in_task3, tasks[0])
+
+    # level 1 tasks still running
+    action, tasks = jtaskq._take_next_tasks(level=None, num_tasks=2)
+    assert action == EAction.WAIT
+    assert tasks == []
+
+
 def test_take_next_task_2_jobs(config):
     # todo: test should ne under ataskq
     handler = from_config(config)
@@ -417,6 +453,26 @@ def test_run_default(config, tmp_path: Path):
     assert filepath.read_text() == "task 0\n" "task 1\n" "task 2\n"
 
 
+def test_run_prefetch(config, tmp_path: Path):
+    filepath = tmp_path / "file.txt"
+
+    config["run"]["prefetch"] = 2
+    taskq = TaskQ(config=config).create_job()
+
+    taskq.add_tasks(
+        [
+            Task(entrypoint=write_to_file, targs=targs(filepath, "task 0\n")),
+            Task(entrypoint=write_to_file, targs=targs(filepath, "task 1\n")),
+            Task(entrypoint=write_to_file, targs=targs(filepath, "task 2\n")),
+        ]
+    )
+
+    taskq.run()
+
+    assert filepath.read_text() == "task 0\n" "task 1\n" "task 2\n"
+    assert all([t.status == EStatus.SUCCESS for t in taskq.get_tasks()])
+
+
 def test_run_task_raise_exception(config):
     # no exception raised
     try:
@@ -444,6 +500,245 @@ def test_run_task_raise_exception(config):
     assert excinfo.value.args[0] == "task failed"
 
 
+@pytest.mark.parametrize("executor", ["thread", "async", "dispatch"])
+def test_run_executor(config, tmp_path: Path, executor):
+    filepath = tmp_path / "file.txt"
+
+    taskq = TaskQ(config=config).create_job()
+
+    taskq.add_tasks(
+        [
+            Task(entrypoint=write_to_file, targs=targs(filepath, "task 0\n", sleep=0.5)),
+            Task(entrypoint=write_to_file, targs=targs(filepath, "task 1\n", sleep=0.5)),
+            Task(entrypoint=async_write_to_file, targs=targs(filepath, "task 2\n", sleep=0.5)),
+            Task(entrypoint=async_write_to_file, targs=targs(filepath, "task 3\n", sleep=0.5)),
+        ]
+    )
+
+    start = time.time()
+    taskq.run(concurrency=4, executor=executor)
+    assert time.time() - start < 1.5, "tasks are expected to run concurrently"
+
+    assert sorted(filepath.read_text().splitlines()) == ["task 0", "task 1", "task 2", "task 3"]
+    tasks = taskq.get_tasks()
+    assert all([t.status == EStatus.SUCCESS for t in tasks])
+    assert all([t.start_time is not None and t.pulse_time is not None for t in tasks])
+
+
+@pytest.mark.parametrize("executor", ["thread", "async", "dispatch"])
+def test_run_executor_raise_exception(config, executor):
+    config["run"]["raise_exception"] = True
+    taskq: TaskQ = TaskQ(config=config).create_job()
+    taskq.add_tasks([Task(entrypoint="ataskq.tasks_utils.exception_task", targs=targs(message="task failed"))])
+
+    with pytest.raises(Exception) as excinfo:
+        taskq.run(concurrency=2, executor=executor)
+    assert excinfo.value.args[0] == "task failed"
+    assert taskq.get_tasks()[0].status == EStatus.FAILURE
+
+
+def test_run_dispatch(config, tmp_path: Path):
+    filepath = tmp_path / "file.txt"
+    config["run"]["prefetch"] = 2
+
+    taskq = TaskQ(config=config).create_job()
+    taskq.add_tasks(
+        [Task(entrypoint=write_to_file, level=i // 4, targs=targs(filepath, f"task {i}\n")) for i in range(8)]
+        + [Task(entrypoint="ataskq.tasks_utils.crash_task", level=2)]
+    )
+
+    taskq.run(concurrency=2, executor="dispatch")
+
+    assert sorted(filepath.read_text().splitlines()) == sorted([f"task {i}" for i in range(8)])
+    tasks = taskq.get_tasks()
+    assert [t.status for t in tasks] == [EStatus.SUCCESS] * 8 + [EStatus.FAILURE]
+    assert all([t.start_time is not None and t.done_time is not None for t in tasks[:8]])
+    # levels are run in order
+    assert max([t.done_time for t in tasks[:4]]) <= min([t.start_time for t in tasks[4:8]])
+
+
+def test_run_dispatch_long_poll(config):
+    if "http" not in config["connection"]:
+        pytest.skip()
+
+    # claims are not held (long poll) while dispatched tasks status is not written yet
+    config["handler"]["long_poll_timeout"] = 8
+    taskq = TaskQ(config=config).create_job()
+    taskq.add_tasks([Task(entrypoint="ataskq.tasks_utils.dummy_args_task", level=i // 2) for i in range(6)])
+
+    start = time.time()
+    taskq.run(concurrency=2, executor="dispatch")
+    assert time.time() - start < 4
+    assert [t.status for t in taskq.get_tasks()] == [EStatus.SUCCESS] * 6
+
+
+@pytest.mark.parametrize("max_tasks_per_child, max_rss_per_child", [(2, None), (None, 0.001)])
+def test_run_dispatch_recycle(config, tmp_path: Path, max_tasks_per_child, max_rss_per_child):
+    filepath = tmp_path / "file.txt"
+    config["run"]["max_tasks_per_child"] = max_tasks_per_child
+    config["run"]["max_rss_per_child"] = max_rss_per_child
+
+    taskq = TaskQ(config=config).create_job()
+    taskq.add_tasks([Task(entrypoint=write_to_file, targs=targs(filepath, f"task {i}\n")) for i in range(5)])
+    taskq.run(concurrency=1, executor="dispatch")
+
+    assert filepath.read_text().splitlines() == [f"task {i}" for i in range(5)]
+    stats = taskq.worker_stats
+    assert len(stats) == 1
+    assert stats[0]["tasks"] == 5
+    if max_tasks_per_child is not None:
+        assert stats[0]["recycles"] == 2
+        assert stats[0]["process_tasks"] == 1
+        assert stats[0]["rss"] is not None
+    else:
+        assert stats[0]["recycles"] == 5
+
+
+def _send_worker_rss(conn):
+    conn.send(worker_rss())
+
+
+@pytest.mark.skipif(not Path("/proc/self/smaps_rollup").exists(), reason="private memory not available")
+def test_worker_rss():
+    # forked worker private memory excludes pages shared (copy on write) with the parent
+    data = bytearray(100 * 2**20)
+    parent_conn, child_conn = Pipe()
+    p = Process(target=_send_worker_rss, args=(child_conn,))
+    p.start()
+    rss = parent_conn.recv()
+    p.join()
+
+    assert worker_rss() >= 100
+    assert rss < 50
+    del data
+
+
+def test_run_dispatch_restart_crashed(config, tmp_path: Path):
+    filepath = tmp_path / "file.txt"
+
+    taskq = TaskQ(config=config).create_job()
+    taskq.add_tasks(
+        [Task(entrypoint="ataskq.tasks_utils.crash_task", level=0)]
+        + [Task(entrypoint=write_to_file, level=1, targs=targs(filepath, f"task {i}\n")) for i in range(2)]
+    )
+    taskq.run(concurrency=1, executor="dispatch")
+
+    assert [t.status for t in taskq.get_tasks()] == [EStatus.FAILURE, EStatus.SUCCESS, EStatus.SUCCESS]
+    stats = taskq.worker_stats
+    assert stats[0]["restarts"] == 1
+    assert stats[0]["tasks"] == 2
+
+
+def test_preload(config, tmp_path: Path):
+    filepath = tmp_path / "file.txt"
+    config["run"]["gc_freeze"] = True
+    ep = "ataskq.tasks_utils.write_to_file_tasks.write_to_file"
+    __ENTRYPOINTS__.pop(ep, None)
+
+    taskq = TaskQ(config=config).create_job()
+    taskq.add_tasks([Task(entrypoint=ep, targs=targs(filepath, f"task {i}\n")) for i in range(2)])
+    taskq.run(concurrency=2, executor="dispatch", preload=["json", ep])
+
+    # resolved in parent before forking workers
+    assert __ENTRYPOINTS__[ep] is write_to_file
+    assert sorted(filepath.read_text().splitlines()) == ["task 0", "task 1"]
+
+    with pytest.raises(ModuleNotFoundError):
+        taskq.preload("ataskq_no_such_module")
+    with pytest.raises(AssertionError):
+        taskq.preload("ataskq.tasks_utils.no_such_func")
+
+
+def test_preload_import_error(config, tmp_path: Path, monkeypatch):
+    # import error raised by an existing module is not masked by entrypoint resolving
+    (tmp_path / "ataskq_test_pkg").mkdir()
+    (tmp_path / "ataskq_test_pkg" / "__init__.py").write_text("")
+    (tmp_path / "ataskq_test_pkg" / "mod.py").write_text("import ataskq_no_such_module\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    taskq = TaskQ(config=config)
+    with pytest.raises(ModuleNotFoundError, match="ataskq_no_such_module"):
+        taskq.preload("ataskq_test_pkg.mod")
+
+
+@pytest.mark.parametrize("executor", ["process", "thread", "dispatch"])
+def test_state_kwargs(config, tmp_path: Path, executor):
+    filepath = tmp_path / "file.txt"
+
+    taskq = TaskQ(config=config).create_job()
+    taskq.add_state_kwargs(
+        [
+            StateKWArg(name="counter", entrypoint=counter_kwarg, targs=targs(name="job counter")),
+            StateKWArg(name="not_requested", entrypoint="ataskq.tasks_utils.exception_task"),
+        ]
+    )
+    assert [s.name for s in taskq.get_state_kwargs()] == ["counter", "not_requested"]
+    taskq.add_tasks([Task(entrypoint=counter_task, targs=targs(filepath=filepath)) for _ in range(3)])
+
+    taskq.run(concurrency=1, executor=executor)
+
+    # created once per worker process (not requested state kwargs are not created)
+    assert filepath.read_text().splitlines() == ["job counter 0", "job counter 1", "job counter 2"]
+    assert all([t.status == EStatus.SUCCESS for t in taskq.get_tasks()])
+
+
+def test_state_kwargs_cache(config):
+    handler = from_config(config)
+    jobs = [TaskQ(config=config, handler=handler).create_job() for _ in range(2)]
+    for taskq in jobs:
+        taskq.add_state_kwargs([StateKWArg(name="counter", entrypoint=counter_kwarg)])
+
+    cache = StateKWArgsCache(handler, max_size=1)
+    kwargs, pinned = cache.inject(jobs[0].job_id, counter_task, dict())
+    counter0 = kwargs["counter"]
+    cache.release(pinned)
+    kwargs, pinned = cache.inject(jobs[0].job_id, counter_task, dict())
+    assert kwargs["counter"] is counter0
+    cache.release(pinned)
+    # passed kwargs are not overridden, not requested are not injected
+    assert cache.inject(jobs[0].job_id, counter_task, dict(counter=None)) == (dict(counter=None), [])
+    assert cache.inject(jobs[0].job_id, dummy_args_task, dict()) == (dict(), [])
+
+    # least recently used is evicted and torn down
+    counter1 = cache.get(jobs[1].job_id, "counter")
+    assert counter0.closed and not counter1.closed
+    assert len(cache) == 1
+
+    cache.clear()
+    assert counter1.closed
+    assert len(cache) == 0
+
+
+def test_state_kwargs_cache_pinned(config):
+    def two_counters_task(counter=None, other=None):
+        pass
+
+    handler = from_config(config)
+    jobs = [TaskQ(config=config, handler=handler).create_job() for _ in range(2)]
+    jobs[0].add_state_kwargs([StateKWArg(name="counter", entrypoint=counter_kwarg)])
+    jobs[1].add_state_kwargs([StateKWArg(name="counter", entrypoint=counter_kwarg)])
+    cache = StateKWArgsCache(handler, max_size=1)
+
+    # objects in use are not evicted (within a task and by other running tasks)
+    kwargs, pinned = cache.inject(jobs[0].job_id, counter_task, dict())
+    # added after job state kwargs were fetched
+    jobs[0].add_state_kwargs([StateKWArg(name="other", entrypoint=counter_kwarg)])
+    kwargs2, pinned2 = cache.inject(jobs[0].job_id, two_counters_task, dict())
+    assert kwargs2["counter"] is kwargs["counter"]
+    counter1 = cache.get(jobs[1].job_id, "counter")
+    assert not any(c.closed for c in [kwargs2["counter"], kwargs2["other"], counter1])
+    assert len(cache) == 3
+
+    # released objects are evicted, least recently used first
+    cache.release(pinned2)
+    assert kwargs2["other"].closed and counter1.closed and not kwargs["counter"].closed
+    cache.release(pinned)
+    assert len(cache) == 1 and not kwargs["counter"].closed
+
+    cache.clear()
+    assert kwargs["counter"].closed
+
+
 def test_run_2_processes(config, tmp_path: Path):
     filepath = tmp_path / "file.txt"
 
@@ -587,6 +882,45 @@ def test_monitor_pulse_failure(config):
     assert stop - start > timedelta(seconds=1.5)
 
 
+def test_pulse_tasks(jtaskq):
+    jtaskq.add_tasks(
+        [
+            Task(entrypoint=dummy_args_task, name="task1"),
+            Task(entrypoint=dummy_args_task, name="task2"),
+            Task(entrypoint=dummy_args_task, name="task3"),
+        ]
+    )
+
+    _, tasks = jtaskq._take_next_tasks(level=None, num_tasks=2)
+    assert len(tasks) == 2  # sanity
+
+    # single batch update, only running tasks are pulsed
+    now = datetime.now() + timedelta(minutes=1)
+    jtaskq.handler.pulse_tasks([t.task_id for t in jtaskq.get_tasks()], pulse_time=now)
+
+    tasks = jtaskq.get_tasks()
+    assert [t.pulse_time for t in tasks] == [now, now, None]
+
+
+def test_monitor_batch_pulse(config):
+    config["monitor"]["pulse_interval"] = 0.1
+    taskq = TaskQ(config=config).create_job()
+    taskq.add_tasks([Task(entrypoint=dummy_args_task, name="task1"), Task(entrypoint=dummy_args_task, name="task2")])
+
+    _, tasks = taskq._take_next_tasks(level=None, num_tasks=2)
+    start = {t.task_id: t.pulse_time for t in taskq.get_tasks()}
+    for task in tasks:
+        taskq.monitor.add(task)
+    time.sleep(0.5)
+
+    # single monitor thread pulses all tasks of the process
+    assert taskq.monitor is taskq.monitor
+    assert all([t.pulse_time > start[t.task_id] for t in taskq.get_tasks()])
+
+    taskq._stop_monitor()
+    assert taskq._monitor is None
+
+
 def test_task_wait_timeout(config):
     # set monitor pulse longer than timeout
     config["run"]["raise_exception"] = True
@@ -638,3 +972,116 @@ def test_run_forever(config):
     assert p.is_alive(), "run finished with run_forever True"
     p.kill()
     p.join()
+
+
+def test_task_deps(jtaskq):
+    a = Task(name="a", entrypoint="")
+    b = Task(name="b", entrypoint="", depends_on=[a])
+    c = Task(name="c", entrypoint="")
+    d = Task(name="d", entrypoint="", depends_on=[b, c])
+    jtaskq.add_tasks([a, b, c, d])
+    handler = jtaskq.handler
+
+    # only tasks with no pending dependencies are claimable
+    _, tasks = handler.take_next_tasks(num_tasks=4, job_id=jtaskq.job_id)
+    assert [t.name for t in tasks] == ["a", "c"]
+    assert handler.take_next_tasks(num_tasks=4, job_id=jtaskq.job_id) == (EAction.WAIT, [])
+
+    # b is ready as soon as a succeeds (c still running)
+    jtaskq.update_task_status(tasks[0], EStatus.SUCCESS)
+    _, claimed = handler.take_next_tasks(num_tasks=4, job_id=jtaskq.job_id)
+    assert [t.name for t in claimed] == ["b"]
+
+    jtaskq.update_task_status(tasks[1], EStatus.SUCCESS)
+    assert handler.take_next_tasks(num_tasks=4, job_id=jtaskq.job_id) == (EAction.WAIT, [])
+    jtaskq.update_task_status(claimed[0], EStatus.SUCCESS)
+    _, claimed = handler.take_next_tasks(num_tasks=4, job_id=jtaskq.job_id)
+    assert [t.name for t in claimed] == ["d"]
+    assert claimed[0].blockers == 0
+
+
+def test_task_deps_failure(jtaskq):
+    a = Task(name="a", entrypoint="")
+    b = Task(name="b", entrypoint="", depends_on=[a])
+    c = Task(name="c", entrypoint="", depends_on=[b])
+    jtaskq.add_tasks([a, b, c])
+
+    # dependencies added to existing tasks
+    e = Task(name="e", entrypoint="", depends_on=[c.task_id])
+    jtaskq.add_tasks([e])
+    assert Task.get(e.task_id, _handler=jtaskq.handler).blockers == 1
+
+    # parent failure fails dependent tasks recursively
+    _, task = jtaskq.handler.take_next_task(job_id=jtaskq.job_id)
+    assert task.name == "a"
+    jtaskq.update_task_status(task, EStatus.FAILURE)
+    assert [t.status for t in jtaskq.get_tasks()] == [EStatus.FAILURE] * 4
+    assert jtaskq.handler.take_next_task(job_id=jtaskq.job_id) == (EAction.STOP, None)
+
+    # dependency on failed task
+    f = Task(name="f", entrypoint="", depends_on=[a])
+    jtaskq.add_tasks([f])
+    assert Task.get(f.task_id, _handler=jtaskq.handler).status == EStatus.FAILURE
+
+    # failed dependent tasks are done
+    for t in jtaskq.get_tasks():
+        assert t.done_time is not None and t.pulse_time is not None
+
+
+def test_task_deps_failure_deep(jtaskq):
+    # failure propagation is not bounded by triggers recursion depth
+    tasks = [Task(name="0", entrypoint="")]
+    for i in range(1, 1100):
+        tasks.append(Task(name=f"{i}", entrypoint="", depends_on=[tasks[-1]]))
+    jtaskq.add_tasks(tasks)
+
+    _, task = jtaskq.handler.take_next_task(job_id=jtaskq.job_id)
+    assert task.name == "0"
+    jtaskq.update_task_status(task, EStatus.FAILURE)
+    failed = Task.count_all(_handler=jtaskq.handler, job_id=jtaskq.job_id, status=f"'{EStatus.FAILURE}'")
+    assert failed == 1100
+    assert jtaskq.handler.take_next_task(job_id=jtaskq.job_id) == (EAction.STOP, None)
+
+
+def test_task_deps_invalid(jtaskq):
+    a = Task(name="a", entrypoint="", level=1)
+    jtaskq.add_tasks([a])
+
+    # missing dependency, created tasks are rolled back
+    b = Task(name="b", entrypoint="", depends_on=[a.task_id + 1000])
+    with pytest.raises(Exception, match="not found"):
+        jtaskq.add_tasks([b])
+    assert b.task_id is None
+
+    # dependency on higher level task never runs
+    c = Task(name="c", entrypoint="", level=0, depends_on=[a])
+    with pytest.raises(Exception, match="higher level"):
+        jtaskq.add_tasks([c])
+    assert c.task_id is None
+
+    # tasks and their dependencies are created in one transaction
+    b = Task(name="b", entrypoint="", level=1)
+    c = Task(name="c", entrypoint="", level=1, depends_on=[b, a.task_id + 1000])
+    with pytest.raises(Exception, match="not found"):
+        jtaskq.add_tasks([b, c])
+    assert b.task_id is None and c.task_id is None
+
+    assert [t.name for t in jtaskq.get_tasks()] == ["a"]
+    d = Task(name="d", entrypoint="", level=1, depends_on=[a])
+    jtaskq.add_tasks([d])
+    assert [t.name for t in jtaskq.get_tasks()] == ["a", "d"]
+
+    # self dependency, dependencies cycle
+    with pytest.raises(Exception, match="itself"):
+        jtaskq.handler.add_task_deps([(a.task_id, a.task_id)])
+    e = Task(name="e", entrypoint="", level=1, depends_on=[d])
+    jtaskq.add_tasks([e])
+    with pytest.raises(Exception, match="cycle"):
+        jtaskq.handler.add_task_deps([(d.task_id, e.task_id)])
+    with pytest.raises(Exception, match="cycle"):
+        jtaskq.handler.add_task_deps([(a.task_id, e.task_id)])
+    f, g = Task(name="f", entrypoint="", level=1), Task(name="g", entrypoint="", level=1)
+    jtaskq.add_tasks([f, g])
+    with pytest.raises(Exception, match="cycle"):
+        jtaskq.handler.add_task_deps([(f.task_id, g.task_id), (g.task_id, f.task_id)])
+    assert [t.blockers for t in jtaskq.get_tasks()] == [0, 1, 1, 0, 0]
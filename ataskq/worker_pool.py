@@ -0,0 +1,192 @@
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import wait
+from typing import Callable, List, Tuple
+import os
+import sys
+import time
+
+from .models import Task
+
+try:
+    import resource
+except ModuleNotFoundError:
+    resource = None
+
+
+def worker_rss():
+    """current process private memory in MB (shared copy on write pages of the forked worker are excluded),
+    resident set size if private memory is not available (peak rss if current is not available), None if not supported
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            kb = [int(line.split()[1]) for line in f if line.startswith(("Private_Clean:", "Private_Dirty:"))]
+        if kb:
+            return sum(kb) / 2**10
+    except Exception:
+        pass
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except Exception:
+        pass
+
+    if resource is None:
+        return None
+
+    # ru_maxrss is in bytes on macos, kilobytes otherwise
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 2**20 if sys.platform == "darwin" else maxrss / 2**10
+
+
+class Worker:
+    """Local worker process handle, the worker runs the tasks sent over its pipe one at a time.
+
+    stats are kept per worker slot, a recycled / restarted worker process continues its predecessor stats.
+    """
+
+    def __init__(self, worker_id: int, target: Callable, stats: dict = None) -> None:
+        self.worker_id = worker_id
+        self.conn, worker_conn = Pipe()
+        self.process = Process(target=target, args=(worker_conn,))
+        self.process.start()
+        worker_conn.close()
+        self.task: Task = None
+        self.task_start = None
+        self.tasks = 0  # tasks run by current process
+        self.retire = False
+
+        self.stats = stats or dict(worker_id=worker_id, tasks=0, busy_time=0.0, recycles=0, restarts=0)
+        self.stats.update(pid=self.process.pid, process_tasks=0, rss=None)
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    @property
+    def busy(self):
+        return self.task is not None
+
+    def send(self, task: Task):
+        assert not self.busy, f"worker '{self.worker_id}' is busy running task '{self.task}'"
+        self.conn.send(task)
+        self.task = task
+        self.task_start = time.time()
+
+    def done(self, rss: float = None):
+        self.tasks += 1
+        self.stats["tasks"] += 1
+        self.stats["process_tasks"] = self.tasks
+        self.stats["busy_time"] += time.time() - self.task_start
+        self.stats["rss"] = rss
+        self.task = None
+        self.task_start = None
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+
+    def join(self, timeout: float = None):
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """Dispatcher side of long lived local worker processes.
+
+    tasks are sent to idle workers, workers send back ('update', task_id, fields) messages while running a task and a
+    ('done', task_id, (error, rss)) message when the task ends. target(conn) is the worker process main.
+
+    workers are recycled (replaced by a new process) after max_tasks_per_child tasks or when their memory exceeds
+    max_rss_per_child MB, crashed workers are restarted (unless crashed before running any task).
+    """
+
+    def __init__(
+        self, num_workers: int, target: Callable, max_tasks_per_child: int = None, max_rss_per_child: float = None
+    ) -> None:
+        self._target = target
+        self._max_tasks_per_child = max_tasks_per_child
+        self._max_rss_per_child = max_rss_per_child
+        self._workers = [Worker(i, target) for i in range(num_workers)]
+
+    @property
+    def workers(self) -> List[Worker]:
+        return list(self._workers)
+
+    def idle(self) -> List[Worker]:
+        return [w for w in self._workers if not w.busy]
+
+    def busy(self) -> List[Worker]:
+        return [w for w in self._workers if w.busy]
+
+    def stats(self) -> List[dict]:
+        """per worker stats (tasks, busy time, last reported private memory MB, recycles, restarts)"""
+        return [dict(w.stats) for w in sorted(self._workers, key=lambda w: w.worker_id)]
+
+    def _replace(self, worker: Worker) -> Worker:
+        new_worker = Worker(worker.worker_id, self._target, stats=worker.stats)
+        self._workers[self._workers.index(worker)] = new_worker
+
+        return new_worker
+
+    def _recv(self, worker: Worker) -> List[Tuple[str, Task, object]]:
+        ret = []
+        try:
+            while worker.conn.poll():
+                kind, _, value = worker.conn.recv()
+                if kind == "done":
+                    error, rss = value
+                    ret.append((kind, worker.task, error))
+                    worker.done(rss)
+                    worker.retire = (
+                        self._max_tasks_per_child is not None and worker.tasks >= self._max_tasks_per_child
+                    ) or (self._max_rss_per_child is not None and rss is not None and rss >= self._max_rss_per_child)
+                else:
+                    ret.append((kind, worker.task, value))
+        except (EOFError, OSError):
+            # worker exited, handled by caller
+            pass
+
+        return ret
+
+    def wait(self, timeout: float = None) -> List[Tuple[str, Task, object]]:
+        """wait up to timeout sec for workers messages, returns (kind, task, value) list.
+
+        workers which exited unexpectedly are reported as ('crashed', task, exitcode).
+        """
+        objs = dict()
+        for w in self._workers:
+            objs[w.conn] = w
+            objs[w.process.sentinel] = w
+        ready = wait(list(objs.keys()), timeout)
+
+        ret = []
+        for worker in dict.fromkeys([objs[r] for r in ready]):
+            ret += self._recv(worker)
+            if not worker.process.is_alive():
+                worker.join()
+                ret.append(("crashed", worker.task, worker.process.exitcode))
+                if worker.tasks == 0 and worker.task is None:
+                    # crashed on startup, not restarted (avoid restart loop)
+                    self._workers.remove(worker)
+                else:
+                    self._replace(worker).stats["restarts"] += 1
+            elif worker.retire:
+                worker.stop()
+                worker.join()
+                self._replace(worker).stats["recycles"] += 1
+
+        return ret
+
+    def close(self, timeout: float = None):
+        """stop workers, workers still running after timeout sec are terminated"""
+        for w in self._workers:
+            w.stop()
+        for w in self._workers:
+            w.join(timeout)
+        self._workers = []
@@ -0,0 +1,51 @@
+"""bulk tasks insert benchmark.
+
+Measures Job.add_tasks inserted rows per second for each of the given connections.
+
+usage:
+    python benchmarks/bulk_insert.py --connection sqlite://bench.sqlite3 pg://postgres:postgres@localhost:5432/postgres
+    python benchmarks/bulk_insert.py --connection <connection> --tasks 500000 --chunk-size 5000
+"""
+
+import argparse
+import time
+
+import context
+from ataskq import TaskQ, Task, targs
+from ataskq.config import load_config
+
+
+def run(connection, num_tasks, chunk_size):
+    config = load_config({"connection": connection, "handler": {"bulk_chunk_size": chunk_size}})
+    taskq = TaskQ(config=config).create_job(name="bulk_insert")
+
+    tasks = [
+        Task(name=f"task {i}", entrypoint="ataskq.tasks_utils.dummy_args_task", targs=targs(i, payload="x" * 32))
+        for i in range(num_tasks)
+    ]
+
+    start = time.time()
+    taskq.add_tasks(tasks)
+    elapsed = time.time() - start
+
+    taskq.delete_job()
+
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connection", nargs="+", default=["sqlite://ataskq.db.sqlite3"], help="connection strings")
+    parser.add_argument("--tasks", "-n", type=int, default=100000, help="number of tasks to insert")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="rows per insert statement")
+    args = parser.parse_args()
+
+    print(f"tasks: {args.tasks}, chunk size: {args.chunk_size}")
+    print(f"{'connection':>50} {'sec':>8} {'rows/sec':>12}")
+    for connection in args.connection:
+        elapsed = run(connection, args.tasks, args.chunk_size)
+        print(f"{connection:>50} {elapsed:>8.2f} {args.tasks / elapsed:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""take_next_task contention benchmark.
+
+Measures claimed tasks per second while the number of concurrent claiming workers grows.
+Each worker claims tasks in a loop (tasks are never executed) until no more tasks are available.
+
+usage:
+    python benchmarks/claim_contention.py --connection pg://postgres:postgres@localhost:5432/postgres --tasks 5000
+    python benchmarks/claim_contention.py --connection <connection> --workers 1 2 4 8 16 32 --no-skip-locked
+"""
+
+import argparse
+import time
+from multiprocessing import Pool
+
+import context
+from ataskq import TaskQ, Task
+from ataskq.handler import EAction, from_config
+from ataskq.config import load_config
+
+
+def claim_worker(args):
+    config, job_id = args
+    handler = from_config(config)
+
+    claims = 0
+    while True:
+        action, _ = handler.take_next_task(job_id=job_id)
+        if action != EAction.RUN_TASK:
+            break
+        claims += 1
+
+    return claims
+
+
+def run(config, num_tasks, num_workers):
+    taskq = TaskQ(config=config).create_job(name=f"claim_contention_{num_workers}")
+    taskq.add_tasks([Task(entrypoint="ataskq.skip_run_task") for _ in range(num_tasks)])
+
+    with Pool(num_workers) as p:
+        start = time.time()
+        claims = p.map(claim_worker, [(config, taskq.job_id)] * num_workers)
+        elapsed = time.time() - start
+
+    taskq.delete_job()
+    assert sum(claims) == num_tasks, f"claimed {sum(claims)} tasks out of {num_tasks}"
+
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connection", help="ataskq connection string, defaults to configuration connection")
+    parser.add_argument("--tasks", "-n", type=int, default=2000, help="number of tasks to claim per run")
+    parser.add_argument("--workers", "-w", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--no-skip-locked", action="store_true", help="claim with FOR UPDATE (postgresql)")
+    args = parser.parse_args()
+
+    config = {"handler": {"skip_locked": not args.no_skip_locked}, "db": {"max_jobs": None}}
+    if args.connection:
+        config["connection"] = args.connection
+    config = load_config(config)
+
+    print(f"connection: {config['connection']}, skip_locked: {config['handler']['skip_locked']}, tasks: {args.tasks}")
+    print(f"{'workers':>8} {'sec':>8} {'claims/sec':>12}")
+    for num_workers in args.workers:
+        elapsed = run(config, args.tasks, num_workers)
+        print(f"{num_workers:>8} {elapsed:>8.2f} {args.tasks / elapsed:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__) + "/..")
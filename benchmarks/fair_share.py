@@ -0,0 +1,85 @@
+"""Claim policy fair share simulation benchmark.
+
+Simulates a shared runner pool over jobs of different priorities: every tick done tasks are set to success and
+free runner slots claim new tasks (tasks run for `--duration` ticks). Jobs are created in order, so the first job
+is the "huge early job". Prints per job claimed tasks share of each claim policy and claim time.
+
+usage:
+    python benchmarks/fair_share.py --priorities 0 0 1 3 --runners 16 --ticks 200
+    python benchmarks/fair_share.py --connection pg://postgres:postgres@localhost:5432/postgres --policies fair
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from collections import deque
+
+import context
+from ataskq import TaskQ, Task
+from ataskq.models import Job, EStatus
+from ataskq.handler import from_config
+from ataskq.config import load_config
+
+
+def run(config, priorities, num_tasks, num_runners, num_ticks, duration):
+    handler = from_config(config)
+    job_ids = []
+    for i, priority in enumerate(priorities):
+        taskq = TaskQ(config=config).create_job(name=f"fair_share_{i}", priority=priority)
+        taskq.add_tasks([Task(entrypoint="ataskq.skip_run_task") for _ in range(num_tasks)])
+        job_ids.append(taskq.job_id)
+
+    claims = {job_id: 0 for job_id in job_ids}
+    running = deque()  # (done tick, task)
+    claim_time = 0
+    num_claims = 0
+    for tick in range(num_ticks):
+        while running and running[0][0] <= tick:
+            _, task = running.popleft()
+            task.update(status=EStatus.SUCCESS, _handler=handler)
+
+        free = num_runners - len(running)
+        if free == 0:
+            continue
+
+        start = time.perf_counter()
+        _, tasks = handler.take_next_tasks(num_tasks=free)
+        claim_time += time.perf_counter() - start
+        num_claims += 1
+        for task in tasks:
+            claims[task.job_id] += 1
+            running.append((tick + duration, task))
+
+    for job_id in job_ids:
+        handler.delete(Job, job_id)
+
+    return [claims[job_id] for job_id in job_ids], claim_time / max(num_claims, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connection", help="ataskq connection string, defaults to temporary sqlite db")
+    parser.add_argument("--priorities", "-p", type=float, nargs="+", default=[0, 0, 1, 3], help="jobs priorities")
+    parser.add_argument("--tasks", "-n", type=int, default=2000, help="number of tasks per job")
+    parser.add_argument("--runners", "-r", type=int, default=16, help="runner pool slots")
+    parser.add_argument("--ticks", "-t", type=int, default=200, help="simulation ticks")
+    parser.add_argument("--duration", "-d", type=int, default=4, help="task duration in ticks")
+    parser.add_argument("--policies", nargs="+", default=["fifo", "priority", "fair"])
+    args = parser.parse_args()
+
+    connection = args.connection or f"sqlite://{os.path.join(tempfile.mkdtemp(), 'ataskq.db.sqlite3')}"
+    print(f"connection: {connection}, priorities: {args.priorities}, runners: {args.runners}, ticks: {args.ticks}")
+    print(
+        f"{'policy':>10} {'claim ms':>9} "
+        + " ".join([f"{f'job{i} ({p:g})':>12}" for i, p in enumerate(args.priorities)])
+    )
+    for policy in args.policies:
+        config = load_config({"connection": connection, "handler": {"claim_policy": policy}, "db": {"max_jobs": None}})
+        claims, claim_time = run(config, args.priorities, args.tasks, args.runners, args.ticks, args.duration)
+        shares = " ".join([f"{c / max(sum(claims), 1):>12.1%}" for c in claims])
+        print(f"{policy:>10} {claim_time * 1000:>9.2f} {shares}")
+
+
+if __name__ == "__main__":
+    main()
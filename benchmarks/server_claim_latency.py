@@ -0,0 +1,103 @@
+"""server take_next_task latency under status queries load benchmark.
+
+Starts an ataskq server (uvicorn), then measures take_next_task request latency (p50/p99) of a claiming client,
+first alone and then while concurrent clients keep requesting the heavy jobs_status / tasks_status queries.
+
+usage:
+    python benchmarks/server_claim_latency.py --connection pg://postgres:postgres@localhost:5432/postgres
+    python benchmarks/server_claim_latency.py --tasks 20000 --claims 500 --query-clients 8
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from threading import Thread, Event
+
+import requests
+
+import context
+from ataskq import TaskQ, Task
+from ataskq.handler import EAction, from_config
+
+
+def start_server(connection, port):
+    env = dict(os.environ, ataskq_connection=connection)
+    p = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "ataskq.server.server:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+        cwd=os.path.dirname(context.__file__) + "/..",
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(f"{url}/health")
+            return p, url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+
+    p.terminate()
+    raise Exception("server failed to start")
+
+
+def query_client(url, job_id, stop: Event):
+    while not stop.is_set():
+        requests.get(f"{url}/api/custom_query/jobs_status")
+        requests.get(f"{url}/api/custom_query/tasks_status", params=dict(job_id=job_id))
+
+
+def claim_latency(url, job_id, num_claims):
+    handler = from_config({"connection": url, "handler": {"db_init": False, "long_poll_timeout": None}})
+    latency = []
+    for _ in range(num_claims):
+        start = time.perf_counter()
+        action, _ = handler.take_next_task(job_id=job_id)
+        latency.append(time.perf_counter() - start)
+        assert action == EAction.RUN_TASK, "not enough tasks, increase --tasks"
+
+    latency.sort()
+    return latency[len(latency) // 2], latency[int(len(latency) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connection", help="server db connection, defaults to temporary sqlite db")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--tasks", "-n", type=int, default=10000, help="number of job tasks (status queries size)")
+    parser.add_argument("--claims", type=int, default=300, help="number of measured claims per run")
+    parser.add_argument("--query-clients", "-q", type=int, default=8, help="number of concurrent status clients")
+    args = parser.parse_args()
+
+    connection = args.connection or f"sqlite://{tempfile.mkdtemp()}/ataskq.db.sqlite3"
+    taskq = TaskQ(config={"connection": connection, "db": {"max_jobs": None}}).create_job(name="claim_latency")
+    server, url = start_server(connection, args.port)
+    try:
+        taskq.add_tasks(
+            [Task(entrypoint="ataskq.skip_run_task", level=i % 10, name=f"task{i % 100}") for i in range(args.tasks)]
+        )
+
+        print(f"connection: {connection}, tasks: {args.tasks}, claims: {args.claims}")
+        print(f"{'query clients':>14} {'p50 ms':>8} {'p99 ms':>8}")
+        p50, p99 = claim_latency(url, taskq.job_id, args.claims)
+        print(f"{0:>14} {p50 * 1000:>8.1f} {p99 * 1000:>8.1f}")
+
+        stop = Event()
+        clients = [Thread(target=query_client, args=(url, taskq.job_id, stop)) for _ in range(args.query_clients)]
+        [c.start() for c in clients]
+        try:
+            p50, p99 = claim_latency(url, taskq.job_id, args.claims)
+        finally:
+            stop.set()
+            [c.join() for c in clients]
+        print(f"{args.query_clients:>14} {p50 * 1000:>8.1f} {p99 * 1000:>8.1f}")
+
+        taskq.delete_job()
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
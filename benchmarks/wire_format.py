@@ -0,0 +1,88 @@
+"""REST api wire format benchmark.
+
+Starts an ataskq server (uvicorn) and compares json and msgpack wire formats:
+request + response body bytes and time per request of bulk create, get all tasks and take_next_task.
+
+usage:
+    python benchmarks/wire_format.py --tasks 1000 --targs-size 4096
+    python benchmarks/wire_format.py --connection pg://postgres:postgres@localhost:5432/postgres
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import context
+from server_claim_latency import start_server
+from ataskq import Task
+from ataskq.models import Job
+from ataskq.handler import from_config
+
+
+class BodyBytes:
+    """requests response hook, sums request and response body bytes"""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.bytes = 0
+
+    def __call__(self, res, *args, **kwargs):
+        body = res.request.body or b""
+        self.requests += 1
+        self.bytes += len(body) + len(res.content)
+
+
+def measure(handler, func):
+    body_bytes = BodyBytes()
+    handler.session.hooks["response"] = [body_bytes]
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+
+    return body_bytes.bytes / body_bytes.requests, elapsed / body_bytes.requests
+
+
+def run(url, wire_format, num_tasks, targs_size):
+    config = {"connection": url, "handler": {"db_init": False, "long_poll_timeout": None, "bulk_chunk_size": num_tasks}}
+    handler = from_config([config, {"rest": {"wire_format": wire_format}}])
+    job = Job(name=f"wire_format_{wire_format}").create(_handler=handler)
+    tasks = [Task(entrypoint="ataskq.skip_run_task", targs=os.urandom(targs_size)) for _ in range(num_tasks)]
+
+    ret = dict()
+    ret["bulk create"] = measure(handler, lambda: job.add_tasks(tasks, _handler=handler))
+    ret["get all"] = measure(
+        handler, lambda: Task.get_all(_handler=handler, _where=f"job_id = {job.job_id}", _limit=num_tasks)
+    )
+    ret["take next task"] = measure(
+        handler, lambda: [handler.take_next_task(job_id=job.job_id) for _ in range(min(num_tasks, 200))]
+    )
+    job.delete(_handler=handler)
+
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connection", help="server db connection, defaults to temporary sqlite db")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--tasks", "-n", type=int, default=1000, help="number of tasks")
+    parser.add_argument("--targs-size", type=int, default=1024, help="task targs bytes")
+    args = parser.parse_args()
+
+    connection = args.connection or f"sqlite://{tempfile.mkdtemp()}/ataskq.db.sqlite3"
+    from_config({"connection": connection})  # init db
+    server, url = start_server(connection, args.port)
+    try:
+        print(f"connection: {connection}, tasks: {args.tasks}, targs size: {args.targs_size}")
+        print(f"{'request':>16} {'format':>8} {'bytes/req':>12} {'ms/req':>8}")
+        for wire_format in ["json", "msgpack"]:
+            for request, (num_bytes, sec) in run(url, wire_format, args.tasks, args.targs_size).items():
+                print(f"{request:>16} {wire_format:>8} {num_bytes:>12.0f} {sec * 1000:>8.2f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,13 @@ import { signal, effect, batch } from "@preact/signals";
 
 // nav
 export const title = signal(null);
-export const offsetDefault = 0;
 export const limitDefault = 100;
-export const offset = signal(offsetDefault);
 export const limit = signal(limitDefault);
 
-// pagination
-export const page = signal(1);
+// keyset pagination
+export const after = signal(null); // current page cursor (null for first page)
+export const nextCursor = signal(null); // next page cursor from X-Next-Cursor response header (null for last page)
+export const prevCursors = signal([]); // previous pages cursors stack
 export const currentPage = signal(1);
 
 // job_id
@@ -71,6 +71,7 @@ const myfetch = async (pathname, search) => {
         throw err;
     }
 
+    nextCursor.value = response.headers.get('X-Next-Cursor');
     const data = await response.json();
     console.log('fetch', data);
     if (data){
@@ -102,10 +103,10 @@ const myfetch = async (pathname, search) => {
 
     // update pagination
     const mylimit = searchParams.get('_limit') || limitDefault;
-    const myoffset = searchParams.get('_offset') || offsetDefault;
+    const myafter = searchParams.get('_after');
     batch(() => {
         limit.value = mylimit;
-        offset.value = myoffset;
+        after.value = myafter;
     });
 }());
 
@@ -113,8 +114,14 @@ effect(() => {
     const { pathname, search, hash } = window.location;
     const searchParams = new URLSearchParams(search);
 
-    searchParams.set('_offset', offset);
+    searchParams.delete('_offset');
     searchParams.set('_limit', limit);
+    if (after.value) {
+        searchParams.set('_after', after.value);
+    }
+    else {
+        searchParams.delete('_after');
+    }
 
     // fetch table from api
     myfetch(pathname, searchParams.toString()).catch(error => {
@@ -0,0 +1,29 @@
+import logging
+from pathlib import Path
+
+import os
+
+import context
+from ataskq import TaskQ, Task, targs
+
+
+# init logger
+logger = logging.getLogger("ataskq")
+handler = logging.StreamHandler()
+handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+handler.setLevel(os.environ.get("LOGLEVEL", "INFO"))
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+
+# create  job
+tr = TaskQ(logger=logger).create_job(name=Path(__file__).stem)
+
+# add tasks, each task runs as soon as its own dependencies succeed, levels still run in order so dag tasks must
+# share a level (all tasks here are level 0)
+extract_a = Task(entrypoint="ataskq.tasks_utils.dummy_args_task", targs=targs("extract a"))
+extract_b = Task(entrypoint="ataskq.tasks_utils.dummy_args_task", targs=targs("extract b", sleep=1))
+transform_a = Task(entrypoint="ataskq.tasks_utils.dummy_args_task", targs=targs("transform a"), depends_on=[extract_a])
+load = Task(entrypoint="ataskq.tasks_utils.dummy_args_task", targs=targs("load"), depends_on=[transform_a, extract_b])
+tr.add_tasks([extract_a, extract_b, transform_a, load])
+
+tr.run(concurrency=2)
@@ -2,9 +2,12 @@ from pathlib import Path
 
 import context
 from ataskq.tasks_utils.counter_task import counter_kwarg, counter_task
-from ataskq import TaskQ, Task, targs
+from ataskq import TaskQ, Task, StateKWArg, targs
 
-taskq = TaskQ(run_task_raise_exception=True).create_job(name=Path(__file__).stem)
+taskq = TaskQ(config={"run": {"raise_exception": True}}).create_job(name=Path(__file__).stem)
+
+# counter object is created once per worker process and injected to tasks with a 'counter' parameter
+taskq.add_state_kwargs([StateKWArg(name="counter", entrypoint=counter_kwarg, targs=targs(name="example counter"))])
 
 taskq.add_tasks(
     [
@@ -0,0 +1,13 @@
+CREATE TABLE schema_version (version INTEGER PRIMARY KEY);
+CREATE TABLE jobs (job_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, description TEXT, priority REAL DEFAULT 0);
+CREATE TABLE sqlite_sequence(name,seq);
+CREATE TABLE tasks (task_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, level REAL, entrypoint TEXT NOT NULL, targs MEDIUMBLOB, status TEXT ,take_time DATETIME, start_time DATETIME, done_time DATETIME, pulse_time DATETIME, description TEXT, job_id INTEGER NOT NULL, CONSTRAINT fk_job_id FOREIGN KEY (job_id) REFERENCES jobs(job_id) ON DELETE CASCADE);
+CREATE INDEX ix_tasks_status_job_level ON tasks (status, job_id, level, task_id);
+CREATE INDEX ix_tasks_job_level ON tasks (job_id, level);
+CREATE INDEX ix_tasks_running_pulse_time ON tasks (pulse_time) WHERE status = 'running';
+CREATE TABLE leases (name TEXT PRIMARY KEY, holder TEXT, acquire_time DATETIME, reaped INTEGER, duration REAL);
+CREATE TABLE task_counters (job_id INTEGER NOT NULL, level REAL NOT NULL, name TEXT NOT NULL, status TEXT NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (job_id, level, name, status), CONSTRAINT fk_job_id FOREIGN KEY (job_id) REFERENCES jobs(job_id) ON DELETE CASCADE);
+CREATE TRIGGER task_counters_insert AFTER INSERT ON tasks BEGIN INSERT INTO task_counters (job_id, level, name, status, count) SELECT NEW.job_id, COALESCE(NEW.level, 0), COALESCE(NEW.name, ''), NEW.status, 1 WHERE NEW.status IS NOT NULL AND EXISTS (SELECT 1 FROM jobs WHERE job_id = NEW.job_id) ON CONFLICT (job_id, level, name, status) DO UPDATE SET count = count + excluded.count; END;
+CREATE TRIGGER task_counters_delete AFTER DELETE ON tasks BEGIN INSERT INTO task_counters (job_id, level, name, status, count) SELECT OLD.job_id, COALESCE(OLD.level, 0), COALESCE(OLD.name, ''), OLD.status, -1 WHERE OLD.status IS NOT NULL AND EXISTS (SELECT 1 FROM jobs WHERE job_id = OLD.job_id) ON CONFLICT (job_id, level, name, status) DO UPDATE SET count = count + excluded.count; END;
+CREATE TRIGGER task_counters_update AFTER UPDATE OF job_id, level, name, status ON tasks WHEN OLD.job_id IS NOT NEW.job_id OR OLD.level IS NOT NEW.level OR OLD.name IS NOT NEW.name OR OLD.status IS NOT NEW.status BEGIN INSERT INTO task_counters (job_id, level, name, status, count) SELECT OLD.job_id, COALESCE(OLD.level, 0), COALESCE(OLD.name, ''), OLD.status, -1 WHERE OLD.status IS NOT NULL AND EXISTS (SELECT 1 FROM jobs WHERE job_id = OLD.job_id) ON CONFLICT (job_id, level, name, status) DO UPDATE SET count = count + excluded.count; INSERT INTO task_counters (job_id, level, name, status, count) SELECT NEW.job_id, COALESCE(NEW.level, 0), COALESCE(NEW.name, ''), NEW.status, 1 WHERE NEW.status IS NOT NULL AND EXISTS (SELECT 1 FROM jobs WHERE job_id = NEW.job_id) ON CONFLICT (job_id, level, name, status) DO UPDATE SET count = count + excluded.count; END;
+CREATE INDEX ix_task_counters_status_job_level ON task_counters (status, job_id, level);
@@ -0,0 +1,7 @@
+CREATE TABLE schema_version (version INTEGER PRIMARY KEY);
+CREATE TABLE jobs (job_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, description TEXT, priority REAL DEFAULT 0);
+CREATE TABLE sqlite_sequence(name,seq);
+CREATE TABLE tasks (task_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, level REAL, entrypoint TEXT NOT NULL, targs MEDIUMBLOB, status TEXT ,take_time DATETIME, start_time DATETIME, done_time DATETIME, pulse_time DATETIME, description TEXT, job_id INTEGER NOT NULL, CONSTRAINT fk_job_id FOREIGN KEY (job_id) REFERENCES jobs(job_id) ON DELETE CASCADE);
+CREATE INDEX ix_tasks_status_job_level ON tasks (status, job_id, level, task_id);
+CREATE INDEX ix_tasks_job_level ON tasks (job_id, level);
+CREATE INDEX ix_tasks_running_pulse_time ON tasks (pulse_time) WHERE status = 'running';